@@ -1,236 +1,759 @@
-# Cannoli Intelligence - IA/ML 
-# - Geração de dados simulados de campanhas
-# - IA Reativa: alertas de queda (média móvel e z-score)
-# - ML Supervisionado: previsão de conversões (Regressão Linear)
-# - Busca Gulosa: recomendação de alocação de orçamento
-
-import os
-import math
-import json
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-
-from datetime import datetime, timedelta
-
-# Importações de ML
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-
-np.random.seed(42)
-
-# Gerar dados simulados de campanhas 
-
-def simulate_campaigns(n_campaigns=6, days=90):
-    base_date = datetime.today().date() - timedelta(days=days-1)
-    rows = []
-    for cid in range(1, n_campaigns+1):
-        nome = f"Campanha_{cid}"
-        # perfis diferentes por campanha
-        base_impr = np.random.randint(8_000, 30_000)
-        base_ctr = np.random.uniform(0.03, 0.12)   # cliques/impressoes
-        base_cr  = np.random.uniform(0.03, 0.18)   # conversoes/cliques
-        cpc      = np.random.uniform(0.4, 1.8)     # custo por clique (R$)
-        ticket   = np.random.uniform(20, 65)       # ticket médio (R$)
-
-       
-        for d in range(days):
-            day = base_date + timedelta(days=d)
-            saz  = 1 + 0.2*np.sin(2*math.pi*(d/7.0))  # semanal
-            impr = int(np.random.normal(base_impr*saz, base_impr*0.08))
-            impr = max(impr, 1000)
-            clicks = int(impr * max(0.005, np.random.normal(base_ctr, 0.01)))
-            convs  = int(clicks * max(0.01, np.random.normal(base_cr, 0.02)))
-            cost   = round(clicks * max(0.1, np.random.normal(cpc, 0.15)), 2)
-            rev    = round(convs * max(5, np.random.normal(ticket, 5)), 2)
-
-            rows.append({
-                "date": day,
-                "campanhaId": cid,
-                "nome": nome,
-                "impressoes": impr,
-                "cliques": clicks,
-                "conversoes": convs,
-                "custo": cost,
-                "receita": rev
-            })
-
-        # insere queda  em 2 dias
-        for drop_day in np.random.choice(range(days//3, days-2), size=2, replace=False):
-            idx = (cid-1)*days + drop_day
-            rows[idx]["cliques"] = max(1, rows[idx]["cliques"] // 3)
-            rows[idx]["conversoes"] = max(0, rows[idx]["conversoes"] // 3)
-            rows[idx]["receita"] = round(rows[idx]["receita"] * 0.35, 2)
-
-    df = pd.DataFrame(rows)
-    return df
-
-df = simulate_campaigns(n_campaigns=6, days=90)
-
-# Salvar CSV 
-csv_path = "campanhas_simulado.csv"
-df.to_csv(csv_path, index=False)
-
-# IA Reativa – alertas de queda 
-
-def rolling_alerts(frame, janela=7, queda_perc=0.3, metodo="media"):
-    """
-    Gera alertas quando o valor do dia fica abaixo de (1 - queda_perc)*media_movel.
-    metodo: 'media' ou 'zscore'
-    """
-    alerts = []
-    for cid, grp in frame.sort_values("date").groupby("campanhaId"):
-        g = grp.copy()
-        g["media_7_cliques"] = g["cliques"].rolling(janela).mean()
-        g["media_7_conv"] = g["conversoes"].rolling(janela).mean()
-        g["z_cliques"] = (g["cliques"] - g["cliques"].rolling(janela).mean()) / (g["cliques"].rolling(janela).std()+1e-9)
-
-        for i, row in g.iterrows():
-            if pd.isna(row["media_7_cliques"]):
-                continue
-            motivo = None
-            if metodo == "media":
-                if row["cliques"] < (1-queda_perc) * row["media_7_cliques"]:
-                    motivo = f"Cliques {row['cliques']} abaixo de {(1-queda_perc)*row['media_7_cliques']:.0f} (média 7d)"
-            else:  
-                if row["z_cliques"] < -2.0:
-                    motivo = f"Z-score cliques = {row['z_cliques']:.2f} (< -2σ)"
-
-            if motivo:
-                alerts.append({
-                    "date": row["date"],
-                    "campanhaId": int(row["campanhaId"]),
-                    "nome": row["nome"],
-                    "motivo": motivo
-                })
-    return pd.DataFrame(alerts).sort_values(["date","campanhaId"])
-
-alerts_df = rolling_alerts(df, janela=7, queda_perc=0.3, metodo="media")
-alerts_path = "alertas_queda.csv"
-alerts_df.to_csv(alerts_path, index=False)
-
-
-ex_cid = df["campanhaId"].iloc[0]
-serie = df[df.campanhaId==ex_cid].sort_values("date")
-serie["mm7"] = serie["cliques"].rolling(7).mean()
-
-plt.figure(figsize=(9,4))
-plt.plot(serie["date"], serie["cliques"], label="Cliques")
-plt.plot(serie["date"], serie["mm7"], label="Média móvel 7d")
-drops = alerts_df[alerts_df.campanhaId==ex_cid]["date"]
-plt.scatter(drops, serie[serie["date"].isin(drops)]["cliques"])
-plt.title(f"Campanha {ex_cid} – cliques e média móvel")
-plt.xlabel("Data"); plt.ylabel("Cliques"); plt.legend()
-plot_alerts_path = "alertas.png"
-plt.tight_layout(); plt.savefig(plot_alerts_path); plt.close()
-
-# ML – previsão de conversões 
-
-# Features de ontem para prever conversões de hoje (por campanha)
-df_sorted = df.sort_values(["campanhaId","date"]).copy()
-df_sorted["cliques_lag1"] = df_sorted.groupby("campanhaId")["cliques"].shift(1)
-df_sorted["impressoes_lag1"] = df_sorted.groupby("campanhaId")["impressoes"].shift(1)
-df_sorted["custo_lag1"] = df_sorted.groupby("campanhaId")["custo"].shift(1)
-df_sorted["receita_lag1"] = df_sorted.groupby("campanhaId")["receita"].shift(1)
-
-model_df = df_sorted.dropna().copy()
-X = model_df[["cliques_lag1","impressoes_lag1","custo_lag1","receita_lag1"]].values
-y = model_df["conversoes"].values
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, shuffle=True, random_state=42)
-reg = LinearRegression()
-reg.fit(X_train, y_train)
-y_pred = reg.predict(X_test)
-
-mae = mean_absolute_error(y_test, y_pred)
-rmse = math.sqrt(mean_squared_error(y_test, y_pred))
-r2 = r2_score(y_test, y_pred)
-
-metrics = {"MAE": mae, "RMSE": rmse, "R2": r2}
-
-# real vs previsto (amostra)
-plt.figure(figsize=(6,6))
-plt.scatter(y_test, y_pred, s=12)
-plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()])
-plt.title("Previsão de conversões – Real vs Previsto")
-plt.xlabel("Real"); plt.ylabel("Previsto")
-plot_reg_path = "regressao.png"
-plt.tight_layout(); plt.savefig(plot_reg_path); plt.close()
-
-# Busca Gulosa – recomendação de orçamento 
-
-def greedy_recommend(df_ref, data_referencia=None, k=3, orcamento=1000.0, modo="eficiencia"):
-    """
-    Seleciona top-K campanhas por eficiência e aloca orçamento gulosamente.
-    modo: 'eficiencia' (conversoes/custo) ou 'roi' (receita/custo)
-    """
-    if data_referencia is None:
-        data_referencia = df_ref["date"].max()
-    snap = df_ref[df_ref["date"]==data_referencia].copy()
-
-    eps = 1e-6
-    if modo=="roi":
-        snap["score"] = snap["receita"] / (snap["custo"] + eps)
-    else:
-        snap["score"] = snap["conversoes"] / (snap["custo"] + eps)
-
-    ranked = snap.sort_values("score", ascending=False).reset_index(drop=True)
-
-    # Top-K recomendadas
-    priorizar = ranked.head(k).copy()
-
-    # Alocação gulosa de orçamento (até custo diário atual)
-    restante = orcamento
-    aloc = []
-    for _, row in priorizar.iterrows():
-        if restante <= 0: break
-        sugerido = min(restante, max(100.0, row["custo"]*0.5))  # política simples
-        aloc.append({
-            "campanhaId": int(row["campanhaId"]),
-            "nome": row["nome"],
-            "score": float(row["score"]),
-            "orcamentoSugerido": round(float(sugerido), 2)
-        })
-        restante -= sugerido
-
-    # Ajustar/pausar: bottom-K
-    ajustar = ranked.tail(min(k, len(ranked))).copy()
-    ajustar = [{"campanhaId": int(r.campanhaId), "nome": r.nome, "motivo": "baixo score / alto custo"} for _, r in ajustar.iterrows()]
-
-    return {
-        "data_referencia": str(data_referencia),
-        "heuristica": modo,
-        "orcamento_total": orcamento,
-        "priorizar": aloc,
-        "ajustar_ou_pausar": ajustar
-    }
-
-recs = greedy_recommend(df, k=3, orcamento=1200.0, modo="eficiencia")
-json_path = "sugestoes_gulosas.json"
-with open(json_path, "w", encoding="utf-8") as f:
-    json.dump(recs, f, ensure_ascii=False, indent=2)
-
-# Salvar um relatório-resumo em texto 
-
-summary = f"""
-Cannoli Intelligence – IA/ML (dados simulados)
-
-1) Alertas (queda média móvel 7d, 30%):
-- Total de alertas gerados: {len(alerts_df)}
-- Exemplo primeira linha:
-{alerts_df.head(1).to_string(index=False) if not alerts_df.empty else 'Sem alertas'}
-
-2) Regressão Linear – previsão de conversões (features de defasagem 1 dia):
-- MAE  : {metrics['MAE']:.3f}
-- RMSE : {metrics['RMSE']:.3f}
-- R²    : {metrics['R2']:.3f}
-
-3) Busca Gulosa – recomendações (heurística: eficiência = conversões/custo, orçamento R$ 1200):
-{json.dumps(recs, ensure_ascii=False, indent=2)}
-"""
-txt_path = "resultados_ia.txt"
-with open(txt_path, "w", encoding="utf-8") as f:
-    f.write(summary)
-
-csv_path, alerts_path, plot_alerts_path, plot_reg_path, json_path, txt_path
+# Cannoli Intelligence - IA/ML 
+# - Geração de dados simulados de campanhas
+# - IA Reativa: alertas de queda (média móvel e z-score)
+# - ML Supervisionado: previsão de conversões (Regressão Linear)
+# - Busca Gulosa: recomendação de alocação de orçamento
+
+import os
+import math
+import json
+import hashlib
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from datetime import datetime, timedelta
+
+SEED = 42
+
+# Gerar dados simulados de campanhas 
+#
+# Vetorizado: sorteia matrizes campanha x dia de uma vez (mesma sazonalidade
+# semanal e mesmas quedas injetadas de antes). gerar_campanhas produz lotes
+# de campanhas para volumes que não cabem em memória; mesma seed + mesmo
+# tamanho de lote (+ data_inicio fixa) geram exatamente os mesmos dados.
+
+SIM_LOTE = 1_000        # campanhas por lote
+DIAS_QUEDA = 2          # dias com queda injetada por campanha
+
+def _simular_bloco(rng, ids, datas):
+    """Todas as datas de um bloco de campanhas -> DataFrame (campanha, dia)."""
+    n, days = len(ids), len(datas)
+    forma = (n, days)
+
+    # perfis diferentes por campanha (colunas para broadcast com os dias)
+    base_impr = rng.integers(8_000, 30_000, n)[:, None]
+    base_ctr = rng.uniform(0.03, 0.12, n)[:, None]   # cliques/impressoes
+    base_cr  = rng.uniform(0.03, 0.18, n)[:, None]   # conversoes/cliques
+    cpc      = rng.uniform(0.4, 1.8, n)[:, None]     # custo por clique (R$)
+    ticket   = rng.uniform(20, 65, n)[:, None]       # ticket médio (R$)
+
+    saz = 1 + 0.2*np.sin(2*np.pi*(np.arange(days)/7.0))  # semanal
+    impr = np.maximum(rng.normal(base_impr*saz, base_impr*0.08, forma).astype(np.int64), 1000)
+    clicks = (impr * np.maximum(0.005, rng.normal(base_ctr, 0.01, forma))).astype(np.int64)
+    convs  = (clicks * np.maximum(0.01, rng.normal(base_cr, 0.02, forma))).astype(np.int64)
+    cost   = np.round(clicks * np.maximum(0.1, rng.normal(cpc, 0.15, forma)), 2)
+    rev    = np.round(convs * np.maximum(5, rng.normal(ticket, 5, forma)), 2)
+
+    # insere queda em DIAS_QUEDA dias distintos de [days//3, days-2)
+    inicio_quedas = days//3
+    n_quedas = min(DIAS_QUEDA, days - 2 - inicio_quedas)
+    if n_quedas > 0:
+        sorteio = rng.random((n, days - 2 - inicio_quedas))
+        quedas = inicio_quedas + np.argpartition(sorteio, n_quedas-1, axis=1)[:, :n_quedas]
+        linhas = np.arange(n)[:, None]
+        clicks[linhas, quedas] = np.maximum(1, clicks[linhas, quedas] // 3)
+        convs[linhas, quedas] = np.maximum(0, convs[linhas, quedas] // 3)
+        rev[linhas, quedas] = np.round(rev[linhas, quedas] * 0.35, 2)
+
+    return pd.DataFrame({
+        "date": np.tile(datas, n),
+        "campanhaId": np.repeat(ids, days),
+        "nome": np.repeat(np.char.add("Campanha_", ids.astype(str)), days),
+        "impressoes": impr.ravel(),
+        "cliques": clicks.ravel(),
+        "conversoes": convs.ravel(),
+        "custo": cost.ravel(),
+        "receita": rev.ravel(),
+    })
+
+def gerar_campanhas(n_campaigns=6, days=90, seed=SEED, campanhas_por_lote=SIM_LOTE, data_inicio=None):
+    """
+    Gera os dados em lotes de `campanhas_por_lote` campanhas (todas as datas de cada uma).
+    data_inicio: primeira data (padrão: hoje - days + 1).
+    """
+    rng = np.random.default_rng(seed)
+    if data_inicio is None:
+        data_inicio = datetime.today().date() - timedelta(days=days-1)
+    datas = np.datetime64(data_inicio, "D") + np.arange(days)
+
+    for inicio in range(1, n_campaigns+1, campanhas_por_lote):
+        ids = np.arange(inicio, min(inicio + campanhas_por_lote, n_campaigns+1))
+        yield _simular_bloco(rng, ids, datas)
+
+def simulate_campaigns(n_campaigns=6, days=90, seed=SEED, data_inicio=None):
+    """Simulação inteira em memória (volumes pequenos)."""
+    lotes = gerar_campanhas(n_campaigns, days, seed=seed, data_inicio=data_inicio)
+    return pd.concat(lotes, ignore_index=True)
+
+def salvar_simulacao(caminho, n_campaigns, days, seed=SEED, campanhas_por_lote=SIM_LOTE, data_inicio=None):
+    """
+    Grava a simulação lote a lote em Parquet ou CSV (pela extensão), sem
+    montar tudo em memória. Retorna o total de linhas.
+    """
+    formato = os.path.splitext(caminho)[1].lower()
+    if formato not in (".parquet", ".csv"):
+        raise ValueError("Use um caminho .parquet ou .csv")
+
+    total = 0
+    writer = None
+    try:
+        for lote in gerar_campanhas(n_campaigns, days, seed, campanhas_por_lote, data_inicio):
+            if formato == ".csv":
+                lote.to_csv(caminho, mode="w" if total == 0 else "a", header=(total == 0), index=False)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                tabela = pa.Table.from_pandas(lote, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(caminho, tabela.schema)
+                writer.write_table(tabela)
+            total += len(lote)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+df = simulate_campaigns(n_campaigns=6, days=90)
+
+# Salvar CSV 
+csv_path = "campanhas_simulado.csv"
+df.to_csv(csv_path, index=False)
+
+# IA Reativa – alertas de queda 
+
+ALERTA_COLS = ["date", "campanhaId", "nome", "motivo"]
+Z_LIMITE = -2.0
+
+def _montar_alertas(linhas, cliques, media, z, alerta, janela, queda_perc, metodo):
+    """Monta o DataFrame de alertas (texto só para as linhas que alertaram)."""
+    sel = np.flatnonzero(alerta)
+    if metodo == "media":
+        limites = (1-queda_perc) * media[sel]
+        motivos = [f"Cliques {c:.0f} abaixo de {l:.0f} (média {janela}d)" for c, l in zip(cliques[sel], limites)]
+    else:
+        motivos = [f"Z-score cliques = {v:.2f} (< -2σ)" for v in z[sel]]
+
+    alertas = pd.DataFrame({
+        "date": linhas["date"].to_numpy()[sel],
+        "campanhaId": linhas["campanhaId"].to_numpy()[sel].astype(int),
+        "nome": linhas["nome"].to_numpy()[sel],
+        "motivo": motivos,
+    }, columns=ALERTA_COLS)
+    return alertas.sort_values(["date","campanhaId"], kind="stable").reset_index(drop=True)
+
+def _regra_alerta(cliques, media, desvio, valido, queda_perc, metodo):
+    """Aplica a regra de queda: (alerta, z)."""
+    z = (cliques - media) / (desvio + 1e-9)
+    if metodo == "media":
+        alerta = valido & (cliques < (1-queda_perc) * media)
+    else:
+        alerta = valido & (z < Z_LIMITE)
+    return alerta, z
+
+def rolling_alerts(frame, janela=7, queda_perc=0.3, metodo="media"):
+    """
+    Gera alertas quando o valor do dia fica abaixo de (1 - queda_perc)*media_movel.
+    metodo: 'media' ou 'zscore'
+
+    Modo em lote: todas as campanhas de uma vez. Ordena uma vez por
+    (campanhaId, date) e calcula a janela móvel sobre a série inteira;
+    janelas que misturam duas campanhas são descartadas pela posição do
+    dia dentro da campanha (precisa de pelo menos `janela` dias).
+    """
+    g = frame.sort_values(["campanhaId","date"], kind="stable")
+    cliques = g["cliques"].to_numpy(dtype=float)
+
+    movel = pd.Series(cliques).rolling(janela)
+    media = movel.mean().to_numpy()
+    desvio = movel.std().to_numpy()
+    valido = g.groupby("campanhaId").cumcount().to_numpy() >= janela - 1
+
+    alerta, z = _regra_alerta(cliques, media, desvio, valido, queda_perc, metodo)
+    return _montar_alertas(g, cliques, media, z, alerta, janela, queda_perc, metodo)
+
+class MonitorAlertas:
+    """
+    Modo streaming: mesmas regras de rolling_alerts, dia a dia.
+
+    Estado fixo por campanhaId: buffer circular com os últimos `janela`
+    cliques + soma e soma dos quadrados da janela. Cada novo dia custa O(1)
+    por campanha (sem reler o histórico) e é processado vetorizado para
+    todas as campanhas do dia.
+    """
+
+    def __init__(self, janela=7, queda_perc=0.3, metodo="media"):
+        self.janela = janela
+        self.queda_perc = queda_perc
+        self.metodo = metodo
+        self.slots = {}                         # campanhaId -> linha do estado
+        self.buffer = np.zeros((0, janela))
+        self.n = np.zeros(0, dtype=np.int64)    # dias vistos
+        self.soma = np.zeros(0)
+        self.soma2 = np.zeros(0)
+
+    def _slots(self, ids):
+        novos = [c for c in pd.unique(ids) if c not in self.slots]
+        if novos:
+            for c in novos:
+                self.slots[c] = len(self.slots)
+            k = len(novos)
+            self.buffer = np.vstack([self.buffer, np.zeros((k, self.janela))])
+            self.n = np.concatenate([self.n, np.zeros(k, dtype=np.int64)])
+            self.soma = np.concatenate([self.soma, np.zeros(k)])
+            self.soma2 = np.concatenate([self.soma2, np.zeros(k)])
+        return np.fromiter((self.slots[c] for c in ids), dtype=np.int64, count=len(ids))
+
+    def _processar_dia(self, dia):
+        """Um dia (no máximo uma linha por campanha) -> alertas do dia."""
+        s = self._slots(dia["campanhaId"].to_numpy())
+        x = dia["cliques"].to_numpy(dtype=float)
+
+        # Sai da janela o valor de `janela` dias atrás (se a janela já encheu)
+        pos = self.n[s] % self.janela
+        saindo = np.where(self.n[s] >= self.janela, self.buffer[s, pos], 0.0)
+        self.buffer[s, pos] = x
+        self.soma[s] += x - saindo
+        self.soma2[s] += x*x - saindo*saindo
+        self.n[s] += 1
+
+        media = self.soma[s] / self.janela
+        var = (self.soma2[s] - self.janela * media**2) / max(self.janela - 1, 1)
+        desvio = np.sqrt(np.maximum(var, 0.0))
+        valido = self.n[s] >= self.janela
+
+        alerta, z = _regra_alerta(x, media, desvio, valido, self.queda_perc, self.metodo)
+        return _montar_alertas(dia, x, media, z, alerta, self.janela, self.queda_perc, self.metodo)
+
+    def processar(self, novos):
+        """Consome linhas novas (um ou mais dias, em ordem) e devolve os alertas delas."""
+        alertas = [self._processar_dia(dia) for _, dia in novos.groupby("date", sort=True)]
+        if not alertas:
+            return pd.DataFrame(columns=ALERTA_COLS)
+        return pd.concat(alertas, ignore_index=True)
+
+alerts_df = rolling_alerts(df, janela=7, queda_perc=0.3, metodo="media")
+alerts_path = "alertas_queda.csv"
+alerts_df.to_csv(alerts_path, index=False)
+
+# Gráficos – um por campanha
+
+# Renderização em lote, sem pyplot (sem estado global): cada gráfico é uma
+# Figure com canvas Agg (headless). A série ordenada, a média móvel e as
+# posições dos alertas são calculadas uma vez para todas as campanhas; cada
+# processo do pool só recebe os arrays da sua campanha e desenha. Um
+# manifesto guarda o hash do conteúdo de cada gráfico: campanha com série
+# e alertas iguais aos da última execução reaproveita o PNG existente;
+# PNGs de campanhas que saíram da simulação são apagados.
+
+GRAFICOS_DIR = "graficos"
+GRAFICOS_MANIFESTO = "manifesto.json"
+GRAFICO_VERSAO = "1"   # mudar quando o desenho mudar (invalida o cache)
+GRAFICO_DPI = 100
+# Margens fixas: todos os gráficos de campanha têm o mesmo layout, então não
+# vale pagar tight_layout (≈1/3 do tempo de cada gráfico) em cada um
+GRAFICO_MARGENS = dict(left=0.08, right=0.98, top=0.92, bottom=0.13)
+
+def _salvar_figura(fig, caminho, margens=None):
+    FigureCanvasAgg(fig)
+    if margens:
+        fig.subplots_adjust(**margens)
+    else:
+        fig.tight_layout()
+    fig.savefig(caminho, dpi=GRAFICO_DPI)
+
+def _figura_alertas(cid, datas, cliques, media, idx_alertas, janela=7):
+    fig = Figure(figsize=(9,4))
+    ax = fig.add_subplot()
+    ax.plot(datas, cliques, label="Cliques")
+    ax.plot(datas, media, label=f"Média móvel {janela}d")
+    ax.scatter(datas[idx_alertas], cliques[idx_alertas])
+    ax.set_title(f"Campanha {cid} – cliques e média móvel")
+    ax.set_xlabel("Data"); ax.set_ylabel("Cliques"); ax.legend()
+    return fig
+
+def _renderizar_campanha(tarefa):
+    """Executa no processo filho: desenha e grava um gráfico."""
+    caminho, args = tarefa
+    _salvar_figura(_figura_alertas(*args), caminho, GRAFICO_MARGENS)
+    return caminho
+
+def _hash_grafico(cid, datas, cliques, idx_alertas, janela):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{GRAFICO_VERSAO}|{cid}|{janela}|".encode())
+    for arr in (datas.astype("datetime64[ns]").view(np.int64), cliques.astype(float), idx_alertas.astype(np.int64)):
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+def series_para_graficos(frame, alertas, janela=7):
+    """
+    Uma passada vetorizada: ordena por (campanhaId, date), calcula a média
+    móvel e localiza cada alerta na série (índice dentro da campanha).
+    Gera (cid, datas, cliques, media, idx_alertas) por campanha.
+    """
+    g = frame.sort_values(["campanhaId","date"], kind="stable")
+    ids = g["campanhaId"].to_numpy()
+    datas = g["date"].to_numpy()
+    cliques = g["cliques"].to_numpy(dtype=float)
+
+    media = pd.Series(cliques).rolling(janela).mean().to_numpy()
+    media = np.where(g.groupby("campanhaId").cumcount().to_numpy() >= janela - 1, media, np.nan)
+
+    chave = pd.MultiIndex.from_arrays([ids, datas])
+    pos = np.sort(chave.get_indexer(pd.MultiIndex.from_arrays([alertas["campanhaId"].to_numpy(), alertas["date"].to_numpy()])))
+    pos = pos[pos >= 0]
+
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    fins = np.r_[inicios[1:], len(ids)]
+    cortes = np.searchsorted(pos, np.r_[inicios, len(ids)])
+    for i, (a, b) in enumerate(zip(inicios, fins)):
+        yield ids[a], datas[a:b], cliques[a:b], media[a:b], pos[cortes[i]:cortes[i+1]] - a
+
+def _pool_graficos(workers):
+    """Pool de processos via fork (o script roda no nível do módulo: spawn o reexecutaria)."""
+    if "fork" not in mp.get_all_start_methods() or workers == 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("fork"))
+
+def renderizar_graficos(frame, alertas, pasta=GRAFICOS_DIR, janela=7, workers=None):
+    """
+    Um PNG por campanhaId em `pasta` (campanha_<id>.png), em paralelo.
+    Sem fork disponível (Windows) ou com workers=1, desenha em série.
+    campanha_<id>.png de campanhas fora do manifesto atual são removidos.
+    Retorna contagens de gráficos desenhados, reaproveitados e removidos.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    manifesto_path = os.path.join(pasta, GRAFICOS_MANIFESTO)
+    anterior = {}
+    if os.path.exists(manifesto_path):
+        with open(manifesto_path, encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    manifesto, tarefas = {}, []
+    for cid, datas, cliques, media, idx in series_para_graficos(frame, alertas, janela):
+        caminho = os.path.join(pasta, f"campanha_{cid}.png")
+        h = _hash_grafico(cid, datas, cliques, idx, janela)
+        manifesto[str(cid)] = h
+        if anterior.get(str(cid)) != h or not os.path.exists(caminho):
+            tarefas.append((caminho, (cid, datas, cliques, media, idx, janela)))
+
+    workers = workers or os.cpu_count() or 1
+    pool = _pool_graficos(workers) if len(tarefas) > 1 else None
+    if pool is None:
+        for tarefa in tarefas:
+            _renderizar_campanha(tarefa)
+    else:
+        with pool:
+            lote = max(1, len(tarefas) // (workers * 4))
+            for _ in pool.map(_renderizar_campanha, tarefas, chunksize=lote):
+                pass
+
+    tmp = manifesto_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f)
+    os.replace(tmp, manifesto_path)
+
+    atuais = {f"campanha_{cid}.png" for cid in manifesto}
+    removidos = 0
+    for nome in os.listdir(pasta):
+        if nome.startswith("campanha_") and nome.endswith(".png") and nome not in atuais:
+            os.remove(os.path.join(pasta, nome))
+            removidos += 1
+    return {"pasta": pasta, "campanhas": len(manifesto), "desenhados": len(tarefas),
+            "reaproveitados": len(manifesto) - len(tarefas), "removidos": removidos}
+
+graficos = renderizar_graficos(df, alerts_df)
+
+# Gráfico de exemplo (primeira campanha), como antes
+ex_cid = df["campanhaId"].iloc[0]
+plot_alerts_path = "alertas.png"
+for cid, *serie in series_para_graficos(df[df.campanhaId==ex_cid], alerts_df[alerts_df.campanhaId==ex_cid]):
+    _salvar_figura(_figura_alertas(cid, *serie), plot_alerts_path)
+
+# ML – previsão de conversões 
+
+# Features de ontem para prever conversões de hoje (por campanha)
+#
+# Treino incremental (fora da memória): o histórico chega em lotes, os lags
+# saem de um único passe por lote (a última linha de cada campanha passa
+# para o lote seguinte) e a regressão linear acumula só as estatísticas
+# suficientes XᵀX / Xᵀy. Atualizar com um dia novo custa O(linhas do dia);
+# resolver o modelo é um sistema 5x5. A divisão treino/teste é por hash de
+# (campanhaId, date), então não depende de como os lotes foram cortados.
+
+LAG_COLS = ["cliques", "impressoes", "custo", "receita"]
+LAG_FEATURES = [f"{c}_lag1" for c in LAG_COLS]
+FRAC_TESTE = 0.25
+LOTE_DIAS = 30          # dias por lote ao percorrer um DataFrame em memória
+AMOSTRA_GRAFICO = 5_000
+
+def adicionar_lags(frame, ultimo=None):
+    """
+    Lags de 1 dia de LAG_COLS num único passe: ordena por (campanhaId, date)
+    e desloca todas as colunas uma linha; na primeira linha de cada campanha
+    o lag vem de `ultimo` (última linha da campanha em lotes anteriores) ou
+    fica NaN. Retorna (frame com lags, `ultimo` atualizado).
+    """
+    g = frame.sort_values(["campanhaId","date"], kind="stable").reset_index(drop=True)
+    ids = g["campanhaId"].to_numpy()
+    valores = g[LAG_COLS].to_numpy(dtype=float)
+    if len(g) == 0:
+        return g.assign(**{c: np.nan for c in LAG_FEATURES}), ultimo
+
+    inicio = np.ones(len(g), dtype=bool)
+    inicio[1:] = ids[1:] != ids[:-1]
+    lags = np.empty_like(valores)
+    lags[1:] = valores[:-1]
+    lags[inicio] = np.nan
+    if ultimo is not None:
+        pos = ultimo.index.get_indexer(ids[inicio])
+        achou = pos >= 0
+        lags[np.flatnonzero(inicio)[achou]] = ultimo.to_numpy()[pos[achou]]
+    g[LAG_FEATURES] = lags
+
+    fim = np.append(ids[1:] != ids[:-1], True)
+    novos = pd.DataFrame(valores[fim], index=ids[fim], columns=LAG_COLS)
+    if ultimo is not None:
+        novos = pd.concat([ultimo[~ultimo.index.isin(novos.index)], novos])
+    return g, novos
+
+def lotes_por_periodo(frame, dias=LOTE_DIAS):
+    """Percorre um DataFrame em lotes cronológicos de `dias` dias."""
+    datas = np.sort(frame["date"].unique())
+    for i in range(0, len(datas), dias):
+        yield frame[frame["date"].isin(datas[i:i+dias])]
+
+def lotes_de_arquivo(caminho, linhas=500_000):
+    """Lê um histórico em Parquet/CSV (ex.: salvar_simulacao) em lotes de `linhas`."""
+    if caminho.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(caminho).iter_batches(batch_size=linhas):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(caminho, chunksize=linhas, parse_dates=["date"])
+
+def _em_teste(g):
+    """Divisão determinística treino/teste por hash de (campanhaId, date)."""
+    # Tipos fixos antes do hash: a unidade do datetime64 ([s], [ms], [us])
+    # depende da origem (memória, Parquet, CSV) e mudaria a divisão
+    chave = pd.DataFrame({
+        "campanhaId": g["campanhaId"].to_numpy(dtype=np.int64),
+        "dia": pd.to_datetime(g["date"]).to_numpy().astype("datetime64[D]").astype(np.int64),
+    })
+    h = pd.util.hash_pandas_object(chave, index=False).to_numpy()
+    return (h % 10_000) < FRAC_TESTE * 10_000
+
+class RegressorLagIncremental:
+    """
+    Regressão linear (com intercepto) de conversões sobre LAG_FEATURES,
+    treinada lote a lote por XᵀX / Xᵀy.
+    """
+
+    def __init__(self):
+        self.ultimo = None        # última linha de cada campanha (lags do próximo lote)
+        self.centro = None        # deslocamento das features (melhora o condicionamento)
+        self.xtx = np.zeros((len(LAG_FEATURES)+1, len(LAG_FEATURES)+1))
+        self.xty = np.zeros(len(LAG_FEATURES)+1)
+        self.n_treino = 0
+        self._beta = None
+
+    def _matriz(self, g):
+        X = g[LAG_FEATURES].to_numpy(dtype=float) - self.centro
+        return np.hstack([np.ones((len(X), 1)), X])
+
+    def atualizar(self, lote):
+        """Incorpora um lote novo (um dia ou vários), em ordem cronológica."""
+        g, self.ultimo = adicionar_lags(lote, self.ultimo)
+        g = g.dropna(subset=LAG_FEATURES + ["conversoes"])
+        treino = g[~_em_teste(g)]
+        if len(treino) == 0:
+            return self
+        if self.centro is None:
+            self.centro = treino[LAG_FEATURES].to_numpy(dtype=float).mean(axis=0)
+
+        Xa = self._matriz(treino)
+        self.xtx += Xa.T @ Xa
+        self.xty += Xa.T @ treino["conversoes"].to_numpy(dtype=float)
+        self.n_treino += len(treino)
+        self._beta = None
+        return self
+
+    def treinar(self, lotes):
+        for lote in lotes:
+            self.atualizar(lote)
+        return self
+
+    @property
+    def beta(self):
+        if self._beta is None:
+            self._beta = np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+        return self._beta
+
+    @property
+    def coef_(self):
+        return self.beta[1:]
+
+    @property
+    def intercept_(self):
+        return self.beta[0] - self.centro @ self.beta[1:]
+
+    def predict(self, X):
+        return np.asarray(X, dtype=float) @ self.coef_ + self.intercept_
+
+    def avaliar(self, lotes, amostra=AMOSTRA_GRAFICO):
+        """
+        MAE/RMSE/R² no conjunto de teste, num passe sobre os lotes (mesmo
+        relatório do modelo em memória). Devolve também até `amostra` pares
+        (real, previsto) para o gráfico.
+        """
+        ultimo = None
+        n = soma_abs = soma_sq = soma_y = soma_y2 = 0.0
+        reais, previstos = [], []
+        for lote in lotes:
+            g, ultimo = adicionar_lags(lote, ultimo)
+            g = g.dropna(subset=LAG_FEATURES + ["conversoes"])
+            g = g[_em_teste(g)]
+            y = g["conversoes"].to_numpy(dtype=float)
+            pred = self.predict(g[LAG_FEATURES].to_numpy(dtype=float))
+            erro = y - pred
+            n += len(y)
+            soma_abs += np.abs(erro).sum()
+            soma_sq += (erro**2).sum()
+            soma_y += y.sum()
+            soma_y2 += (y**2).sum()
+            falta = amostra - sum(len(r) for r in reais)
+            if falta > 0:
+                reais.append(y[:falta]); previstos.append(pred[:falta])
+
+        sst = soma_y2 - soma_y**2 / n
+        metricas = {"MAE": float(soma_abs / n), "RMSE": math.sqrt(soma_sq / n), "R2": float(1 - soma_sq / sst)}
+        return metricas, np.concatenate(reais), np.concatenate(previstos)
+
+reg = RegressorLagIncremental().treinar(lotes_por_periodo(df))
+metrics, y_test, y_pred = reg.avaliar(lotes_por_periodo(df))
+
+# real vs previsto (amostra)
+fig = Figure(figsize=(6,6))
+ax = fig.add_subplot()
+ax.scatter(y_test, y_pred, s=12)
+ax.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()])
+ax.set_title("Previsão de conversões – Real vs Previsto")
+ax.set_xlabel("Real"); ax.set_ylabel("Previsto")
+plot_reg_path = "regressao.png"
+_salvar_figura(fig, plot_reg_path)
+
+# Busca Gulosa – recomendação de orçamento 
+#
+# Motor de alocação em lote: muitas datas de referência x orçamentos x modos
+# de uma vez. Cada snapshot vira uma linha de uma matriz data x campanha; o
+# top-K sai de argpartition (seleção parcial, sem ordenar o snapshot todo) e
+# a alocação gulosa vira soma acumulada, vetorizada em todas as datas.
+# metodo="mochila" resolve a versão 0/1 ótima (programação dinâmica) entre
+# os `n_candidatos` melhores scores de cada data.
+
+EPS = 1e-6
+ALOC_MINIMO = 100.0     # política simples: max(100, 50% do custo diário)
+ALOC_FRACAO = 0.5
+MOCHILA_PASSO = 10.0    # granularidade (R$) do orçamento na mochila...
+MOCHILA_MAX_PASSOS = 400  # ...aumentada para orçamentos grandes (limita a tabela da DP)
+MOCHILA_BLOCO = 64      # datas resolvidas por vez (limita a memória do backtracking)
+
+def _matrizes_snapshot(df_ref, datas=None):
+    """Snapshots por data como matrizes data x campanha (NaN = sem linha)."""
+    sub = df_ref if datas is None else df_ref[df_ref["date"].isin(pd.to_datetime(list(datas)))]
+    datas_idx = pd.Index(np.sort(sub["date"].unique()))
+    camp_idx = pd.Index(sub["campanhaId"].unique())
+    nomes = sub.drop_duplicates("campanhaId").set_index("campanhaId")["nome"].reindex(camp_idx).to_numpy()
+
+    i = datas_idx.get_indexer(sub["date"])
+    j = camp_idx.get_indexer(sub["campanhaId"])
+    matrizes = {}
+    for col in ("custo", "receita", "conversoes"):
+        m = np.full((len(datas_idx), len(camp_idx)), np.nan)
+        m[i, j] = sub[col].to_numpy(dtype=float)
+        matrizes[col] = m
+    return datas_idx, camp_idx.to_numpy(), nomes, matrizes
+
+def _score(matrizes, modo):
+    """'roi' (receita/custo) ou 'eficiencia' (conversoes/custo); NaN onde não há linha."""
+    numerador = matrizes["receita"] if modo == "roi" else matrizes["conversoes"]
+    return numerador / (matrizes["custo"] + EPS)
+
+def _top_k(score, k, maiores=True):
+    """Índices (por data) dos k maiores/menores scores, do maior para o menor."""
+    k = min(k, score.shape[1])
+    chave = np.where(np.isnan(score), -np.inf if maiores else np.inf, score)
+    chave = -chave if maiores else chave
+    idx = np.argpartition(chave, k-1, axis=1)[:, :k]
+    ordem = np.argsort(-np.take_along_axis(score, idx, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(idx, ordem, axis=1)
+    return idx, ~np.isnan(np.take_along_axis(score, idx, axis=1))
+
+def _alocar_guloso(desejado, valido, orcamento):
+    """Cada campanha (em ordem de score) leva min(restante, desejado) enquanto houver saldo."""
+    desejado = np.where(valido, desejado, 0.0)
+    # saldo antes de cada campanha (subtrações na mesma ordem do laço original)
+    saldo = np.hstack([np.full((len(desejado), 1), float(orcamento)), desejado])
+    restante = np.subtract.accumulate(saldo, axis=1)[:, :-1]
+    aloc = np.clip(restante, 0.0, desejado)
+    return aloc, valido & (restante > 0)
+
+def _alocar_mochila(desejado, valor, valido, orcamento, k):
+    """
+    Mochila 0/1 com no máximo k itens: escolhe campanhas inteiras (custo =
+    orçamento desejado) maximizando o valor, vetorizado entre datas.
+    """
+    n_datas, n_cand = desejado.shape
+    passo = max(MOCHILA_PASSO, orcamento / MOCHILA_MAX_PASSOS)
+    cap = int(orcamento // passo)
+    peso = np.where(valido, np.ceil(desejado / passo), cap + 1).astype(np.int64)
+    valor = np.where(valido, valor, 0.0)
+
+    # dp[d, c, b]: melhor valor com c itens e peso <= b
+    dp = np.full((n_datas, k+1, cap+1), -np.inf)
+    dp[:, 0, :] = 0.0
+    pegou = np.zeros((n_cand, n_datas, k+1, cap+1), dtype=bool)
+    linhas = np.arange(n_datas)[:, None]
+    for m in range(n_cand):
+        origem = np.arange(cap+1)[None, :] - peso[:, m][:, None]          # (datas, cap+1)
+        anterior = dp[linhas, :-1, np.clip(origem, 0, None)].transpose(0, 2, 1)
+        candidato = np.where((origem >= 0)[:, None, :], anterior + valor[:, m][:, None, None], -np.inf)
+        melhora = candidato > dp[:, 1:, :]
+        dp[:, 1:, :] = np.where(melhora, candidato, dp[:, 1:, :])
+        pegou[m, :, 1:, :] = melhora
+
+    escolhido = np.zeros((n_datas, n_cand), dtype=bool)
+    for d in range(n_datas):
+        c = int(np.argmax(dp[d, :, cap]))
+        b = cap
+        for m in range(n_cand-1, -1, -1):
+            if c > 0 and pegou[m, d, c, b]:
+                escolhido[d, m] = True
+                b -= peso[d, m]
+                c -= 1
+    return np.where(escolhido, desejado, 0.0), escolhido
+
+def alocar_orcamentos(df_ref, datas=None, orcamentos=(1000.0,), modos=("eficiencia",), k=3,
+                      metodos=("guloso",), n_candidatos=None):
+    """
+    Avalia políticas de alocação para várias datas/orçamentos/modos de uma vez.
+    metodos: 'guloso' (top-K por score, aloca até acabar o saldo) e/ou 'mochila'.
+    n_candidatos: campanhas consideradas pela mochila por data (padrão: 3*k).
+
+    Retorna (priorizar, ajustar): DataFrames longos, uma linha por campanha
+    escolhida; 'valor' = score * orçamento sugerido (retorno esperado).
+    """
+    datas_idx, camp_ids, nomes, matrizes = _matrizes_snapshot(df_ref, datas)
+    n_candidatos = n_candidatos or 3*k
+    priorizar, ajustar = [], []
+
+    def linhas(idx, selecionado, extra):
+        d, pos = np.nonzero(selecionado)
+        return pd.DataFrame({
+            "data_referencia": datas_idx[d],
+            **extra(d, pos),
+            "posicao": pos + 1,
+            "campanhaId": camp_ids[idx[d, pos]].astype(int),
+            "nome": nomes[idx[d, pos]],
+        })
+
+    for modo in modos:
+        score = _score(matrizes, modo)
+
+        fundo, fundo_ok = _top_k(score, k, maiores=False)   # em ordem de score desc, como no ranking
+        ajustar.append(linhas(fundo, fundo_ok, lambda d, pos: {"modo": modo}))
+
+        for metodo in metodos:
+            idx, valido = _top_k(score, k if metodo == "guloso" else n_candidatos)
+            s_top = np.take_along_axis(score, idx, axis=1)
+            desejado = np.maximum(ALOC_MINIMO, np.take_along_axis(matrizes["custo"], idx, axis=1) * ALOC_FRACAO)
+
+            for orcamento in orcamentos:
+                if metodo == "guloso":
+                    aloc, sel = _alocar_guloso(desejado, valido, orcamento)
+                else:
+                    aloc, sel = np.zeros_like(desejado), np.zeros_like(valido)
+                    for i in range(0, len(desejado), MOCHILA_BLOCO):
+                        b = slice(i, i + MOCHILA_BLOCO)
+                        aloc[b], sel[b] = _alocar_mochila(
+                            desejado[b], s_top[b] * desejado[b], valido[b], orcamento, k
+                        )
+
+                priorizar.append(linhas(idx, sel, lambda d, pos: {
+                    "modo": modo,
+                    "metodo": metodo,
+                    "orcamento": orcamento,
+                    "score": s_top[d, pos],
+                    "orcamentoSugerido": aloc[d, pos],
+                    "valor": s_top[d, pos] * aloc[d, pos],
+                }))
+
+    return pd.concat(priorizar, ignore_index=True), pd.concat(ajustar, ignore_index=True)
+
+def greedy_recommend(df_ref, data_referencia=None, k=3, orcamento=1000.0, modo="eficiencia"):
+    """
+    Seleciona top-K campanhas por eficiência e aloca orçamento gulosamente.
+    modo: 'eficiencia' (conversoes/custo) ou 'roi' (receita/custo)
+
+    Uma data só; para avaliar muitas datas/orçamentos use alocar_orcamentos.
+    """
+    if data_referencia is None:
+        data_referencia = df_ref["date"].max()
+    priorizar, ajustar = alocar_orcamentos(
+        df_ref, datas=[data_referencia], orcamentos=(orcamento,), modos=(modo,), k=k
+    )
+
+    aloc = [{
+        "campanhaId": int(r.campanhaId),
+        "nome": r.nome,
+        "score": float(r.score),
+        "orcamentoSugerido": round(float(r.orcamentoSugerido), 2)
+    } for r in priorizar.itertuples()]
+    ajustar = [{"campanhaId": int(r.campanhaId), "nome": r.nome, "motivo": "baixo score / alto custo"} for r in ajustar.itertuples()]
+
+    return {
+        "data_referencia": str(pd.Timestamp(data_referencia).date()),
+        "heuristica": modo,
+        "orcamento_total": orcamento,
+        "priorizar": aloc,
+        "ajustar_ou_pausar": ajustar
+    }
+
+recs = greedy_recommend(df, k=3, orcamento=1200.0, modo="eficiencia")
+json_path = "sugestoes_gulosas.json"
+with open(json_path, "w", encoding="utf-8") as f:
+    json.dump(recs, f, ensure_ascii=False, indent=2)
+
+# Políticas de alocação em todo o histórico (retorno esperado somado por política)
+politicas, _ = alocar_orcamentos(df, orcamentos=(600.0, 1200.0), modos=("eficiencia", "roi"),
+                                 k=3, metodos=("guloso", "mochila"))
+politicas_path = "politicas_orcamento.csv"
+politicas.groupby(["modo","metodo","orcamento"])["valor"].sum().reset_index().to_csv(politicas_path, index=False)
+
+# Salvar um relatório-resumo em texto 
+
+summary = f"""
+Cannoli Intelligence – IA/ML (dados simulados)
+
+1) Alertas (queda média móvel 7d, 30%):
+- Total de alertas gerados: {len(alerts_df)}
+- Exemplo primeira linha:
+{alerts_df.head(1).to_string(index=False) if not alerts_df.empty else 'Sem alertas'}
+- Gráficos por campanha: {graficos['campanhas']} em {graficos['pasta']}/ ({graficos['desenhados']} desenhados, {graficos['reaproveitados']} reaproveitados, {graficos['removidos']} removidos)
+
+2) Regressão Linear – previsão de conversões (features de defasagem 1 dia):
+- MAE  : {metrics['MAE']:.3f}
+- RMSE : {metrics['RMSE']:.3f}
+- R²    : {metrics['R2']:.3f}
+
+3) Busca Gulosa – recomendações (heurística: eficiência = conversões/custo, orçamento R$ 1200):
+{json.dumps(recs, ensure_ascii=False, indent=2)}
+"""
+txt_path = "resultados_ia.txt"
+with open(txt_path, "w", encoding="utf-8") as f:
+    f.write(summary)
+
+csv_path, alerts_path, plot_alerts_path, graficos["pasta"], plot_reg_path, json_path, politicas_path, txt_path
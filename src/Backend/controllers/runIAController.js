@@ -1,28 +1,170 @@
-import { exec } from "child_process";
+import { spawn } from "child_process";
 import path from "path";
+import readline from "readline";
+
+// Worker Python persistente (ia_campanhas_sugestoes.py --modo worker):
+// mantém pandas/sklearn importados e o modelo em memória entre requisições.
+// Protocolo JSON-lines: uma linha de comando em stdin, uma linha de resposta em stdout.
+const PYTHON_BIN = process.env.PYTHON_BIN || "python";
+
+// Tempo máximo de um comando (treino incluso), contado a partir do envio ao worker; ao estourar, o
+// worker é considerado travado e reiniciado.
+const IA_TIMEOUT_MS = Number(process.env.IA_TIMEOUT_MS) || 30 * 60 * 1000;
+
+let worker = null;
+let proximoId = 1;
+const pendentes = new Map();
+
+// Comandos em andamento (por comando + parâmetros): requisições simultâneas reaproveitam a mesma
+// execução em vez de empilhar treinos/scores em paralelo.
+const emAndamento = new Map();
+
+// Rejeita as requisições pendentes de `proc` (em execução e na fila) e descarta o worker
+// (se ainda for o atual).
+function encerrarWorker(proc, erro) {
+  if (worker === proc) worker = null;
+  proc.fila.length = 0;
+  proc.emExecucao = null;
+  for (const [id, pendente] of pendentes) {
+    if (pendente.proc !== proc) continue;
+    clearTimeout(pendente.timer);
+    pendentes.delete(id);
+    pendente.reject({ erro });
+  }
+}
+
+function iniciarWorker() {
+  const scriptPath = path.resolve("ml", "ia_campanhas_sugestoes.py");
+  const proc = spawn(PYTHON_BIN, [scriptPath, "--modo", "worker"], {
+    stdio: ["pipe", "pipe", "pipe"],
+  });
+
+  // O worker atende um comando por vez: os demais esperam aqui e só são escritos em stdin
+  // (e só começam a contar o tempo limite) quando o anterior termina.
+  proc.fila = [];
+  proc.emExecucao = null;
+
+  readline.createInterface({ input: proc.stdout }).on("line", (linha) => {
+    let msg;
+    try {
+      msg = JSON.parse(linha);
+    } catch {
+      console.log(linha);
+      return;
+    }
+
+    const pendente = pendentes.get(msg.id);
+    if (!pendente) return;
+    pendentes.delete(msg.id);
+    clearTimeout(pendente.timer);
+
+    if (proc.emExecucao === msg.id) proc.emExecucao = null;
+    despachar(proc);
+
+    if (msg.ok) pendente.resolve(msg);
+    else pendente.reject(msg);
+  });
+
+  // stderr: logs de progresso + eventos de instrumentação ({"evento": "etapa", ...})
+  readline.createInterface({ input: proc.stderr }).on("line", (linha) => {
+    try {
+      const evento = JSON.parse(linha);
+      if (evento?.evento === "etapa") {
+        console.log(
+          `[IA] ${evento.etapa}: ${evento.tempo_s}s (cpu ${evento.cpu_s}s, ` +
+            `rss ${evento.rss_pico_mb} MB, linhas ${evento.linhas ?? "-"})`
+        );
+        return;
+      }
+    } catch {
+      // linha de log comum
+    }
+    console.log(linha);
+  });
+
+  proc.on("exit", (codigo, sinal) => {
+    console.error(`Worker Python encerrado (código ${codigo}, sinal ${sinal}).`);
+    encerrarWorker(proc, "Worker Python encerrado durante a execução.");
+  });
+
+  proc.on("error", (err) => {
+    console.error("Erro ao iniciar worker Python:", err);
+    encerrarWorker(proc, `Falha no worker Python: ${err.message}`);
+  });
+
+  // EPIPE ao escrever num worker que já morreu: sem handler, derruba o processo Node
+  proc.stdin.on("error", (err) => {
+    console.error("Erro ao enviar comando ao worker Python:", err);
+    encerrarWorker(proc, `Falha ao enviar comando ao worker Python: ${err.message}`);
+    proc.kill();
+  });
+
+  return proc;
+}
+
+// Escreve o próximo comando da fila de `proc` se o worker estiver livre; o tempo limite começa
+// aqui, não na chegada da requisição (um score atrás de um treino não herda a espera do treino).
+function despachar(proc) {
+  if (proc.emExecucao !== null || proc.fila.length === 0) return;
+
+  const id = proc.fila.shift();
+  const pendente = pendentes.get(id);
+  proc.emExecucao = id;
+  pendente.timer = setTimeout(() => {
+    pendentes.delete(id);
+    pendente.reject({ erro: `Worker Python não respondeu em ${IA_TIMEOUT_MS / 1000}s.` });
+    // Worker travado: rejeita os demais pendentes e mata; o próximo comando reinicia
+    console.error(`Comando ${pendente.cmd} (id ${id}) excedeu o tempo limite; reiniciando worker.`);
+    encerrarWorker(proc, "Worker Python reiniciado após tempo limite.");
+    proc.kill();
+  }, IA_TIMEOUT_MS);
+
+  proc.stdin.write(JSON.stringify({ id, cmd: pendente.cmd, ...pendente.params }) + "\n");
+}
+
+function enviarComando(cmd, params = {}) {
+  if (!worker) worker = iniciarWorker();
+
+  const proc = worker;
+  const id = proximoId++;
+  return new Promise((resolve, reject) => {
+    pendentes.set(id, { resolve, reject, timer: null, proc, cmd, params });
+    proc.fila.push(id);
+    despachar(proc);
+  });
+}
+
+function executarUnico(cmd, params) {
+  const chave = JSON.stringify([cmd, params]);
+  if (!emAndamento.has(chave)) {
+    const execucao = enviarComando(cmd, params).finally(() =>
+      emAndamento.delete(chave)
+    );
+    emAndamento.set(chave, execucao);
+  }
+  return emAndamento.get(chave);
+}
 
 export async function runIA(req, res) {
+  // score (padrão): usa o modelo registrado; treinar: retreina e registra nova versão
+  const modo = req.body?.modo === "treinar" ? "treinar" : "score";
+  const params = {};
+  if (req.body?.versao) params.versao = req.body.versao;
+
   try {
-    const scriptPath = path.resolve("ml", "ia_campanhas_sugestoes.py");
-
-    exec(`python "${scriptPath}"`, (error, stdout, stderr) => {
-      if (error) {
-        console.error("Erro ao executar script Python:", error);
-        return res
-          .status(500)
-          .json({ erro: "Falha ao executar script Python.", detalhes: stderr });
-      }
+    const resposta = await executarUnico(modo, params);
 
-      console.log("Script Python executado com sucesso.");
-      console.log(stdout);
+    console.log("IA executada com sucesso:", resposta.resultado);
 
-      res.json({
-        mensagem: "IA executada com sucesso!",
-        saida: stdout,
-      });
+    res.json({
+      mensagem: "IA executada com sucesso!",
+      saida: resposta.resultado,
+      duracao_s: resposta.duracao_s,
     });
   } catch (err) {
-    console.error("Erro interno no runIA:", err);
-    res.status(500).json({ erro: "Erro interno ao executar a IA." });
+    console.error("Erro ao executar IA:", err);
+    res
+      .status(500)
+      .json({ erro: "Falha ao executar script Python.", detalhes: err?.erro });
   }
-}
\ No newline at end of file
+}
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import ia_campanhas_sugestoes as ia
+
+# Benchmark ponta a ponta do pipeline de sugestões:
+#   carregar_campanhas -> adicionar_features -> treinar_modelo
+#   -> gerar_sugestoes -> salvar_sugestoes_no_banco -> salvar_jsons
+#
+# O MySQL é substituído por um SQLite local (mesmas tabelas/colunas de
+# cannoli.sql), preenchido com campanhas sintéticas em lotes.
+#
+# Uso:
+#   python benchmark_pipeline.py --linhas 10000 100000 1000000 --saida bench.json
+
+
+# GERADOR SINTÉTICO (esquema de `campaign` em cannoli.sql)
+
+CAMPAIGN_DDL = """
+    CREATE TABLE campaign (
+      id INTEGER,
+      segmentId INTEGER,
+      templateId INTEGER,
+      storeId TEXT NOT NULL,
+      name TEXT,
+      description TEXT,
+      badge TEXT,
+      type INTEGER,
+      status INTEGER,
+      isDefault INTEGER,
+      createdAt TEXT,
+      createdBy TEXT,
+      updatedAt TEXT,
+      updatedBy TEXT,
+      status_desc TEXT,
+      createdAt_filled TEXT,
+      _mes TEXT
+    )
+"""
+
+SUGESTOES_DDL = """
+    CREATE TABLE campaign_ai_sugestoes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      campaignId INTEGER NOT NULL,
+      storeId TEXT NOT NULL,
+      status_previsto TEXT NOT NULL,
+      confianca REAL NOT NULL,
+      grupo TEXT NOT NULL,
+      modelo_versao TEXT,
+      gerado_em TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+CAMPAIGN_COLS = [
+    "id",
+    "segmentId",
+    "templateId",
+    "storeId",
+    "name",
+    "description",
+    "badge",
+    "type",
+    "status",
+    "isDefault",
+    "createdAt",
+    "createdBy",
+    "updatedAt",
+    "updatedBy",
+    "status_desc",
+    "createdAt_filled",
+    "_mes",
+]
+
+# Distribuições aproximadas das observadas no dump de cannoli.sql
+BADGES = ["loyalty", "winback", "seasonal", "consumption", "migration", "Nao informado"]
+BADGES_P = [0.25, 0.20, 0.19, 0.18, 0.09, 0.09]
+
+STATUS_DESC = ["Rascunho", "Agendada", "Ativa", "Concluida"]
+STATUS_DESC_P = [0.14, 0.16, 0.38, 0.32]
+
+USUARIOS = ["ana", "carlos", "juliana", "marcos", "rafa"]
+
+PERIODO_INICIO = np.datetime64("2024-01-01T00:00")
+PERIODO_MINUTOS = 600 * 24 * 60
+PROB_CREATED_AT_VAZIO = 0.6
+
+GERADOR_LOTE = 100_000
+
+
+def gerar_lote_campanhas(inicio_id: int, n: int, n_lojas: int, rng) -> pd.DataFrame:
+    """Gera `n` campanhas sintéticas (vetorizado) a partir do id `inicio_id`."""
+    ids = np.arange(inicio_id, inicio_id + n)
+
+    criado = PERIODO_INICIO + rng.integers(0, PERIODO_MINUTOS, n).astype("timedelta64[m]")
+    atualizado = criado + rng.integers(-60 * 24 * 60, 200 * 24 * 60, n).astype("timedelta64[m]")
+
+    criado_txt = pd.Series(criado).dt.strftime(ia.CAMPANHA_DATE_FORMAT)
+    atualizado_txt = pd.Series(atualizado).dt.strftime(ia.CAMPANHA_DATE_FORMAT)
+
+    lojas = np.char.add("EST", np.char.zfill(rng.integers(1, n_lojas + 1, n).astype(str), 3))
+    status_idx = rng.choice(len(STATUS_DESC), n, p=STATUS_DESC_P)
+    usuarios = np.asarray(USUARIOS)[rng.integers(0, len(USUARIOS), n)]
+
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "segmentId": ids,
+            "templateId": ids,
+            "storeId": lojas,
+            "name": np.char.add("Campanha ", ids.astype(str)),
+            "description": "Campanha sintética para benchmark.",
+            "badge": rng.choice(BADGES, n, p=BADGES_P),
+            "type": rng.integers(1, 3, n),
+            "status": status_idx + 1,
+            "isDefault": (rng.random(n) < 0.15).astype(int),
+            "createdAt": np.where(rng.random(n) < PROB_CREATED_AT_VAZIO, "", criado_txt),
+            "createdBy": usuarios,
+            "updatedAt": atualizado_txt,
+            "updatedBy": usuarios,
+            "status_desc": np.asarray(STATUS_DESC)[status_idx],
+            "createdAt_filled": criado_txt,
+            "_mes": pd.Series(criado).dt.strftime("%Y-%m"),
+        },
+        columns=CAMPAIGN_COLS,
+    )
+
+
+def popular_banco(db_path: Path, n_linhas: int, n_lojas: int = 12, seed: int = 42):
+    """Cria as tabelas no SQLite e insere `n_linhas` campanhas em lotes."""
+    rng = np.random.default_rng(seed)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE IF EXISTS campaign")
+    conn.execute("DROP TABLE IF EXISTS campaign_ai_sugestoes")
+    conn.execute(CAMPAIGN_DDL)
+    conn.execute(SUGESTOES_DDL)
+
+    insert_sql = f"INSERT INTO campaign VALUES ({', '.join(['?'] * len(CAMPAIGN_COLS))})"
+    for inicio in range(0, n_linhas, GERADOR_LOTE):
+        n = min(GERADOR_LOTE, n_linhas - inicio)
+        lote = gerar_lote_campanhas(inicio + 1, n, n_lojas, rng)
+        conn.executemany(insert_sql, lote.itertuples(index=False, name=None))
+    conn.commit()
+    conn.close()
+
+
+# BANCO LOCAL (SQLite no lugar do MySQL)
+
+class _CursorSQLite(sqlite3.Cursor):
+    """Aceita o dialeto usado pelo pipeline (%s e TRUNCATE TABLE)."""
+
+    def execute(self, sql, params=()):
+        sql = sql.replace("%s", "?")
+        if sql.strip().upper().startswith("TRUNCATE TABLE"):
+            sql = "DELETE FROM" + sql.strip()[len("TRUNCATE TABLE"):]
+        return super().execute(sql, params or ())
+
+    def executemany(self, sql, seq):
+        return super().executemany(sql.replace("%s", "?"), seq)
+
+
+class _ConexaoSQLite(sqlite3.Connection):
+    """Conexão SQLite com a assinatura de cursor do mysql.connector."""
+
+    def cursor(self, *args, buffered=None, **kwargs):
+        return super().cursor(_CursorSQLite)
+
+
+@contextlib.contextmanager
+def banco_local(db_path: Path):
+    """Aponta ia.get_connection para o SQLite durante o bloco."""
+    original = ia.get_connection
+
+    def conectar(**opcoes):
+        return sqlite3.connect(db_path, factory=_ConexaoSQLite)
+
+    ia.get_connection = conectar
+    try:
+        yield
+    finally:
+        ia.get_connection = original
+
+
+# MEDIÇÃO
+
+def medir(nome: str, func, *args, memoria: bool = False, **kwargs):
+    """
+    Executa func(*args, **kwargs) medindo tempo ou pico de memória alocada.
+
+    memoria=False: só o tempo (sem tracemalloc, que deixa toda alocação
+      mais lenta e distorceria tempo_s/linhas_por_s).
+    memoria=True: só o pico, via tracemalloc (numpy/pandas registram suas
+      alocações nele), então reflete o que a etapa alocou, não o RSS
+      acumulado do processo.
+    """
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        resultado = func(*args, **kwargs)
+    tempo = time.perf_counter() - inicio
+
+    if not memoria:
+        return resultado, {"etapa": nome, "tempo_s": round(tempo, 4)}
+
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, {"etapa": nome, "pico_mem_mb": round(pico / (1024 * 1024), 2)}
+
+
+def _rodar_etapas(chunksize, engine, memoria: bool) -> tuple:
+    """Uma passada do pipeline no banco local; devolve (medições por etapa, metrics)."""
+    etapas = []
+
+    df_raw, m = medir(
+        "carregar_campanhas", ia.carregar_campanhas, chunksize=chunksize, memoria=memoria
+    )
+    etapas.append(m)
+
+    _, m = medir("adicionar_features", ia.adicionar_features, df_raw, memoria=memoria)
+    etapas.append(m)
+
+    (model, encoders, df_feat, feature_cols, metrics), m = medir(
+        "treinar_modelo", ia.treinar_modelo, df_raw, engine=engine, memoria=memoria
+    )
+    etapas.append(m)
+
+    sugestoes, m = medir(
+        "gerar_sugestoes", ia.gerar_sugestoes, df_feat, feature_cols, model, encoders,
+        memoria=memoria,
+    )
+    etapas.append(m)
+
+    _, m = medir(
+        "salvar_sugestoes_no_banco", ia.salvar_sugestoes_no_banco, sugestoes, memoria=memoria
+    )
+    etapas.append(m)
+
+    _, m = medir("salvar_jsons", ia.salvar_jsons, metrics, sugestoes, memoria=memoria)
+    etapas.append(m)
+
+    return etapas, metrics
+
+
+def rodar_tamanho(n_linhas: int, chunksize=None, engine="rf", seed=42, memoria=True) -> dict:
+    """
+    Gera os dados, roda o pipeline completo e devolve as medições por etapa.
+
+    Tempo e memória vêm de passadas separadas sobre o mesmo banco: a primeira
+    cronometra sem tracemalloc; a segunda (se memoria=True) só mede o pico.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        db_path = tmp / "bench.db"
+
+        inicio = time.perf_counter()
+        popular_banco(db_path, n_linhas, seed=seed)
+        tempo_geracao = time.perf_counter() - inicio
+
+        cwd = Path.cwd()
+        os.chdir(tmp)
+        try:
+            with banco_local(db_path):
+                etapas, metrics = _rodar_etapas(chunksize, engine, memoria=False)
+                picos = _rodar_etapas(chunksize, engine, memoria=True)[0] if memoria else []
+        finally:
+            os.chdir(cwd)
+
+    pico_por_etapa = {m["etapa"]: m["pico_mem_mb"] for m in picos}
+    for m in etapas:
+        m["pico_mem_mb"] = pico_por_etapa.get(m["etapa"])
+        m["linhas"] = n_linhas
+        m["linhas_por_s"] = round(n_linhas / m["tempo_s"], 1) if m["tempo_s"] > 0 else None
+
+    return {
+        "linhas": n_linhas,
+        "chunksize": chunksize,
+        "engine": engine,
+        "tempo_geracao_s": round(tempo_geracao, 4),
+        "tempo_total_s": round(sum(m["tempo_s"] for m in etapas), 4),
+        "accuracy": metrics["accuracy"],
+        "etapas": etapas,
+        "pico_rss_processo_mb": ia.pico_rss_mb(),
+    }
+
+
+# MAIN
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark do pipeline de sugestões com dados sintéticos."
+    )
+    parser.add_argument(
+        "--linhas",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="Tamanhos da tabela campaign a testar (ex.: 10000 100000 1000000 10000000).",
+    )
+    parser.add_argument("--chunksize", type=int, default=None, help="Repassado a carregar_campanhas.")
+    parser.add_argument("--engine", choices=ia.ENGINES, default="rf", help="Repassado a treinar_modelo.")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do gerador sintético.")
+    parser.add_argument(
+        "--sem-memoria",
+        action="store_true",
+        help="Pula a segunda passada (com tracemalloc) que mede o pico de memória por etapa.",
+    )
+    parser.add_argument(
+        "--saida",
+        default="benchmark_resultados.json",
+        help="Arquivo JSON com os resultados.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    resultados = {
+        "gerado_em": pd.Timestamp.now().isoformat(),
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+        },
+        "execucoes": [],
+    }
+
+    for n in args.linhas:
+        print(f"Benchmark com {n} campanhas...")
+        execucao = rodar_tamanho(
+            n,
+            chunksize=args.chunksize,
+            engine=args.engine,
+            seed=args.seed,
+            memoria=not args.sem_memoria,
+        )
+        resultados["execucoes"].append(execucao)
+
+        for m in execucao["etapas"]:
+            pico = "-" if m["pico_mem_mb"] is None else f"{m['pico_mem_mb']:.1f}"
+            print(f"  {m['etapa']:<28} {m['tempo_s']:>9.3f}s  {pico:>9} MB")
+
+    saida = Path(args.saida).resolve()
+    with saida.open("w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    print(f"Resultados salvos em: {saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+import sys
+import json
+import time
+import argparse
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+# Job de recência / risco de churn por cliente (tabela materializada).
+#
+# O dashboard de clientes em risco (controllers/clientRiskController.js)
+# agrega `order` a cada requisição (MAX(createdAt) por cliente, com datas em
+# TEXT). Este job faz essa agregação uma vez e grava `cliente_risco`, uma
+# linha por (companyId, customerId) com chave primária e índice por
+# categoria:
+#   pedidos, valor_total_num (soma de totalAmount_num, em centavos),
+#   primeira_compra, ultima_compra, intervalo_medio_dias, categoria
+#
+# Carga completa: `order` é lida loja a loja (idx_order_company), em lotes
+# por cursor não-bufferizado; cada lote é agregado com groupby e os parciais
+# são combinados (soma/mín/máx). O resultado vai para uma staging que troca
+# de lugar com a oficial (RENAME TABLE), como em salvar_sugestoes_bulk.
+#
+# Carga incremental: watermark por loja = MAX(ultima_compra) da própria
+# tabela, por companyId. Só os pedidos com createdAt >= watermark da loja são
+# lidos para descobrir os clientes afetados; esses clientes são reagregados
+# por inteiro (idx_order_customer) e substituídos. Uma loja sem linhas na
+# tabela (ex.: fora do --lojas da primeira carga) é agregada por inteiro.
+# Reprocessar o mesmo delta não conta pedido duas vezes.
+# No fim, a categoria de todas as linhas é recalculada para a data atual
+# (um cliente sem pedido novo também envelhece de "Ativo" para "Em risco").
+#
+# Uso:
+#   python clientes_risco.py                  # incremental (completa na 1ª vez)
+#   python clientes_risco.py --full-refresh
+#   python clientes_risco.py --lojas EST001 EST004
+
+
+# CONFIGURAÇÃO
+
+RISCO_TABLE = "cliente_risco"
+RISCO_STAGE_TABLE = "cliente_risco_stage"
+RISCO_OLD_TABLE = "cliente_risco_old"
+
+RISCO_DDL = """
+    CREATE TABLE IF NOT EXISTS {tabela} (
+      `companyId` varchar(10) NOT NULL,
+      `customerId` int NOT NULL,
+      `pedidos` int NOT NULL,
+      `valor_total_num` bigint NOT NULL,
+      `primeira_compra` datetime NOT NULL,
+      `ultima_compra` datetime NOT NULL,
+      `intervalo_medio_dias` decimal(10,2) DEFAULT NULL,
+      `categoria` varchar(30) NOT NULL,
+      `atualizado_em` datetime NOT NULL,
+      PRIMARY KEY (`companyId`, `customerId`),
+      KEY `idx_categoria` (`companyId`, `categoria`),
+      KEY `idx_ultima_compra` (`ultima_compra`)
+    ) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+
+RISCO_COLS = [
+    "companyId",
+    "customerId",
+    "pedidos",
+    "valor_total_num",
+    "primeira_compra",
+    "ultima_compra",
+    "intervalo_medio_dias",
+    "categoria",
+    "atualizado_em",
+]
+
+# Mesmas faixas (e rótulos) de categoriaPorDias() no controller
+CATEGORIA_ATIVO = "Ativo (≤30d)"
+CATEGORIA_RISCO = "Em risco (31–60d)"
+CATEGORIA_PERDIDO = "Perdido (>60d)"
+DIAS_ATIVO = 30
+DIAS_RISCO = 60
+
+# createdAt é TEXT em `order`, no formato ISO (comparável como texto)
+PEDIDO_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+PEDIDO_COLS = ["companyId", "customer", "createdAt", "totalAmount_num"]
+
+# isTest é TEXT ("True"/"False"); pedidos sem cliente não entram no painel
+PEDIDO_QUERY = f"""
+    SELECT {", ".join(PEDIDO_COLS)}
+    FROM `order`
+    WHERE companyId = %s
+      AND customer IS NOT NULL
+      AND (isTest IS NULL OR isTest <> 'True')
+"""
+
+RISCO_CHUNKSIZE = 50_000
+RISCO_LOTE = 1_000  # clientes por IN (...) / linhas por INSERT
+
+
+# AGREGAÇÃO (vetorizada, por lote)
+
+def _tipar_pedidos(rows) -> pd.DataFrame:
+    """Lote cru do cursor -> DataFrame com datas e valores numéricos."""
+    df = pd.DataFrame(rows, columns=PEDIDO_COLS)
+    df["customer"] = pd.to_numeric(df["customer"], downcast="integer")
+    df["createdAt"] = pd.to_datetime(df["createdAt"], format=PEDIDO_DATE_FORMAT, errors="coerce")
+    df["totalAmount_num"] = pd.to_numeric(df["totalAmount_num"]).fillna(0)
+    return df.dropna(subset=["createdAt"])
+
+
+def agregar_pedidos(pedidos: pd.DataFrame) -> pd.DataFrame:
+    """Agregado parcial por (companyId, customer) de um lote de pedidos."""
+    return pedidos.groupby(["companyId", "customer"], sort=False, observed=True).agg(
+        pedidos=("createdAt", "size"),
+        valor_total_num=("totalAmount_num", "sum"),
+        primeira_compra=("createdAt", "min"),
+        ultima_compra=("createdAt", "max"),
+    )
+
+
+def combinar_parciais(parciais: list) -> pd.DataFrame:
+    """Combina agregados parciais (contagem/soma somam, datas por mín/máx)."""
+    if not parciais:
+        return agregar_pedidos(_tipar_pedidos([]))
+    if len(parciais) == 1:
+        return parciais[0]
+    return pd.concat(parciais).groupby(level=[0, 1], sort=False).agg(
+        pedidos=("pedidos", "sum"),
+        valor_total_num=("valor_total_num", "sum"),
+        primeira_compra=("primeira_compra", "min"),
+        ultima_compra=("ultima_compra", "max"),
+    )
+
+
+def categorizar(ultima_compra: pd.Series, referencia: pd.Timestamp) -> np.ndarray:
+    """Categoria de risco pelos dias (inteiros) desde a última compra."""
+    dias = (referencia - ultima_compra).dt.days.to_numpy()
+    return np.select(
+        [dias <= DIAS_ATIVO, dias <= DIAS_RISCO],
+        [CATEGORIA_ATIVO, CATEGORIA_RISCO],
+        default=CATEGORIA_PERDIDO,
+    )
+
+
+def montar_linhas(agregado: pd.DataFrame, referencia: pd.Timestamp) -> pd.DataFrame:
+    """Agregado final -> linhas no formato de `cliente_risco`."""
+    linhas = agregado.reset_index().rename(columns={"customer": "customerId"})
+
+    span_dias = (linhas["ultima_compra"] - linhas["primeira_compra"]).dt.total_seconds() / 86_400
+    linhas["intervalo_medio_dias"] = (span_dias / (linhas["pedidos"] - 1)).where(
+        linhas["pedidos"] > 1
+    ).round(2)
+    linhas["categoria"] = categorizar(linhas["ultima_compra"], referencia)
+    linhas["atualizado_em"] = referencia
+
+    for col in ["primeira_compra", "ultima_compra", "atualizado_em"]:
+        linhas[col] = linhas[col].dt.strftime(PEDIDO_DATE_FORMAT)
+    linhas["valor_total_num"] = linhas["valor_total_num"].astype(np.int64)
+    return linhas[RISCO_COLS]
+
+
+# LEITURA DE `order` (loja a loja, em lotes)
+
+def listar_lojas(conn, lojas=None) -> list:
+    """companyId com pedidos (ou a lista informada, sem repetição)."""
+    if lojas:
+        return list(dict.fromkeys(lojas))
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT companyId FROM `order` ORDER BY companyId")
+    resultado = [linha[0] for linha in cur.fetchall()]
+    cur.close()
+    return resultado
+
+
+def _ler_agregado(conn, sql: str, params, chunksize: int) -> tuple:
+    """
+    Executa `sql` com cursor não-bufferizado e agrega lote a lote.
+
+    Só o lote atual fica em memória como pedidos; o que acumula são os
+    agregados parciais (no máximo uma linha por cliente por lote).
+    Retorna (agregado, pedidos lidos).
+    """
+    cur = conn.cursor(buffered=False)
+    cur.execute(sql, params)
+
+    parciais, n_pedidos = [], 0
+    while True:
+        rows = cur.fetchmany(chunksize)
+        if not rows:
+            break
+        n_pedidos += len(rows)
+        parciais.append(agregar_pedidos(_tipar_pedidos(rows)))
+
+    cur.close()
+    return combinar_parciais(parciais), n_pedidos
+
+
+def agregar_loja(conn, loja: str, chunksize: int = RISCO_CHUNKSIZE, desde=None) -> tuple:
+    """Agrega os pedidos de uma loja (só createdAt >= desde, se informado)."""
+    sql, params = PEDIDO_QUERY, (loja,)
+    if desde is not None:
+        sql += "\n      AND createdAt >= %s"
+        params += (desde.strftime(PEDIDO_DATE_FORMAT),)
+    return _ler_agregado(conn, sql, params, chunksize)
+
+
+def reagregar_clientes(conn, loja: str, clientes, chunksize: int = RISCO_CHUNKSIZE) -> pd.DataFrame:
+    """Histórico completo (na loja) dos clientes informados, via idx_order_customer."""
+    parciais = []
+    clientes = np.asarray(clientes, dtype=np.int64)
+    for inicio in range(0, len(clientes), RISCO_LOTE):
+        bloco = clientes[inicio : inicio + RISCO_LOTE].tolist()
+        sql = PEDIDO_QUERY + f"\n      AND customer IN ({', '.join(['%s'] * len(bloco))})"
+        agregado, _ = _ler_agregado(conn, sql, (loja, *bloco), chunksize)
+        parciais.append(agregado)
+    return combinar_parciais(parciais)
+
+
+# ESCRITA EM `cliente_risco`
+
+def _inserir_linhas(cur, tabela: str, linhas: pd.DataFrame, lote: int = RISCO_LOTE):
+    """INSERT multi-linha em lotes (NaN -> NULL)."""
+    placeholder = "(" + ", ".join(["%s"] * len(RISCO_COLS)) + ")"
+    prefixo = f"INSERT INTO {tabela} ({', '.join(RISCO_COLS)}) VALUES "
+
+    valores = linhas.astype(object).where(linhas.notna(), None).to_numpy()
+    for inicio in range(0, len(valores), lote):
+        bloco = valores[inicio : inicio + lote]
+        sql = prefixo + ", ".join([placeholder] * len(bloco))
+        cur.execute(sql, [v.item() if hasattr(v, "item") else v for v in bloco.ravel()])
+
+
+def _apagar_clientes(cur, loja: str, clientes, lote: int = RISCO_LOTE):
+    clientes = np.asarray(clientes, dtype=np.int64)
+    for inicio in range(0, len(clientes), lote):
+        bloco = clientes[inicio : inicio + lote].tolist()
+        cur.execute(
+            f"DELETE FROM {RISCO_TABLE} WHERE companyId = %s "
+            f"AND customerId IN ({', '.join(['%s'] * len(bloco))})",
+            (loja, *bloco),
+        )
+
+
+def ler_watermarks(conn) -> dict:
+    """
+    MAX(ultima_compra) de `cliente_risco` por companyId ({} se a tabela não
+    existe/está vazia).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT companyId, MAX(ultima_compra) FROM {RISCO_TABLE} GROUP BY companyId")
+        linhas = cur.fetchall()
+    except mysql.connector.Error:
+        # Tabela ainda não criada: primeira execução
+        linhas = []
+    finally:
+        cur.close()
+    return {loja: pd.Timestamp(valor) for loja, valor in linhas if valor is not None}
+
+
+def atualizar_categorias(cur, referencia: pd.Timestamp):
+    """
+    Recalcula a categoria de todas as linhas para a data `referencia`.
+
+    Os cortes viram datas (dias <= 30  <=>  ultima_compra > referencia - 31d),
+    então o UPDATE compara ultima_compra direto, sem função de data por linha.
+    """
+    corte_ativo = (referencia - pd.Timedelta(days=DIAS_ATIVO + 1)).strftime(PEDIDO_DATE_FORMAT)
+    corte_risco = (referencia - pd.Timedelta(days=DIAS_RISCO + 1)).strftime(PEDIDO_DATE_FORMAT)
+    cur.execute(
+        f"""
+        UPDATE {RISCO_TABLE}
+        SET categoria = CASE
+              WHEN ultima_compra > %s THEN %s
+              WHEN ultima_compra > %s THEN %s
+              ELSE %s
+            END
+        """,
+        (corte_ativo, CATEGORIA_ATIVO, corte_risco, CATEGORIA_RISCO, CATEGORIA_PERDIDO),
+    )
+
+
+def carga_completa(conn, lojas, referencia, chunksize: int = RISCO_CHUNKSIZE) -> dict:
+    """
+    Reagrega `order` inteira (ou só `lojas`) numa staging e troca com a oficial.
+
+    Com `lojas`, a staging começa com as linhas das demais lojas.
+    """
+    cur = conn.cursor()
+    cur.execute(RISCO_DDL.format(tabela=RISCO_TABLE))
+    cur.execute(f"DROP TABLE IF EXISTS {RISCO_STAGE_TABLE}")
+    cur.execute(RISCO_DDL.format(tabela=RISCO_STAGE_TABLE))
+
+    if lojas:
+        placeholders = ", ".join(["%s"] * len(lojas))
+        cur.execute(
+            f"INSERT INTO {RISCO_STAGE_TABLE} ({', '.join(RISCO_COLS)}) "
+            f"SELECT {', '.join(RISCO_COLS)} FROM {RISCO_TABLE} "
+            f"WHERE companyId NOT IN ({placeholders})",
+            tuple(lojas),
+        )
+
+    n_pedidos = n_clientes = 0
+    for loja in listar_lojas(conn, lojas):
+        agregado, lidos = agregar_loja(conn, loja, chunksize)
+        linhas = montar_linhas(agregado, referencia)
+        _inserir_linhas(cur, RISCO_STAGE_TABLE, linhas)
+        n_pedidos += lidos
+        n_clientes += len(linhas)
+    conn.commit()
+
+    cur.execute(f"DROP TABLE IF EXISTS {RISCO_OLD_TABLE}")
+    cur.execute(
+        f"""
+        RENAME TABLE
+          {RISCO_TABLE} TO {RISCO_OLD_TABLE},
+          {RISCO_STAGE_TABLE} TO {RISCO_TABLE}
+        """
+    )
+    cur.execute(f"DROP TABLE {RISCO_OLD_TABLE}")
+    if lojas:
+        atualizar_categorias(cur, referencia)
+    conn.commit()
+    cur.close()
+
+    return {"modo": "completa", "pedidos_lidos": n_pedidos, "clientes": n_clientes}
+
+
+def carga_incremental(conn, lojas, watermarks, referencia, chunksize: int = RISCO_CHUNKSIZE) -> dict:
+    """
+    Reagrega só os clientes com pedidos em createdAt >= watermark da loja.
+
+    Lojas sem watermark não têm linhas na tabela: o agregado de todos os
+    pedidos da loja já é o final e entra direto.
+    """
+    n_delta = n_clientes = 0
+    por_loja, sem_watermark = [], []
+    for loja in listar_lojas(conn, lojas):
+        watermark = watermarks.get(loja)
+        delta, lidos = agregar_loja(conn, loja, chunksize, desde=watermark)
+        n_delta += lidos
+        if watermark is None:
+            sem_watermark.append(loja)
+            por_loja.append((loja, None, delta))
+        elif not delta.empty:
+            por_loja.append((loja, delta.index.get_level_values("customer").unique(), None))
+
+    cur = conn.cursor()
+    for loja, clientes, agregado in por_loja:
+        if agregado is None:
+            agregado = reagregar_clientes(conn, loja, clientes, chunksize)
+            _apagar_clientes(cur, loja, clientes)
+        linhas = montar_linhas(agregado, referencia)
+        _inserir_linhas(cur, RISCO_TABLE, linhas)
+        n_clientes += len(linhas)
+    atualizar_categorias(cur, referencia)
+    conn.commit()
+    cur.close()
+
+    return {
+        "modo": "incremental",
+        "watermarks": {loja: valor.isoformat() for loja, valor in sorted(watermarks.items())},
+        "lojas_completas": sem_watermark,
+        "pedidos_delta": n_delta,
+        "clientes": n_clientes,
+    }
+
+
+def atualizar_cliente_risco(
+    full_refresh: bool = False, lojas=None, chunksize: int = RISCO_CHUNKSIZE, referencia=None
+) -> dict:
+    """
+    Atualiza `cliente_risco`: completa na primeira vez (ou full_refresh=True),
+    incremental a partir do watermark de cada loja nas demais.
+
+    Limitação: pedidos inseridos com createdAt anterior ao watermark (carga
+    retroativa) e exclusões em `order` só entram num full_refresh.
+    """
+    referencia = pd.Timestamp(referencia) if referencia is not None else pd.Timestamp.now()
+    referencia = referencia.floor("s")
+
+    inicio = time.perf_counter()
+    conn = ia.get_connection()
+    try:
+        watermarks = {} if full_refresh else ler_watermarks(conn)
+        if not watermarks:
+            stats = carga_completa(conn, lojas, referencia, chunksize)
+        else:
+            stats = carga_incremental(conn, lojas, watermarks, referencia, chunksize)
+    finally:
+        conn.close()
+
+    stats["referencia"] = referencia.isoformat()
+    stats["segundos"] = round(time.perf_counter() - inicio, 4)
+    print(
+        f"`{RISCO_TABLE}`: carga {stats['modo']}, {stats['clientes']} clientes "
+        f"atualizados em {stats['segundos']}s."
+    )
+    return stats
+
+
+# MAIN
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Materializa recência/frequência/valor e risco de churn por cliente."
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Reagrega `order` inteira em vez de partir do watermark.",
+    )
+    parser.add_argument(
+        "--lojas",
+        nargs="+",
+        default=None,
+        help="Processa só estes companyId (ex.: EST001 EST004).",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=RISCO_CHUNKSIZE,
+        help="Pedidos por lote lido do cursor.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stats = atualizar_cliente_risco(
+        full_refresh=args.full_refresh, lojas=args.lojas, chunksize=args.chunksize
+    )
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"[ERRO] {e}")
+        sys.exit(1)
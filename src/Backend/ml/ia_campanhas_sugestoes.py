@@ -1,14 +1,40 @@
+import os
 import sys
 import json
+import time
+import argparse
+import tempfile
+import gzip
+import hashlib
+import queue
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import joblib
 import mysql.connector
+from mysql.connector import pooling
 import numpy as np
 import pandas as pd
+import sklearn
 
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+from joblib import Parallel, delayed
+
+# Opcionais: serializador rápido (fallback: json) e compressão zstd
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import StratifiedGroupKFold, StratifiedKFold, train_test_split
 from sklearn.metrics import (
     accuracy_score,
     f1_score,
@@ -16,27 +42,186 @@ from sklearn.metrics import (
 )
 
 # CONFIGURAÇÃO DO BANCO
+#
+# Valores padrão para desenvolvimento local; em produção use as mesmas
+# variáveis de ambiente do backend Node (config/db.js). O worker iniciado
+# pelo Node herda essas variáveis do processo pai.
 
 DB_CONFIG = {
-    "host": "localhost",      # ex: "localhost"
-    "user": "root",
-    "password": "",
-    "database": "cannoli",
+    "host": os.getenv("DB_HOST", "localhost"),      # ex: "localhost"
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "database": os.getenv("DB_NAME", "cannoli"),
 }
 
+DB_POOL_NAME = "cannoli_ml"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
 
 
 # CONEXÃO
 
-def get_connection():
-    """Abre conexão com MySQL usando DB_CONFIG. Retorna um objeto connection."""
-    return mysql.connector.connect(**DB_CONFIG)
+_pool = None
+
+
+def get_pool():
+    """Cria (na primeira chamada) e devolve o pool de conexões compartilhado."""
+    global _pool
+    if _pool is None:
+        _pool = pooling.MySQLConnectionPool(
+            pool_name=DB_POOL_NAME,
+            pool_size=DB_POOL_SIZE,
+            pool_reset_session=True,
+            **DB_CONFIG,
+        )
+    return _pool
+
+
+def get_connection(**opcoes):
+    """
+    Empresta uma conexão do pool (conn.close() devolve ao pool).
+
+    Antes de entregar, faz um ping com reconexão: conexões derrubadas pelo
+    servidor (wait_timeout) num worker de longa duração são refeitas aqui.
+
+    opcoes: parâmetros extras do mysql.connector (ex.: allow_local_infile=True).
+      Como o pool tem configuração fixa, abre uma conexão dedicada nesse caso.
+    """
+    if opcoes:
+        return mysql.connector.connect(**DB_CONFIG, **opcoes)
+
+    conn = get_pool().get_connection()
+    conn.ping(reconnect=True, attempts=3, delay=1)
+    return conn
 
 
 
 # CARREGAR CAMPANHAS
 
-def carregar_campanhas() -> pd.DataFrame:
+CAMPANHA_COLS = [
+    "id",
+    "storeId",
+    "name",
+    "status_desc",
+    "badge",
+    "type",
+    "_mes",
+    "createdAt",
+    "updatedAt",
+    "isDefault",
+]
+
+# Tipos declarados para o carregamento em lotes (evita colunas `object`)
+CAMPANHA_CAT_COLS = ["storeId", "badge", "type", "_mes", "status_desc"]
+
+# Tipo fixo das categorias de cada coluna. Sem isso o tipo sai dos dados do
+# lote (`type` vira float64 com NULL, int64 sem NULL, object se tudo NULL) e
+# union_categoricals recusa lotes com categorias de tipos diferentes.
+CAMPANHA_CAT_TIPOS = {
+    "storeId": "string",
+    "badge": "string",
+    "type": "Int64",
+    "_mes": "string",
+    "status_desc": "string",
+}
+CAMPANHA_DATE_COLS = ["createdAt", "updatedAt"]
+
+# Datas são TEXT no banco, no formato "dd/mm/aaaa hh:mm"
+CAMPANHA_DATE_FORMAT = "%d/%m/%Y %H:%M"
+
+CAMPANHA_QUERY = f"""
+    SELECT
+        {", ".join(CAMPANHA_COLS)}
+    FROM campaign
+"""
+
+
+def _como_categoria(serie: pd.Series, tipo: str) -> pd.Series:
+    """Categórica com categorias do tipo declarado, independente do lote."""
+    if tipo == "Int64":
+        serie = pd.to_numeric(serie, errors="coerce")
+    return serie.astype(tipo).astype("category")
+
+
+def _tipar_lote(df: pd.DataFrame) -> pd.DataFrame:
+    """Aplica os tipos declarados a um lote recém-lido do cursor."""
+    for col in CAMPANHA_CAT_COLS:
+        df[col] = _como_categoria(df[col], CAMPANHA_CAT_TIPOS[col])
+
+    for col in CAMPANHA_DATE_COLS:
+        df[col] = pd.to_datetime(
+            df[col].replace("", None),
+            format=CAMPANHA_DATE_FORMAT,
+            errors="coerce",
+        )
+
+    df["id"] = pd.to_numeric(df["id"], downcast="integer")
+    df["isDefault"] = pd.to_numeric(df["isDefault"], downcast="integer")
+    return df
+
+
+def _concatenar_lotes(lotes: list) -> pd.DataFrame:
+    """
+    Junta os lotes tipados sem voltar para `object`.
+
+    pd.concat de categóricas com categorias diferentes devolve `object`;
+    por isso as colunas categóricas são unidas com union_categoricals.
+    """
+    df = pd.concat(
+        [lote.drop(columns=CAMPANHA_CAT_COLS) for lote in lotes],
+        ignore_index=True,
+    )
+    for col in CAMPANHA_CAT_COLS:
+        df[col] = pd.api.types.union_categoricals([lote[col] for lote in lotes])
+
+    return df[CAMPANHA_COLS]
+
+
+def _carregar_campanhas_em_lotes(
+    conn, chunksize: int, where: str = "", params: tuple = ()
+) -> pd.DataFrame:
+    """
+    Lê a tabela campaign em lotes de `chunksize` linhas.
+
+    O cursor não-bufferizado mantém o resultado no servidor; cada lote é
+    convertido para tipos compactos antes do próximo fetch, então o pico
+    de memória fica em ~1 lote cru + o DataFrame final tipado.
+
+    where/params: filtro opcional (ex.: delta da carga incremental).
+    """
+    cur = conn.cursor(buffered=False)
+    cur.execute(CAMPANHA_QUERY + where, params)
+
+    lotes = []
+    while True:
+        rows = cur.fetchmany(chunksize)
+        if not rows:
+            break
+        lotes.append(_tipar_lote(pd.DataFrame(rows, columns=CAMPANHA_COLS)))
+
+    cur.close()
+
+    if not lotes:
+        return pd.DataFrame(columns=CAMPANHA_COLS)
+
+    return _concatenar_lotes(lotes)
+
+
+def _where_lojas(lojas, negar: bool = False) -> tuple:
+    """
+    Filtro SQL por storeId (vazio quando lojas é None).
+
+    negar: seleciona as demais lojas (NOT IN).
+    """
+    if not lojas:
+        return "", ()
+    placeholders = ", ".join(["%s"] * len(lojas))
+    operador = "NOT IN" if negar else "IN"
+    return f"\n    WHERE storeId {operador} ({placeholders})", tuple(lojas)
+
+
+def carregar_campanhas(chunksize: int | None = None, lojas=None) -> pd.DataFrame:
     """
     Lê a tabela campaign e devolve um DataFrame.
 
@@ -44,25 +229,23 @@ def carregar_campanhas() -> pd.DataFrame:
       id, storeId, name, status_desc, badge, type, _mes,
       createdAt, updatedAt, isDefault
 
-    Obs.: Ajustar o SELECT se o esquema divergir.
+    chunksize: se informado, lê em lotes por cursor não-bufferizado e já
+      devolve categóricas (storeId, badge, type, _mes, status_desc) e
+      datas convertidas (createdAt, updatedAt).
+    lojas: lista de storeId; se informada, só essas lojas são lidas do banco.
+
+    Obs.: Ajustar CAMPANHA_COLS se o esquema divergir.
     """
+    where, params = _where_lojas(lojas)
+
     conn = get_connection()
-    query = """
-        SELECT
-            id,
-            storeId,
-            name,
-            status_desc,
-            badge,
-            type,
-            _mes,
-            createdAt,
-            updatedAt,
-            isDefault
-        FROM campaign
-    """
-    df = pd.read_sql(query, conn)
-    conn.close()
+    try:
+        if chunksize:
+            df = _carregar_campanhas_em_lotes(conn, chunksize, where=where, params=params)
+        else:
+            df = pd.read_sql(CAMPANHA_QUERY + where, conn, params=params or None)
+    finally:
+        conn.close()
 
     if df.empty:
         # Falha controlada para evitar treino sem dados
@@ -71,26 +254,173 @@ def carregar_campanhas() -> pd.DataFrame:
     return df
 
 
+# SNAPSHOT INCREMENTAL (cache local de `campaign`)
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / "cache"
+SNAPSHOT_PATH = SNAPSHOT_DIR / "campaign_snapshot.parquet"
+SNAPSHOT_META_PATH = SNAPSHOT_DIR / "campaign_snapshot.json"
+
+SNAPSHOT_CHUNKSIZE = 50_000
+
+# Equivalente MySQL de CAMPANHA_DATE_FORMAT (usado no filtro do delta)
+CAMPANHA_DATE_FORMAT_SQL = "%d/%m/%Y %H:%i"
+
+# `>=` (e não `>`) porque updatedAt tem resolução de minuto: uma alteração
+# no mesmo minuto da watermark ainda precisa entrar. A linha da fronteira
+# volta em toda execução e é descartada por _descartar_inalteradas.
+#
+# Custo: updatedAt é TEXT "dd/mm/aaaa hh:mm", que não ordena como data,
+# então o filtro não usa índice e o MySQL varre `campaign` inteira a cada
+# delta (só as linhas do delta trafegam). Deixar o filtro sargable exige
+# uma coluna DATETIME indexada (ex.: gerada a partir de updatedAt).
+DELTA_WHERE = """
+    WHERE STR_TO_DATE(updatedAt, %s) >= %s
+"""
+
+
+def _ler_snapshot():
+    """Devolve (df, watermark) do snapshot local, ou (None, None) se não existir."""
+    if not (SNAPSHOT_PATH.exists() and SNAPSHOT_META_PATH.exists()):
+        return None, None
+
+    with SNAPSHOT_META_PATH.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    df = pd.read_parquet(SNAPSHOT_PATH)
+
+    # Parquet não preserva categóricas de categorias inteiras (ex.: `type`);
+    # mesmo tipo de categorias do delta, para o union_categoricals do merge
+    for col in CAMPANHA_CAT_COLS:
+        df[col] = _como_categoria(df[col], CAMPANHA_CAT_TIPOS[col])
+
+    return df, pd.Timestamp(meta["watermark_updatedAt"])
+
+
+def _gravar_snapshot(df: pd.DataFrame) -> pd.Timestamp:
+    """Grava snapshot + watermark (arquivo temporário e rename, para não corromper)."""
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+
+    watermark = df["updatedAt"].max()
+    if pd.isna(watermark):
+        watermark = pd.Timestamp.min
+
+    tmp_path = SNAPSHOT_PATH.with_suffix(".parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    tmp_path.replace(SNAPSHOT_PATH)
+
+    meta = {
+        "watermark_updatedAt": watermark.isoformat(),
+        "n_linhas": int(len(df)),
+        "atualizado_em": pd.Timestamp.now().isoformat(),
+    }
+    tmp_meta = SNAPSHOT_META_PATH.with_suffix(".json.tmp")
+    with tmp_meta.open("w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    tmp_meta.replace(SNAPSHOT_META_PATH)
+
+    return watermark
+
+
+def _descartar_inalteradas(df_snap: pd.DataFrame, df_delta: pd.DataFrame) -> pd.DataFrame:
+    """Remove do delta as linhas idênticas às do snapshot (mesmo `id`)."""
+    delta = df_delta.set_index("id")
+    comuns = delta.index.intersection(df_snap["id"])
+    if comuns.empty:
+        return df_delta
+
+    # astype(str): categóricas do snapshot e do delta têm categorias diferentes
+    antes = df_snap.set_index("id").loc[comuns, delta.columns].astype(str)
+    depois = delta.loc[comuns].astype(str)
+    iguais = ((antes == depois) | (antes.isna() & depois.isna())).all(axis=1)
+    return df_delta[~df_delta["id"].isin(iguais.index[iguais])].reset_index(drop=True)
+
+
+def carregar_campanhas_incremental(
+    full_refresh: bool = False, chunksize: int = SNAPSHOT_CHUNKSIZE
+) -> pd.DataFrame:
+    """
+    Mesma saída de carregar_campanhas(chunksize=...), mas servida por um
+    snapshot Parquet local em ml/cache.
+
+    - Primeira execução (ou full_refresh=True): lê a tabela inteira.
+    - Demais: busca só linhas com updatedAt >= watermark e faz merge por `id`
+      (a linha do delta substitui a do snapshot). Linhas que voltaram sem
+      alteração são descartadas; sem nada novo o snapshot não é regravado.
+
+    Limitações: exclusões no banco e linhas sem updatedAt válido só são
+    refletidas em um full_refresh.
+    """
+    df_snap, watermark = (None, None) if full_refresh else _ler_snapshot()
+
+    conn = get_connection()
+    try:
+        if df_snap is None:
+            print("Snapshot: carga completa da tabela `campaign`.")
+            df = _carregar_campanhas_em_lotes(conn, chunksize)
+        else:
+            df_delta = _carregar_campanhas_em_lotes(
+                conn,
+                chunksize,
+                where=DELTA_WHERE,
+                params=(CAMPANHA_DATE_FORMAT_SQL, watermark.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+    finally:
+        conn.close()
+
+    if df_snap is not None:
+        if not df_delta.empty:
+            df_delta = _descartar_inalteradas(df_snap, df_delta)
+        print(f"Snapshot: {len(df_delta)} linhas novas/alteradas desde {watermark}.")
+
+        if df_delta.empty:
+            df = df_snap
+        else:
+            df = _concatenar_lotes([df_snap, df_delta])
+            df = df.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+
+    if df.empty:
+        raise RuntimeError("Nenhuma campanha encontrada na tabela `campaign`.")
+
+    if df is not df_snap:
+        _gravar_snapshot(df)
+
+    return df
+
  
 # FEATURE ENGINEERING
 
-def adicionar_features(df: pd.DataFrame) -> pd.DataFrame:
+def _preencher(serie: pd.Series, valor: str) -> pd.Series:
+    """fillna que também funciona em colunas categóricas (carga em lotes)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        if valor not in serie.cat.categories:
+            serie = serie.cat.add_categories([valor])
+    return serie.fillna(valor)
+
+
+def adicionar_features(df: pd.DataFrame, copiar: bool = True) -> pd.DataFrame:
     """
     Cria variáveis derivadas para melhorar o poder preditivo.
     Importante: não remove colunas originais (mantém rastreabilidade).
+
+    copiar: False altera `df` no lugar (quando o chamador já tem uma cópia própria).
     """
-    df = df.copy()
+    if copiar:
+        df = df.copy()
 
     # Normalização de categorias textuais (reduz nulos e padroniza)
-    df["status_desc"] = df["status_desc"].fillna("(sem status)")
-    df["badge"] = df["badge"].fillna("(sem badge)")
-    df["type"] = df["type"].fillna("(sem tipo)")
+    df["status_desc"] = _preencher(df["status_desc"], "(sem status)")
+    df["badge"] = _preencher(df["badge"], "(sem badge)")
+    # `type` como categoria Int64 em todos os carregadores: o read_sql devolve
+    # float com NULL ("1.0" no vocabulário) e a carga em lotes, Int64 ("1")
+    df["type"] = _preencher(_como_categoria(df["type"], CAMPANHA_CAT_TIPOS["type"]), "(sem tipo)")
     df["_mes"] = df["_mes"].astype(str)
     df["storeId"] = df["storeId"].astype(str)
 
-    # Conversão de datas (erros coerçidos para NaT)
-    for col in ["createdAt", "updatedAt"]:
-        df[col] = pd.to_datetime(df[col], errors="coerce")
+    # Conversão de datas (erros coerçidos para NaT). Mesmo formato da carga
+    # em lotes, para que as features não dependam do caminho de leitura.
+    for col in CAMPANHA_DATE_COLS:
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=CAMPANHA_DATE_FORMAT, errors="coerce")
 
     # Medida de "tempo em atividade" como proxy de maturidade
     df["dias_ativos"] = (df["updatedAt"] - df["createdAt"]).dt.days
@@ -109,60 +439,542 @@ def adicionar_features(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# AGREGADOS DE DESEMPENHO (campaign_queue e order)
+#
+# Sinais de desempenho por campanha calculados no MySQL (GROUP BY), sem
+# trazer as linhas cruas de campaign_queue/order para o pandas:
+#   fila_total / fila_enviadas / fila_erros   mensagens por status
+#   latencia_envio_min                        média de sendAt - scheduledAt
+#   pedidos_janela / receita_janela           pedidos do cliente na mesma loja
+#                                             até AGREGADOS_JANELA_DIAS após o envio
+#                                             (cada pedido conta uma vez por campanha)
+# As consultas rodam loja a loja em paralelo (uma conexão do pool por
+# thread). O resultado é guardado por partição `_mes` da fila em
+# ml/cache/agregados/<_mes>.parquet com somas/contagens (combináveis entre
+# meses); só meses sem cache e os AGREGADOS_MESES_ABERTOS mais recentes são
+# recalculados. juntar_agregados() cruza o total por campanha com `campaign`.
+
+AGREGADOS_DIR = SNAPSHOT_DIR / "agregados"
+AGREGADOS_JANELA_DIAS = 7
+AGREGADOS_MESES_ABERTOS = 2  # o mês corrente e o anterior ainda recebem envios/pedidos
+
+# Códigos de campaign_queue.status (status_desc entre parênteses)
+FILA_STATUS_ENVIADA = (2, 3, 4)  # Enviada, Entregue, Lida
+FILA_STATUS_ERRO = (5,)  # Erro
+
+# Formato ISO de order.createdAt (TEXT), para comparar como texto
+PEDIDO_DATE_FORMAT_SQL = "%Y-%m-%d %H:%i:%s"
+
+AGREGADOS_SOMA_COLS = [
+    "fila_total",
+    "fila_enviadas",
+    "fila_erros",
+    "latencia_soma_min",
+    "latencia_n",
+    "pedidos_janela",
+    "receita_janela_num",
+]
+
+AGREGADO_FEATURE_COLS = [
+    "fila_total",
+    "fila_enviadas",
+    "fila_erros",
+    "taxa_erro_envio",
+    "latencia_envio_min",
+    "pedidos_janela",
+    "receita_janela",
+    "pedidos_por_envio",
+]
+
+_LATENCIA_SQL = "TIMESTAMPDIFF(MINUTE, STR_TO_DATE(scheduledAt, %s), STR_TO_DATE(sendAt, %s))"
+
+FILA_AGREGADOS_QUERY = f"""
+    SELECT
+        campaignId,
+        _mes,
+        COUNT(*) AS fila_total,
+        SUM(CASE WHEN status IN ({", ".join(map(str, FILA_STATUS_ENVIADA))}) THEN 1 ELSE 0 END) AS fila_enviadas,
+        SUM(CASE WHEN status IN ({", ".join(map(str, FILA_STATUS_ERRO))}) THEN 1 ELSE 0 END) AS fila_erros,
+        SUM({_LATENCIA_SQL}) AS latencia_soma_min,
+        COUNT({_LATENCIA_SQL}) AS latencia_n
+    FROM campaign_queue
+    WHERE storeId = %s AND campaignId IS NOT NULL
+"""
+
+# Um cliente com várias mensagens da mesma campanha casa o mesmo pedido em
+# várias linhas do JOIN: a subconsulta reduz a (campanha, pedido) e atribui o
+# pedido ao primeiro `_mes` em que casou, para não contá-lo duas vezes nem
+# entre partições (as partições são somadas em carregar_agregados).
+PEDIDOS_AGREGADOS_QUERY = f"""
+    SELECT
+        campaignId,
+        _mes,
+        COUNT(*) AS pedidos_janela,
+        SUM(valor) AS receita_janela_num
+    FROM (
+        SELECT q.campaignId, MIN(q._mes) AS _mes, MAX(o.totalAmount_num) AS valor
+        FROM campaign_queue q
+        JOIN `order` o
+          ON o.customer = q.customerId
+         AND o.companyId = q.storeId
+         AND o.createdAt >= DATE_FORMAT(STR_TO_DATE(q.sendAt, %s), %s)
+         AND o.createdAt < DATE_FORMAT(DATE_ADD(STR_TO_DATE(q.sendAt, %s), INTERVAL %s DAY), %s)
+        WHERE q.storeId = %s
+          AND q.campaignId IS NOT NULL
+          AND q.status IN ({", ".join(map(str, FILA_STATUS_ENVIADA))})
+          AND (o.isTest IS NULL OR o.isTest <> 'True')
+          AND q._mes IN ({{meses_janela}})
+        GROUP BY q.campaignId, o.id
+    ) p
+    WHERE _mes IN ({{meses}})
+    GROUP BY campaignId, _mes
+"""
+
+
+def _filtro_meses(coluna: str, meses) -> str:
+    """Filtro por partição `_mes` + GROUP BY (campanha, mês) da consulta da fila."""
+    prefixo = coluna.removesuffix("_mes")
+    return (
+        f"      AND {coluna} IN ({', '.join(['%s'] * len(meses))})\n"
+        f"    GROUP BY {prefixo}campaignId, {coluna}"
+    )
+
+
+def _com_mes_anterior(meses) -> tuple:
+    """
+    Meses + o mês anterior de cada um: um pedido casado por envios dos dois
+    lados da virada do mês (janela de AGREGADOS_JANELA_DIAS) fica no anterior.
+    """
+    anteriores = {(pd.Period(mes, "M") - 1).strftime("%Y-%m") for mes in meses}
+    return tuple(sorted(set(meses) | anteriores))
+
+
+def _agregar_loja(loja: str, meses) -> pd.DataFrame:
+    """Duas consultas agrupadas (fila e pedidos na janela) de uma loja."""
+    meses = tuple(meses)
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            FILA_AGREGADOS_QUERY + _filtro_meses("_mes", meses),
+            (CAMPANHA_DATE_FORMAT_SQL,) * 4 + (loja,) + meses,
+        )
+        fila = pd.DataFrame(
+            cur.fetchall(),
+            columns=["campaignId", "_mes", "fila_total", "fila_enviadas", "fila_erros",
+                     "latencia_soma_min", "latencia_n"],
+        )
+        meses_janela = _com_mes_anterior(meses)
+        cur.execute(
+            PEDIDOS_AGREGADOS_QUERY.format(
+                meses_janela=", ".join(["%s"] * len(meses_janela)),
+                meses=", ".join(["%s"] * len(meses)),
+            ),
+            (
+                CAMPANHA_DATE_FORMAT_SQL, PEDIDO_DATE_FORMAT_SQL,
+                CAMPANHA_DATE_FORMAT_SQL, AGREGADOS_JANELA_DIAS, PEDIDO_DATE_FORMAT_SQL,
+                loja,
+            ) + meses_janela + meses,
+        )
+        pedidos = pd.DataFrame(
+            cur.fetchall(), columns=["campaignId", "_mes", "pedidos_janela", "receita_janela_num"]
+        )
+    finally:
+        cur.close()
+        conn.close()
+
+    return fila.merge(pedidos, on=["campaignId", "_mes"], how="left")
+
+
+def _meses_da_fila(lojas=None) -> pd.DataFrame:
+    """Pares (storeId, _mes) existentes em campaign_queue."""
+    where, params = _where_lojas(lojas)
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT DISTINCT storeId, _mes FROM campaign_queue" + where, params)
+        pares = pd.DataFrame(cur.fetchall(), columns=["storeId", "_mes"])
+    finally:
+        cur.close()
+        conn.close()
+    return pares.dropna()
+
+
+def _ler_agregados_mes(mes: str):
+    path = AGREGADOS_DIR / f"{mes}.parquet"
+    return pd.read_parquet(path) if path.exists() else None
+
+
+def _gravar_agregados_mes(mes: str, df: pd.DataFrame):
+    """Grava a partição do mês (arquivo temporário e rename)."""
+    AGREGADOS_DIR.mkdir(parents=True, exist_ok=True)
+    path = AGREGADOS_DIR / f"{mes}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    tmp_path.replace(path)
+
+
+def carregar_agregados(lojas=None, workers: int = -1, full_refresh: bool = False) -> pd.DataFrame:
+    """
+    Agregados de desempenho por campanha (uma linha por campaignId, com as
+    colunas de AGREGADOS_SOMA_COLS somadas em todos os meses).
+
+    lojas: só essas lojas são consultadas; as partições recalculadas ficam
+      incompletas, então não são gravadas no cache.
+    workers: consultas simultâneas (limitado ao tamanho do pool; -1 = pool todo).
+    full_refresh: ignora o cache e recalcula todos os meses.
+    """
+    pares = _meses_da_fila(lojas)
+    meses = sorted(pares["_mes"].unique())
+    abertos = set(meses[-AGREGADOS_MESES_ABERTOS:])
+
+    partes, recalcular = [], []
+    for mes in meses:
+        cache = None if (full_refresh or mes in abertos) else _ler_agregados_mes(mes)
+        if cache is None:
+            recalcular.append(mes)
+        else:
+            partes.append(cache)
+
+    if recalcular:
+        por_loja = (
+            pares[pares["_mes"].isin(recalcular)].groupby("storeId")["_mes"].agg(list).to_dict()
+        )
+        n_threads = DB_POOL_SIZE if workers in (None, -1) else max(1, min(workers, DB_POOL_SIZE))
+        print(
+            f"Agregados: recalculando {len(recalcular)} mês(es) em {len(por_loja)} lojas "
+            f"({n_threads} consultas simultâneas)."
+        )
+        with ThreadPoolExecutor(n_threads) as pool:
+            novos = list(pool.map(_agregar_loja, por_loja.keys(), por_loja.values()))
+
+        novos = pd.concat(novos, ignore_index=True)
+        for col in AGREGADOS_SOMA_COLS:
+            novos[col] = pd.to_numeric(novos[col]).fillna(0)
+        novos["campaignId"] = novos["campaignId"].astype(np.int64)
+
+        for mes in recalcular:
+            parte = novos.loc[novos["_mes"] == mes, ["campaignId", *AGREGADOS_SOMA_COLS]]
+            partes.append(parte)
+            if not lojas:
+                _gravar_agregados_mes(mes, parte.reset_index(drop=True))
+
+    if not partes:
+        return pd.DataFrame(columns=AGREGADOS_SOMA_COLS, index=pd.Index([], name="campaignId"))
+
+    return pd.concat(partes, ignore_index=True).groupby("campaignId")[AGREGADOS_SOMA_COLS].sum()
+
+
+def juntar_agregados(df: pd.DataFrame, agregados: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta AGREGADO_FEATURE_COLS a `df` (campaign) pelo id da campanha.
+    Campanhas sem mensagens na fila ficam com zeros.
+    """
+    soma = agregados.reindex(df["id"].to_numpy()).fillna(0)
+    enviadas = soma["fila_enviadas"].to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        extras = {
+            "fila_total": soma["fila_total"].to_numpy(),
+            "fila_enviadas": enviadas,
+            "fila_erros": soma["fila_erros"].to_numpy(),
+            "taxa_erro_envio": np.nan_to_num(soma["fila_erros"].to_numpy() / soma["fila_total"].to_numpy()),
+            "latencia_envio_min": np.nan_to_num(
+                soma["latencia_soma_min"].to_numpy() / soma["latencia_n"].to_numpy()
+            ),
+            "pedidos_janela": soma["pedidos_janela"].to_numpy(),
+            "receita_janela": soma["receita_janela_num"].to_numpy() / 100,
+            "pedidos_por_envio": np.nan_to_num(soma["pedidos_janela"].to_numpy() / enviadas),
+        }
+
+    return df.assign(**extras)
+
+
+# CODIFICAÇÃO CATEGÓRICA
+#
+# Cada coluna categórica tem um vocabulário: pd.Index ordenado com as
+# categorias vistas no treino (mesma ordem/códigos do antigo LabelEncoder).
+# É ajustado uma vez, salvo junto do modelo, e codificar() faz o lookup por
+# hash de forma vetorizada. Valores fora do vocabulário (loja/badge novos no
+# score) recebem CODIGO_DESCONHECIDO em vez de erro.
+
+CODIGO_DESCONHECIDO = -1
+
+
+def _categorias_e_codigos(serie: pd.Series):
+    """
+    Fatora a Série em (categorias como texto, código por linha).
+
+    Colunas category (carga em lotes/snapshot) já vêm fatoradas e só as
+    categorias são convertidas; as demais passam por pd.factorize. Nulos
+    viram a categoria "nan", como no astype(str) usado antes.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        categorias = serie.cat.categories.astype(str)
+    else:
+        codigos, categorias = pd.factorize(serie)
+        categorias = categorias.astype(str)
+
+    if (codigos == -1).any():
+        codigos = np.where(codigos == -1, len(categorias), codigos)
+        categorias = categorias.append(pd.Index(["nan"]))
+    return categorias, codigos
+
+
+def ajustar_vocabulario(serie: pd.Series) -> pd.Index:
+    """Vocabulário (categorias observadas, ordenadas) de uma coluna."""
+    categorias, codigos = _categorias_e_codigos(serie)
+    vistas = categorias[np.unique(codigos)]
+    return pd.Index(vistas.unique(), dtype=object).sort_values()
+
+
+def codificar(serie: pd.Series, vocabulario: pd.Index) -> np.ndarray:
+    """Posição de cada valor no vocabulário; não vistos -> CODIGO_DESCONHECIDO."""
+    categorias, codigos = _categorias_e_codigos(serie)
+    mapa = vocabulario.get_indexer(categorias)
+    mapa[mapa == -1] = CODIGO_DESCONHECIDO
+    return mapa[codigos]
+
+
+def _como_vocabulario(encoder) -> pd.Index:
+    """Aceita modelos antigos do registro, salvos com LabelEncoder."""
+    if hasattr(encoder, "classes_"):
+        return pd.Index(encoder.classes_, dtype=object)
+    return encoder
+
+
 # TREINAR MODELO
-def treinar_modelo(df: pd.DataFrame):
+
+CAT_FEATURE_COLS = ["storeId", "badge", "type", "_mes"]
+NUM_FEATURE_COLS = [
+    "dias_ativos",
+    "mes_criacao_num",
+    "tam_nome",
+    "tem_badge",
+    "isDefault",
+]
+
+
+def preparar_treino(df: pd.DataFrame, compactar: bool = False):
     """
-    Treina RandomForest para prever status_desc.
+    Filtra linhas com alvo, aplica features e ajusta os vocabulários.
+
+    compactar: devolve df_feat enxuto (ver compactar_features).
 
     Retorna:
-      model: classificador treinado
-      encoders: dicionário com LabelEncoders (features categóricas + alvo)
-      df_feat: DataFrame com features + colunas auxiliares (__id, __name, __storeId_raw)
+      df_feat: DataFrame codificado + colunas auxiliares (__id, __name, __storeId_raw)
+      encoders: dicionário com vocabulários (features categóricas + alvo)
+      y: alvo codificado (np.ndarray)
       feature_cols: lista de colunas usadas como X
-      metrics: dicionário de métricas (para persistência em JSON)
     """
-    df = df.copy()
-
-    # Garantia de alvo presente (evita label encoder vazio)
+    # Garantia de alvo presente (evita vocabulário do alvo vazio).
+    # O filtro já devolve um DataFrame novo: daqui em diante altera no lugar.
     df = df[df["status_desc"].notna()].reset_index(drop=True)
     if df.empty:
         raise RuntimeError("Não há status_desc válidos para treinar o modelo.")
 
     # Engenharia de atributos
-    df = adicionar_features(df)
+    df = adicionar_features(df, copiar=False)
 
     # Guardar identificadores para pós-predição
     ids = df["id"].astype(int)
     nomes = df["name"].fillna("").astype(str)
     store_ids_raw = df["storeId"].astype(str)
 
-    # Codificação de categorias (LabelEncoder por coluna)
-    cat_cols = ["storeId", "badge", "type", "_mes"]
+    # Codificação de categorias (um vocabulário por coluna)
+    cat_cols = CAT_FEATURE_COLS
     encoders = {}
 
     for col in cat_cols:
-        le = LabelEncoder()
-        df[col] = df[col].astype(str)
-        df[col] = le.fit_transform(df[col])
-        encoders[col] = le
+        encoders[col] = ajustar_vocabulario(df[col])
+        df[col] = codificar(df[col], encoders[col])
 
     # Alvo
     target_col = "status_desc"
-    y_text = df[target_col].astype(str)
-
-    enc_status = LabelEncoder()
-    y = enc_status.fit_transform(y_text)
-    encoders[target_col] = enc_status
-
-    # Seleção de variáveis preditoras (X)
-    feature_cols = cat_cols + [
-        "dias_ativos",
-        "mes_criacao_num",
-        "tam_nome",
-        "tem_badge",
-        "isDefault",
+    encoders[target_col] = ajustar_vocabulario(df[target_col])
+    y = codificar(df[target_col], encoders[target_col])
+
+    # Seleção de variáveis preditoras (X); agregados entram se foram juntados
+    feature_cols = cat_cols + NUM_FEATURE_COLS + [
+        col for col in AGREGADO_FEATURE_COLS if col in df.columns
     ]
-    X = df[feature_cols]
+
+    # df_feat mantém contexto para geração de sugestões
+    df_feat = df
+    df_feat["__id"] = ids
+    df_feat["__name"] = nomes
+    df_feat["__storeId_raw"] = store_ids_raw
+
+    if compactar:
+        df_feat = compactar_features(df_feat, feature_cols)
+
+    return df_feat, encoders, y, feature_cols
+
+
+def compactar_features(df_feat: pd.DataFrame, feature_cols) -> pd.DataFrame:
+    """
+    Reduz df_feat ao necessário para pontuar, com tipos estreitos:
+      - descarta as colunas originais de texto/data
+      - features numéricas/codificadas -> menor int (int8/16/32) ou float32
+      - __id -> menor inteiro; __storeId_raw -> category; __name -> string
+    """
+    df = df_feat[list(feature_cols) + ["__id", "__name", "__storeId_raw"]]
+
+    for col in feature_cols:
+        tipo = "integer" if pd.api.types.is_integer_dtype(df[col]) else "float"
+        df[col] = pd.to_numeric(df[col], downcast=tipo)
+
+    df["__id"] = pd.to_numeric(df["__id"], downcast="integer")
+    df["__storeId_raw"] = df["__storeId_raw"].astype("category")
+    df["__name"] = df["__name"].astype("string")
+    return df
+
+
+def matriz_features(df_feat: pd.DataFrame, feature_cols) -> np.ndarray:
+    """
+    X como uma única matriz float32 contígua.
+
+    É o formato interno das árvores do sklearn: passar assim evita a
+    conversão/cópia que o fit/predict faria a cada chamada.
+    """
+    return np.ascontiguousarray(df_feat[feature_cols].to_numpy(dtype=np.float32))
+
+
+ENGINES = ["rf", "rf_adaptativo", "hgb"]
+
+# Hiperparâmetros conservadores para evitar overfitting inicial
+RF_PARAMS = {
+    "n_estimators": 300,
+    "max_depth": 8,
+    "class_weight": "balanced",
+    "random_state": 42,
+}
+HGB_PARAMS = {
+    "max_iter": 300,
+    "max_depth": 8,
+    "learning_rate": 0.1,
+    "early_stopping": True,
+    "class_weight": "balanced",
+    "random_state": 42,
+}
+
+# Floresta adaptativa: cresce de RF_PASSO em RF_PASSO árvores até o F1 OOB
+# parar de melhorar (ganho < RF_TOLERANCIA por RF_PACIENCIA passos seguidos)
+RF_PASSO = 50
+RF_MAX_ARVORES = 500
+RF_TOLERANCIA = 0.002
+RF_PACIENCIA = 2
+
+
+def _f1_oob(model, y_train) -> float:
+    """F1 ponderado das previsões out-of-bag (linhas sem voto OOB são ignoradas)."""
+    oob = model.oob_decision_function_
+    validas = ~np.isnan(oob).any(axis=1)
+    y_oob = model.classes_[oob[validas].argmax(axis=1)]
+    return float(f1_score(y_train[validas], y_oob, average="weighted"))
+
+
+def _treinar_rf_adaptativo(X_train, y_train, n_jobs):
+    """Cresce a floresta com warm_start e para quando o F1 OOB estabiliza."""
+    model = RandomForestClassifier(
+        **{**RF_PARAMS, "n_estimators": RF_PASSO},
+        n_jobs=n_jobs,
+        warm_start=True,
+        oob_score=True,
+    )
+    y_train = np.asarray(y_train)
+
+    curva = []
+    melhor, sem_ganho = -1.0, 0
+    while True:
+        model.fit(X_train, y_train)
+        f1_oob = _f1_oob(model, y_train)
+        curva.append({"n_arvores": model.n_estimators, "f1_oob": round(f1_oob, 4)})
+
+        sem_ganho = sem_ganho + 1 if f1_oob - melhor < RF_TOLERANCIA else 0
+        melhor = max(melhor, f1_oob)
+        if sem_ganho >= RF_PACIENCIA or model.n_estimators >= RF_MAX_ARVORES:
+            break
+        model.n_estimators += RF_PASSO
+
+    return model, {"curva_oob": curva}
+
+
+def construir_modelo(engine, X_train, y_train, n_jobs=-1):
+    """
+    Treina o classificador escolhido e devolve (model, info).
+
+    engine:
+      rf            -> RandomForest fixo (300 árvores, comportamento original)
+      rf_adaptativo -> RandomForest com warm_start + parada por F1 OOB
+      hgb           -> HistGradientBoosting (histogramas, early stopping quando
+                       toda classe tem 2+ exemplos)
+
+    info traz engine, tamanho final (árvores/iterações) e tempo de treino.
+    """
+    inicio = time.perf_counter()
+    info = {"engine": engine}
+
+    if engine == "rf_adaptativo":
+        model, extra = _treinar_rf_adaptativo(X_train, y_train, n_jobs)
+        info.update(extra)
+        info["n_arvores"] = int(model.n_estimators)
+    elif engine == "hgb":
+        params = dict(HGB_PARAMS)
+        # O early stopping separa uma validação estratificada interna, que
+        # exige ao menos 2 exemplos por classe (lojas pequenas/desbalanceadas)
+        if np.unique(y_train, return_counts=True)[1].min() < 2:
+            params["early_stopping"] = False
+        model = HistGradientBoostingClassifier(**params)
+        model.fit(X_train, y_train)
+        info["n_iteracoes"] = int(model.n_iter_)
+        info["early_stopping"] = params["early_stopping"]
+    elif engine == "rf":
+        model = RandomForestClassifier(**RF_PARAMS, n_jobs=n_jobs)
+        model.fit(X_train, y_train)
+        info["n_arvores"] = int(model.n_estimators)
+    else:
+        raise ValueError(f"Engine desconhecida: {engine!r} (opções: {ENGINES})")
+
+    info["tempo_treino_s"] = round(time.perf_counter() - inicio, 4)
+    return model, info
+
+
+def hiperparametros(engine: str) -> dict:
+    """Configuração efetiva de construir_modelo(engine) (chave de cache da avaliação)."""
+    if engine == "rf":
+        return dict(RF_PARAMS)
+    if engine == "hgb":
+        return dict(HGB_PARAMS)
+    if engine == "rf_adaptativo":
+        return {
+            **{k: v for k, v in RF_PARAMS.items() if k != "n_estimators"},
+            "passo": RF_PASSO,
+            "max_arvores": RF_MAX_ARVORES,
+            "tolerancia": RF_TOLERANCIA,
+            "paciencia": RF_PACIENCIA,
+        }
+    raise ValueError(f"Engine desconhecida: {engine!r} (opções: {ENGINES})")
+
+
+def treinar_modelo(df: pd.DataFrame, engine: str = "rf", compactar: bool = False):
+    """
+    Treina o classificador (RandomForest por padrão) para prever status_desc.
+
+    engine: ver construir_modelo.
+    compactar: modo de baixa memória (ver compactar_features).
+
+    Retorna:
+      model: classificador treinado
+      encoders: dicionário com vocabulários (features categóricas + alvo)
+      df_feat: DataFrame com features + colunas auxiliares (__id, __name, __storeId_raw)
+      feature_cols: lista de colunas usadas como X
+      metrics: dicionário de métricas (para persistência em JSON)
+    """
+    df_feat, encoders, y, feature_cols = preparar_treino(df, compactar=compactar)
+    classes = list(encoders["status_desc"])
+    X = matriz_features(df_feat, feature_cols)
 
     # Divisão estratificada (melhor representação das classes no teste)
     X_train, X_test, y_train, y_test = train_test_split(
@@ -173,16 +985,7 @@ def treinar_modelo(df: pd.DataFrame):
         stratify=y,
     )
 
-    # Hiperparâmetros conservadores para evitar overfitting inicial
-    model = RandomForestClassifier(
-        n_estimators=300,
-        max_depth=8,
-        class_weight="balanced",
-        random_state=42,
-        n_jobs=-1,
-    )
-
-    model.fit(X_train, y_train)
+    model, treino_info = construir_modelo(engine, X_train, y_train)
 
     # Avaliação objetiva (acurácia + F1 ponderado)
     y_pred = model.predict(X_test)
@@ -193,180 +996,2056 @@ def treinar_modelo(df: pd.DataFrame):
     report_dict = classification_report(
         y_test,
         y_pred,
-        target_names=enc_status.classes_,
+        target_names=classes,
         output_dict=True,
         zero_division=0,
     )
     report_text = classification_report(
         y_test,
         y_pred,
-        target_names=enc_status.classes_,
+        target_names=classes,
         zero_division=0,
     )
 
     print("\n===== MÉTRICAS DO MODELO =====")
     print("Acurácia:", round(acc, 3))
     print("F1 (weighted):", round(f1w, 3))
+    print(f"Engine: {engine} | treino: {treino_info['tempo_treino_s']}s")
     print("\nRelatório por classe:")
     print(report_text)
 
     metrics = {
         "accuracy": float(acc),
         "f1_weighted": float(f1w),
-        "classes": list(enc_status.classes_),
+        "classes": classes,
         "classification_report": report_dict,
         "classification_report_text": report_text,
-        "n_samples_total": int(len(df)),
+        "n_samples_total": int(len(df_feat)),
         "n_samples_train": int(len(X_train)),
         "n_samples_test": int(len(X_test)),
+        "treino": treino_info,
     }
 
-    # df_feat mantém contexto para geração de sugestões
-    df_feat = df.copy()
-    df_feat["__id"] = ids
-    df_feat["__name"] = nomes
-    df_feat["__storeId_raw"] = store_ids_raw
-
     return model, encoders, df_feat, feature_cols, metrics
 
 
-# GERAR SUGESTÕES
-def gerar_sugestoes(df_feat: pd.DataFrame, feature_cols, model, encoders):
+# PREPARAR FEATURES PARA SCORE (modelo já treinado)
+def preparar_features(
+    df: pd.DataFrame, encoders: dict, feature_cols, compactar: bool = False, copiar: bool = True
+) -> pd.DataFrame:
     """
-    Produz recomendações por campanha com base nas probabilidades do modelo.
+    Repete a engenharia de atributos de treinar_modelo usando os vocabulários
+    salvos (categorias novas recebem CODIGO_DESCONHECIDO).
 
-    Saída (lista de dicts):
-      campaignId, storeId, name, status_previsto, confianca, grupo
-    """
-    X_full = df_feat[feature_cols]
-    probs = model.predict_proba(X_full)
-    y_pred = model.predict(X_full)
+    Diferente do treino, mantém campanhas sem status_desc (também recebem
+    sugestão). Devolve df_feat no mesmo formato de treinar_modelo.
 
-    enc_status = encoders["status_desc"]
-    classes = enc_status.classes_
+    compactar: modo de baixa memória (ver compactar_features).
+    copiar: False acrescenta as features em `df` no lugar, sem a cópia
+      completa do frame cru (quando o chamador não o reutiliza).
+    """
+    df = adicionar_features(df, copiar=copiar)
 
-    sugestoes = []
+    df["__id"] = df["id"].astype(int)
+    df["__name"] = df["name"].fillna("").astype(str)
+    df["__storeId_raw"] = df["storeId"].astype(str)
 
-    for i, row in df_feat.iterrows():
-        camp_id = int(row["__id"])
-        store_id = str(row["__storeId_raw"])
-        nome_campanha = str(row["__name"])
+    for col in feature_cols:
+        if col in encoders:
+            df[col] = codificar(df[col], encoders[col])
 
-        idx_classe = y_pred[i]
-        status_previsto = classes[idx_classe]
-        conf = float(probs[i, idx_classe])
+    if compactar:
+        df = compactar_features(df, feature_cols)
 
-        # Heurística simples de agrupamento:
-        # - priorizar: status positivo com alta confiança
-        # - ajustar_ou_pausar: status inicial/rascunho com baixa confiança
-        # - monitorar: demais casos
-        status_lower = status_previsto.lower()
+    return df.reset_index(drop=True)
 
-        if (("conclu" in status_lower) or ("ativ" in status_lower)) and conf >= 0.6:
-            grupo = "priorizar"
-        elif (("rascunho" in status_lower) or ("agend" in status_lower)) and conf <= 0.4:
-            grupo = "ajustar_ou_pausar"
-        else:
-            grupo = "monitorar"
 
-        sugestoes.append(
-            {
-                "campaignId": camp_id,
-                "storeId": store_id,
-                "name": nome_campanha,
-                "status_previsto": status_previsto,
-                "confianca": conf,
-                "grupo": grupo,
-            }
-        )
+# REGISTRO DE MODELOS
+#
+# ml/modelos/<versao>/modelo.joblib  -> model, encoders, feature_cols, metrics
+# ml/modelos/<versao>/metrics.json   -> cópia legível das métricas
+# ml/modelos/LATEST                  -> versão mais recente salva
 
-    print(f"\nGeradas {len(sugestoes)} sugestões.")
-    return sugestoes
+MODELOS_DIR = Path(__file__).resolve().parent / "modelos"
+MODELO_VERSAO_PADRAO = "rf_v1"
+MODELO_VERSAO_PARTICIONADO = "rf_loja_v1"
 
 
-# SALVAR SUGESTÕES NA TABELA
-def salvar_sugestoes_no_banco(sugestoes, modelo_versao="rf_v1"):
+def salvar_modelo(
+    model, encoders, feature_cols, metrics, versao=MODELO_VERSAO_PADRAO, latest=True
+) -> Path:
     """
-    Persiste sugestões em `campaign_ai_sugestoes`.
+    Serializa o modelo treinado e seus artefatos sob `versao`.
 
-    Nota: TRUNCATE remove histórico. Se for necessário manter versões,
-    comentar o TRUNCATE e incluir carimbo de tempo/versão.
+    joblib sem compressão grava os arrays numpy das árvores em bloco, o que
+    permite carregá-los depois por memory-map (mmap_mode="r").
+
+    latest: se False, não move o ponteiro LATEST (ex.: modelo de uma loja só).
     """
-    if not sugestoes:
-        print("Nenhuma sugestão para salvar no banco.")
-        return
+    versao_dir = MODELOS_DIR / versao
+    versao_dir.mkdir(parents=True, exist_ok=True)
+
+    modelo_path = versao_dir / "modelo.joblib"
+    tmp_path = versao_dir / "modelo.joblib.tmp"
+    joblib.dump(
+        {
+            "model": model,
+            "encoders": encoders,
+            "feature_cols": list(feature_cols),
+            "metrics": metrics,
+            "versao": versao,
+            "treinado_em": pd.Timestamp.now().isoformat(),
+        },
+        tmp_path,
+    )
+    tmp_path.replace(modelo_path)
 
-    conn = get_connection()
-    cur = conn.cursor()
+    with (versao_dir / "metrics.json").open("w", encoding="utf-8") as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
 
-    # Atenção: limpa a tabela inteira antes de inserir
-    cur.execute("TRUNCATE TABLE campaign_ai_sugestoes")
+    if latest:
+        latest_tmp = MODELOS_DIR / "LATEST.tmp"
+        latest_tmp.write_text(versao, encoding="utf-8")
+        latest_tmp.replace(MODELOS_DIR / "LATEST")
 
-    insert_sql = """
-        INSERT INTO campaign_ai_sugestoes
-          (campaignId, storeId, status_previsto, confianca, grupo, modelo_versao)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """
+    print(f"Modelo salvo em: {modelo_path}")
+    return modelo_path
 
-    data = [
-        (
-            s["campaignId"],
-            s["storeId"],
-            s["status_previsto"],
-            round(s["confianca"], 4),
-            s["grupo"],
-            modelo_versao,
-        )
-        for s in sugestoes
-    ]
 
-    cur.executemany(insert_sql, data)
-    conn.commit()
-    cur.close()
-    conn.close()
+def carregar_modelo(versao=None, mmap=True):
+    """
+    Carrega um modelo do registro.
 
-    print(f"Inseridas {len(sugestoes)} linhas em `campaign_ai_sugestoes`.")
+    versao: None usa a última salva (arquivo LATEST); senão, a versão fixada.
+
+    Retorna: model, encoders, feature_cols, metrics, versao
+    """
+    if versao is None:
+        latest_path = MODELOS_DIR / "LATEST"
+        if not latest_path.exists():
+            raise RuntimeError("Nenhum modelo salvo. Rode antes com --modo treinar.")
+        versao = latest_path.read_text(encoding="utf-8").strip()
+
+    modelo_path = MODELOS_DIR / versao / "modelo.joblib"
+    if not modelo_path.exists():
+        raise RuntimeError(f"Versão de modelo não encontrada: {versao}")
+
+    bundle = joblib.load(modelo_path, mmap_mode="r" if mmap else None)
+    encoders = {col: _como_vocabulario(enc) for col, enc in bundle["encoders"].items()}
+    return (
+        bundle["model"],
+        encoders,
+        bundle["feature_cols"],
+        bundle["metrics"],
+        versao,
+    )
 
 
-# SALVAR JSONS (metrics.json e sugestoes.json)
-def salvar_jsons(metrics: dict, sugestoes: list):
+def assinatura_modelo(versao=None):
     """
-    Salva artefatos de auditoria e consumo downstream:
-      - metrics.json: desempenho do modelo
-      - sugestoes.json: recomendações geradas
+    (versao, mtime_ns do modelo.joblib) de uma versão registrada, ou None.
+
+    versao: None usa a apontada por LATEST. Muda quando LATEST passa a
+    apontar outra versão ou quando a mesma versão é retreinada.
     """
-    base_dir = Path(".").resolve()
+    if versao is None:
+        latest_path = MODELOS_DIR / "LATEST"
+        if not latest_path.exists():
+            return None
+        versao = latest_path.read_text(encoding="utf-8").strip()
 
-    metrics_path = base_dir / "metrics.json"
-    sugestoes_path = base_dir / "sugestoes.json"
+    modelo_path = MODELOS_DIR / versao / "modelo.joblib"
+    if not modelo_path.exists():
+        return None
+    return versao, modelo_path.stat().st_mtime_ns
 
-    with metrics_path.open("w", encoding="utf-8") as f:
-        json.dump(metrics, f, ensure_ascii=False, indent=2)
 
-    with sugestoes_path.open("w", encoding="utf-8") as f:
-        json.dump(sugestoes, f, ensure_ascii=False, indent=2)
+# GERAR SUGESTÕES
 
-    print(f"Métricas salvas em: {metrics_path}")
-    print(f"Sugestões salvas em: {sugestoes_path}")
+# Heurística simples de agrupamento:
+# - priorizar: status positivo com alta confiança
+# - ajustar_ou_pausar: status inicial/rascunho com baixa confiança
+# - monitorar: demais casos
+GRUPO_PRIORIZAR = "priorizar"
+GRUPO_AJUSTAR = "ajustar_ou_pausar"
+GRUPO_MONITORAR = "monitorar"
+
+SUGESTAO_COLS = [
+    "campaignId",
+    "storeId",
+    "name",
+    "status_previsto",
+    "confianca",
+    "grupo",
+]
+
+
+def _grupos_por_classe(classes):
+    """
+    Classifica cada classe do alvo (uma vez por classe, não por linha).
+
+    Retorna dois vetores booleanos alinhados a `classes`:
+      positivo: "conclu"/"ativ"      -> candidato a priorizar
+      inicial:  "rascunho"/"agend"   -> candidato a ajustar_ou_pausar
+    """
+    nomes = pd.Series(classes, dtype=str).str.lower()
+    positivo = (nomes.str.contains("conclu") | nomes.str.contains("ativ")).to_numpy()
+    inicial = (nomes.str.contains("rascunho") | nomes.str.contains("agend")).to_numpy()
+    return positivo, inicial
+
+
+def gerar_sugestoes(
+    df_feat: pd.DataFrame, feature_cols, model, encoders, verbose: bool = True
+) -> pd.DataFrame:
+    """
+    Produz recomendações por campanha com base nas probabilidades do modelo.
+
+    Uma única chamada a predict_proba: a classe prevista é o argmax e a
+    confiança é a probabilidade dessa classe. O grupo é resolvido por
+    indexação nos vetores de _grupos_por_classe.
+
+    verbose=False omite o "Geradas N sugestões." (o pipeline chama uma vez
+    por lote e imprime só o total).
+
+    Saída (DataFrame, uma linha por campanha):
+      campaignId, storeId, name, status_previsto, confianca, grupo
+    """
+    if df_feat.empty:
+        # ex.: modo delta sem campanhas alteradas
+        if verbose:
+            print("\nGeradas 0 sugestões.")
+        return pd.DataFrame(columns=SUGESTAO_COLS)
+
+    X_full = matriz_features(df_feat, feature_cols)
+    probs = model.predict_proba(X_full)
+
+    idx_classe, conf = _classe_e_confianca(probs, model.classes_)
+    return _montar_sugestoes(df_feat, idx_classe, conf, encoders, verbose)
+
+
+def _classe_e_confianca(probs: np.ndarray, model_classes) -> tuple:
+    """Argmax de predict_proba -> (código da classe prevista, probabilidade dela)."""
+    idx_col = probs.argmax(axis=1)
+    conf = probs[np.arange(len(probs)), idx_col]
+
+    # Colunas de predict_proba seguem model.classes_ (códigos do vocabulário)
+    idx_classe = np.asarray(model_classes)[idx_col]
+    return idx_classe, conf
+
+
+def _montar_sugestoes(
+    df_feat: pd.DataFrame, idx_classe, conf, encoders, verbose: bool = True
+) -> pd.DataFrame:
+    """Monta o DataFrame de sugestões a partir das classes/confianças previstas."""
+    classes = np.asarray(encoders["status_desc"], dtype=object)
+
+    positivo, inicial = _grupos_por_classe(classes)
+
+    grupo = np.full(len(idx_classe), GRUPO_MONITORAR, dtype=object)
+    grupo[positivo[idx_classe] & (conf >= 0.6)] = GRUPO_PRIORIZAR
+    grupo[inicial[idx_classe] & (conf <= 0.4)] = GRUPO_AJUSTAR
+
+    sugestoes = pd.DataFrame(
+        {
+            "campaignId": df_feat["__id"].to_numpy(dtype=np.int64),
+            "storeId": df_feat["__storeId_raw"].astype(str).to_numpy(),
+            "name": df_feat["__name"].astype(str).to_numpy(),
+            "status_previsto": classes[idx_classe],
+            "confianca": conf.astype(float),
+            "grupo": grupo,
+        },
+        columns=SUGESTAO_COLS,
+    )
+
+    if verbose:
+        print(f"\nGeradas {len(sugestoes)} sugestões.")
+    return sugestoes
+
+
+# TREINO E SCORE PARTICIONADOS POR LOJA
+#
+# Um modelo por loja (ou por balde de lojas pequenas), treinados em paralelo.
+# A matriz X/y é montada uma única vez; o joblib (loky) grava arrays grandes
+# em memmap e os processos filhos só leem, sem cópia por pickle.
+
+PARTICAO_MIN_LINHAS = 200
+
+
+def _particionar_por_loja(store_ids, min_linhas: int = PARTICAO_MIN_LINHAS) -> list:
+    """
+    Agrupa as posições das linhas por loja.
+
+    Lojas com menos de `min_linhas` campanhas são juntadas em baldes até
+    atingir esse tamanho (modelos por loja muito pequenos não generalizam).
+
+    Retorna lista de (chave, índices), ex.: ("EST001", array([...])).
+    """
+    codigos, lojas = pd.factorize(np.asarray(store_ids), sort=True)
+    ordem = np.argsort(codigos, kind="stable")
+    limites = np.cumsum(np.bincount(codigos, minlength=len(lojas)))
+    grupos = np.split(ordem, limites[:-1])
+
+    particoes, baldes = [], []
+    balde_lojas, balde_idx = [], []
+    for loja, idx in zip(lojas, grupos):
+        if len(idx) >= min_linhas:
+            particoes.append((str(loja), idx))
+            continue
+
+        balde_lojas.append(str(loja))
+        balde_idx.append(idx)
+        if sum(len(i) for i in balde_idx) >= min_linhas:
+            baldes.append((balde_lojas, balde_idx))
+            balde_lojas, balde_idx = [], []
+
+    # Sobra abaixo do mínimo vai para o último balde (se houver)
+    if balde_idx:
+        if baldes:
+            baldes[-1][0].extend(balde_lojas)
+            baldes[-1][1].extend(balde_idx)
+        else:
+            baldes.append((balde_lojas, balde_idx))
+
+    for nomes, idxs in baldes:
+        particoes.append(("+".join(nomes), np.concatenate(idxs)))
+
+    return particoes
+
+
+def _treinar_pontuar_particao(X: np.ndarray, y: np.ndarray, idx: np.ndarray, engine="rf"):
+    """
+    Treina e pontua uma partição (executa no processo filho).
+
+    Usa holdout estratificado de 25% quando a partição permite; caso
+    contrário treina com tudo e não contribui para as métricas. Nesse caso
+    (classe com um único exemplo) construir_modelo desliga o early stopping
+    do hgb, que também precisa de 2+ exemplos por classe.
+
+    Retorna: idx, idx_classe, conf, y_test, y_pred_test, info_treino
+    """
+    X_p, y_p = X[idx], y[idx]
+
+    _, contagem = np.unique(y_p, return_counts=True)
+    if len(contagem) > 1 and contagem.min() >= 2:
+        pos_train, pos_test = train_test_split(
+            np.arange(len(y_p)),
+            test_size=0.25,
+            random_state=42,
+            stratify=y_p,
+        )
+    else:
+        pos_train, pos_test = np.arange(len(y_p)), np.arange(0)
+
+    # n_jobs=1: o paralelismo já está no nível das partições
+    model, info = construir_modelo(engine, X_p[pos_train], y_p[pos_train], n_jobs=1)
+
+    idx_classe, conf = _classe_e_confianca(model.predict_proba(X_p), model.classes_)
+    return idx, idx_classe, conf, y_p[pos_test], idx_classe[pos_test], info
+
+
+def treinar_particionado(
+    df: pd.DataFrame,
+    workers: int = -1,
+    min_linhas: int = PARTICAO_MIN_LINHAS,
+    engine: str = "rf",
+    compactar: bool = False,
+):
+    """
+    Treina um RandomForest por partição de lojas e já gera as sugestões.
+
+    workers: processos do pool (-1 = todos os núcleos).
+    engine: ver construir_modelo (aplicada em cada partição).
+    compactar: modo de baixa memória (ver compactar_features).
+
+    Retorna:
+      sugestoes: DataFrame no formato de gerar_sugestoes
+      encoders: vocabulários compartilhados (ajustados uma vez, no frame todo)
+      metrics: métricas agregadas dos holdouts + detalhe por partição
+    """
+    df_feat, encoders, y, feature_cols = preparar_treino(df, compactar=compactar)
+    classes = list(encoders["status_desc"])
+
+    X = matriz_features(df_feat, feature_cols)
+    y = np.ascontiguousarray(y)
+
+    particoes = _particionar_por_loja(df_feat["__storeId_raw"].to_numpy(), min_linhas)
+    print(f"Treinando {len(particoes)} partições (workers={workers})...")
+
+    resultados = Parallel(n_jobs=workers, max_nbytes="1M", mmap_mode="r")(
+        delayed(_treinar_pontuar_particao)(X, y, idx, engine) for _, idx in particoes
+    )
+
+    idx_classe = np.empty(len(y), dtype=np.int64)
+    conf = np.empty(len(y), dtype=np.float64)
+    y_test, y_pred, por_particao = [], [], {}
+    for (chave, _), (idx, classe_p, conf_p, y_test_p, y_pred_p, info) in zip(
+        particoes, resultados
+    ):
+        idx_classe[idx] = classe_p
+        conf[idx] = conf_p
+        y_test.append(y_test_p)
+        y_pred.append(y_pred_p)
+        por_particao[chave] = {
+            "n_samples": int(len(idx)),
+            "n_samples_test": int(len(y_test_p)),
+            "accuracy": float(accuracy_score(y_test_p, y_pred_p)) if len(y_test_p) else None,
+            "treino": info,
+        }
+
+    y_test = np.concatenate(y_test)
+    y_pred = np.concatenate(y_pred)
+    labels = np.arange(len(classes))
+
+    acc = accuracy_score(y_test, y_pred)
+    f1w = f1_score(y_test, y_pred, average="weighted")
+    report_text = classification_report(
+        y_test, y_pred, labels=labels, target_names=classes, zero_division=0
+    )
+
+    print("\n===== MÉTRICAS DO MODELO (particionado por loja) =====")
+    print("Acurácia:", round(acc, 3))
+    print("F1 (weighted):", round(f1w, 3))
+    print("\nRelatório por classe:")
+    print(report_text)
+
+    metrics = {
+        "accuracy": float(acc),
+        "f1_weighted": float(f1w),
+        "classes": classes,
+        "classification_report": classification_report(
+            y_test,
+            y_pred,
+            labels=labels,
+            target_names=classes,
+            output_dict=True,
+            zero_division=0,
+        ),
+        "classification_report_text": report_text,
+        "n_samples_total": int(len(y)),
+        "n_samples_test": int(len(y_test)),
+        "particoes": por_particao,
+    }
+
+    sugestoes = _montar_sugestoes(df_feat, idx_classe, conf, encoders)
+    return sugestoes, encoders, metrics
+
+
+# AVALIAÇÃO CRUZADA (k-fold estratificado em paralelo)
+#
+# Alternativa ao holdout único de treinar_modelo para comparar engines com
+# uma métrica estável: a matriz X/y é codificada uma vez e cada (engine,
+# fold) roda num processo (joblib/loky, X em memmap como no particionado).
+#
+# Cache em ml/cache/cv/<chave_dados>/:
+#   folds_<k>_<estrategia>_<seed>.npz          índices de teste de cada fold
+#   <engine>_<chave_hiperparametros>/fold_<i>.json  métricas do fold
+# chave_dados é o hash de X/y: com os mesmos dados e hiperparâmetros, uma
+# nova avaliação só recalcula o que ainda não existe.
+
+CV_DIR = SNAPSHOT_DIR / "cv"
+CV_FOLDS_PADRAO = 5
+CV_METRICAS = ["accuracy", "f1_weighted", "f1_macro"]
+
+
+def _hash_curto(*partes) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for parte in partes:
+        h.update(parte if isinstance(parte, (bytes, memoryview)) else str(parte).encode())
+    return h.hexdigest()
+
+
+def _folds_cv(y, grupos, k: int, seed: int, pasta: Path) -> list:
+    """Índices de teste de cada fold (lidos do cache ou gerados e gravados)."""
+    estrategia = "grupo_loja" if grupos is not None else "estratificado"
+    path = pasta / f"folds_{k}_{estrategia}_{seed}.npz"
+    if path.exists():
+        with np.load(path) as arq:
+            return [arq[f"fold_{i}"] for i in range(k)]
+
+    if grupos is not None:
+        divisor = StratifiedGroupKFold(n_splits=k, shuffle=True, random_state=seed)
+    else:
+        divisor = StratifiedKFold(n_splits=k, shuffle=True, random_state=seed)
+    testes = [teste for _, teste in divisor.split(np.zeros(len(y)), y, grupos)]
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp.npz")
+    np.savez(tmp_path, **{f"fold_{i}": teste for i, teste in enumerate(testes)})
+    tmp_path.replace(path)
+    return testes
+
+
+def _avaliar_fold(X: np.ndarray, y: np.ndarray, teste: np.ndarray, engine: str) -> dict:
+    """Treina sem o fold e mede nele (executa no processo filho)."""
+    treino = np.ones(len(y), dtype=bool)
+    treino[teste] = False
+
+    # n_jobs=1: o paralelismo já está no nível dos folds
+    model, info = construir_modelo(engine, X[treino], y[treino], n_jobs=1)
+    y_pred = model.predict(X[teste])
+    return {
+        "n_test": int(len(teste)),
+        "accuracy": float(accuracy_score(y[teste], y_pred)),
+        "f1_weighted": float(f1_score(y[teste], y_pred, average="weighted")),
+        "f1_macro": float(f1_score(y[teste], y_pred, average="macro")),
+        "treino": info,
+    }
+
+
+def _resumir_folds(folds: list) -> dict:
+    """Média, variância e desvio (amostrais) de cada métrica entre os folds."""
+    resumo = {}
+    for metrica in CV_METRICAS:
+        valores = np.array([f[metrica] for f in folds])
+        variancia = float(valores.var(ddof=1)) if len(valores) > 1 else 0.0
+        resumo[metrica] = {
+            "media": float(valores.mean()),
+            "variancia": variancia,
+            "desvio": variancia**0.5,
+        }
+    return resumo
+
+
+def avaliar_cruzado(
+    df: pd.DataFrame,
+    engines=("rf",),
+    k: int = CV_FOLDS_PADRAO,
+    agrupar_loja: bool = False,
+    workers: int = -1,
+    seed: int = 42,
+) -> dict:
+    """
+    Avalia uma ou mais engines por k-fold estratificado numa única passada
+    paralela (todas as combinações engine x fold no mesmo pool).
+
+    agrupar_loja: StratifiedGroupKFold por storeId (uma loja nunca aparece em
+      treino e teste do mesmo fold; mede generalização para lojas novas).
+    workers: processos do pool (-1 = todos os núcleos).
+
+    Retorna {"k", "estrategia", "n_samples", "chave_dados", "engines": {engine:
+    {"hiperparametros", "folds", "do_cache", <métrica>: {"media", "variancia", "desvio"}}}}.
+    """
+    df_feat, encoders, y, feature_cols = preparar_treino(df, compactar=True)
+    X = matriz_features(df_feat, feature_cols)
+    y = np.ascontiguousarray(y)
+    grupos = df_feat["__storeId_raw"].cat.codes.to_numpy() if agrupar_loja else None
+
+    chave_dados = _hash_curto(
+        memoryview(X).cast("B"), memoryview(y).cast("B"), feature_cols
+    )
+    pasta = CV_DIR / chave_dados
+    testes = _folds_cv(y, grupos, k, seed, pasta)
+
+    estrategia = "grupo_loja" if agrupar_loja else "estratificado"
+    config = {}
+    pendentes = []
+    for engine in dict.fromkeys(engines):
+        params = hiperparametros(engine)
+        pasta_engine = pasta / (
+            f"{engine}_"
+            f"{_hash_curto(json.dumps(params, sort_keys=True), sklearn.__version__, k, estrategia, seed)}"
+        )
+        folds = []
+        for i in range(k):
+            path = pasta_engine / f"fold_{i}.json"
+            if path.exists():
+                folds.append(json.loads(path.read_text(encoding="utf-8")))
+            else:
+                folds.append(None)
+                pendentes.append((engine, i, path))
+        config[engine] = {"hiperparametros": params, "folds": folds}
+
+    print(
+        f"Avaliação {k}-fold ({estrategia}): {len(pendentes)} de "
+        f"{k * len(config)} folds a treinar (workers={workers})."
+    )
+    resultados = Parallel(n_jobs=workers, max_nbytes="1M", mmap_mode="r")(
+        delayed(_avaliar_fold)(X, y, testes[i], engine) for engine, i, _ in pendentes
+    )
+
+    for (engine, i, path), resultado in zip(pendentes, resultados):
+        config[engine]["folds"][i] = resultado
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(resultado, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+    print("\n===== AVALIAÇÃO CRUZADA =====")
+    for engine, info in config.items():
+        info["do_cache"] = k - sum(1 for e, _, _ in pendentes if e == engine)
+        info.update(_resumir_folds(info["folds"]))
+        print(
+            f"{engine:<14} acurácia {info['accuracy']['media']:.3f} ± {info['accuracy']['desvio']:.3f}"
+            f" | F1 (weighted) {info['f1_weighted']['media']:.3f} ± {info['f1_weighted']['desvio']:.3f}"
+        )
+
+    return {
+        "k": k,
+        "estrategia": estrategia,
+        "seed": seed,
+        "n_samples": int(len(y)),
+        "chave_dados": chave_dados,
+        "engines": config,
+    }
+
+
+# SALVAR SUGESTÕES NA TABELA
+def salvar_sugestoes_no_banco(sugestoes: pd.DataFrame, modelo_versao="rf_v1", lojas=None):
+    """
+    Persiste sugestões em `campaign_ai_sugestoes`.
+
+    Nota: TRUNCATE remove histórico. Se for necessário manter versões,
+    comentar o TRUNCATE e incluir carimbo de tempo/versão.
+
+    lojas: se informada, substitui só as linhas dessas lojas (DELETE em vez de TRUNCATE).
+    """
+    if sugestoes.empty:
+        print("Nenhuma sugestão para salvar no banco.")
+        return
+
+    invalidar_fingerprints()
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        if lojas:
+            where, params = _where_lojas(lojas)
+            cur.execute("DELETE FROM campaign_ai_sugestoes" + where, params)
+        else:
+            # Atenção: limpa a tabela inteira antes de inserir
+            cur.execute("TRUNCATE TABLE campaign_ai_sugestoes")
+
+        insert_sql = """
+            INSERT INTO campaign_ai_sugestoes
+              (campaignId, storeId, status_previsto, confianca, grupo, modelo_versao)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """
+
+        data = list(
+            zip(
+                sugestoes["campaignId"].tolist(),
+                sugestoes["storeId"].tolist(),
+                sugestoes["status_previsto"].tolist(),
+                sugestoes["confianca"].round(4).tolist(),
+                sugestoes["grupo"].tolist(),
+                [modelo_versao] * len(sugestoes),
+            )
+        )
+
+        cur.executemany(insert_sql, data)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    print(f"Inseridas {len(sugestoes)} linhas em `campaign_ai_sugestoes`.")
+
+
+# SALVAR SUGESTÕES EM LOTE (staging + troca atômica)
+
+SUGESTOES_TABLE = "campaign_ai_sugestoes"
+SUGESTOES_STAGE_TABLE = "campaign_ai_sugestoes_stage"
+SUGESTOES_OLD_TABLE = "campaign_ai_sugestoes_old"
+SUGESTOES_HIST_TABLE = "campaign_ai_sugestoes_hist"
+
+SUGESTOES_INSERT_COLS = [
+    "campaignId",
+    "storeId",
+    "status_previsto",
+    "confianca",
+    "grupo",
+    "modelo_versao",
+]
+
+BULK_LOTE_PADRAO = 5_000
+
+
+def _linhas_para_banco(sugestoes: pd.DataFrame, modelo_versao: str) -> pd.DataFrame:
+    """Recorta/arredonda as colunas no formato da tabela de sugestões."""
+    linhas = sugestoes[["campaignId", "storeId", "status_previsto", "confianca", "grupo"]].copy()
+    linhas["confianca"] = linhas["confianca"].round(4)
+    linhas["modelo_versao"] = modelo_versao
+    return linhas[SUGESTOES_INSERT_COLS]
+
+
+def _inserir_multilinhas(cur, tabela: str, linhas: pd.DataFrame, lote: int):
+    """INSERT com vários VALUES por comando (um round-trip a cada `lote` linhas)."""
+    placeholder = "(" + ", ".join(["%s"] * len(SUGESTOES_INSERT_COLS)) + ")"
+    prefixo = f"INSERT INTO {tabela} ({', '.join(SUGESTOES_INSERT_COLS)}) VALUES "
+
+    valores = linhas.to_numpy(dtype=object)
+    for inicio in range(0, len(valores), lote):
+        bloco = valores[inicio : inicio + lote]
+        sql = prefixo + ", ".join([placeholder] * len(bloco))
+        cur.execute(sql, [v.item() if hasattr(v, "item") else v for v in bloco.ravel()])
+
+
+def _carregar_infile(cur, tabela: str, linhas: pd.DataFrame):
+    """LOAD DATA LOCAL INFILE a partir de um CSV temporário."""
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".csv", delete=False, encoding="utf-8", newline=""
+    ) as tmp:
+        linhas.to_csv(tmp, index=False, header=False, lineterminator="\n")
+        csv_path = tmp.name
+
+    try:
+        cur.execute(
+            f"""
+            LOAD DATA LOCAL INFILE %s
+            INTO TABLE {tabela}
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n'
+            ({", ".join(SUGESTOES_INSERT_COLS)})
+            """,
+            (Path(csv_path).as_posix(),),
+        )
+    finally:
+        Path(csv_path).unlink(missing_ok=True)
+
+
+def _gravar_historico(cur, execucao_em: str):
+    """
+    Copia a execução atual para a tabela de histórico.
+
+    O histórico é particionado logicamente por (execucao_em, modelo_versao):
+    cada execução fica recuperável/removível por essa chave indexada.
+    """
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SUGESTOES_HIST_TABLE} (
+          `execucao_em` datetime NOT NULL,
+          `campaignId` int NOT NULL,
+          `storeId` varchar(20) NOT NULL,
+          `status_previsto` varchar(50) NOT NULL,
+          `confianca` decimal(5,4) NOT NULL,
+          `grupo` varchar(30) NOT NULL,
+          `modelo_versao` varchar(50) DEFAULT NULL,
+          KEY `idx_execucao` (`execucao_em`, `modelo_versao`),
+          KEY `idx_campaign` (`campaignId`)
+        ) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+        """
+    )
+    cur.execute(
+        f"""
+        INSERT INTO {SUGESTOES_HIST_TABLE}
+          (execucao_em, {", ".join(SUGESTOES_INSERT_COLS)})
+        SELECT %s, {", ".join(SUGESTOES_INSERT_COLS)}
+        FROM {SUGESTOES_STAGE_TABLE}
+        """,
+        (execucao_em,),
+    )
+
+
+def _criar_staging(cur, lojas=None):
+    """
+    Recria a staging vazia com a estrutura da oficial.
+
+    lojas: se informada, a staging começa com as linhas das demais lojas,
+      de modo que a troca substitui só as lojas desta execução.
+    """
+    cur.execute(f"DROP TABLE IF EXISTS {SUGESTOES_STAGE_TABLE}")
+    cur.execute(f"CREATE TABLE {SUGESTOES_STAGE_TABLE} LIKE {SUGESTOES_TABLE}")
+
+    if lojas:
+        where, params = _where_lojas(lojas, negar=True)
+        cur.execute(
+            f"""
+            INSERT INTO {SUGESTOES_STAGE_TABLE} ({", ".join(SUGESTOES_INSERT_COLS)})
+            SELECT {", ".join(SUGESTOES_INSERT_COLS)}
+            FROM {SUGESTOES_TABLE}
+            """
+            + where,
+            params,
+        )
+
+
+def _trocar_staging(cur):
+    """Troca atômica: leitores veem a tabela antiga ou a nova, nunca parcial."""
+    cur.execute(f"DROP TABLE IF EXISTS {SUGESTOES_OLD_TABLE}")
+    cur.execute(
+        f"""
+        RENAME TABLE
+          {SUGESTOES_TABLE} TO {SUGESTOES_OLD_TABLE},
+          {SUGESTOES_STAGE_TABLE} TO {SUGESTOES_TABLE}
+        """
+    )
+    cur.execute(f"DROP TABLE {SUGESTOES_OLD_TABLE}")
+
+
+def salvar_sugestoes_bulk(
+    sugestoes: pd.DataFrame,
+    modelo_versao="rf_v1",
+    lote: int = BULK_LOTE_PADRAO,
+    infile: bool = False,
+    historico: bool = False,
+    lojas=None,
+) -> dict:
+    """
+    Persiste sugestões sem deixar `campaign_ai_sugestoes` vazia durante a carga.
+
+    1. Recria a tabela de staging com a mesma estrutura da oficial.
+    2. Carrega em lotes multi-linha (ou LOAD DATA LOCAL INFILE, se infile=True).
+    3. Troca staging <-> oficial com um único RENAME TABLE (atômico para leitores).
+    4. Opcional: copia a execução para o histórico (historico=True).
+
+    lojas: se informada, a staging começa com as linhas das demais lojas,
+      de modo que a troca substitui só as lojas desta execução.
+
+    Retorna estatísticas de escrita (linhas, segundos, linhas/s).
+    """
+    if sugestoes.empty:
+        print("Nenhuma sugestão para salvar no banco.")
+        return {"linhas": 0, "segundos": 0.0, "linhas_por_s": 0.0}
+
+    linhas = _linhas_para_banco(sugestoes, modelo_versao)
+    execucao_em = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    invalidar_fingerprints()
+    conn = get_connection(allow_local_infile=True) if infile else get_connection()
+    cur = conn.cursor()
+    try:
+        inicio = time.perf_counter()
+
+        _criar_staging(cur, lojas)
+
+        if infile:
+            _carregar_infile(cur, SUGESTOES_STAGE_TABLE, linhas)
+        else:
+            _inserir_multilinhas(cur, SUGESTOES_STAGE_TABLE, linhas, lote)
+        conn.commit()
+
+        if historico:
+            _gravar_historico(cur, execucao_em)
+            conn.commit()
+
+        _trocar_staging(cur)
+        segundos = time.perf_counter() - inicio
+    finally:
+        cur.close()
+        conn.close()
+
+    stats = {
+        "linhas": int(len(linhas)),
+        "segundos": round(segundos, 4),
+        "linhas_por_s": round(len(linhas) / segundos, 1) if segundos > 0 else None,
+        "metodo": "infile" if infile else "multilinhas",
+        "historico": historico,
+    }
+    print(
+        f"Inseridas {stats['linhas']} linhas em `{SUGESTOES_TABLE}` "
+        f"({stats['linhas_por_s']} linhas/s, {stats['metodo']})."
+    )
+    return stats
+
+
+# DELTA: RESCORE E UPSERT SÓ DAS CAMPANHAS ALTERADAS
+#
+# Cada campanha tem uma impressão digital (hash) da sua linha de features.
+# O estado (campaignId, fingerprint, modelo_versao) da última escrita fica
+# em ml/cache; só campanhas novas, com features diferentes ou pontuadas por
+# outra versão de modelo são repontuadas e regravadas.
+
+FINGERPRINT_PATH = SNAPSHOT_DIR / "sugestoes_fingerprints.parquet"
+
+
+def fingerprint_features(df_feat: pd.DataFrame, feature_cols) -> np.ndarray:
+    """
+    Hash vetorizado (uint64) de cada linha de features.
+
+    Calculado sobre a matriz float32 que o modelo recebe (matriz_features),
+    não sobre df_feat: hash_pandas_object leva o dtype em conta, e o mesmo
+    valor em int8/int64 ou float32/float64 (ex.: --baixa-memoria) mudaria o hash.
+    """
+    matriz = pd.DataFrame(matriz_features(df_feat, feature_cols), copy=False)
+    return pd.util.hash_pandas_object(matriz, index=False).to_numpy()
+
+
+def _ler_fingerprints() -> pd.DataFrame:
+    if not FINGERPRINT_PATH.exists():
+        return pd.DataFrame(
+            {
+                "campaignId": pd.Series(dtype=np.int64),
+                "fingerprint": pd.Series(dtype=np.uint64),
+                "modelo_versao": pd.Series(dtype=str),
+            }
+        )
+    return pd.read_parquet(FINGERPRINT_PATH)
+
+
+def _gravar_fingerprints(estado: pd.DataFrame):
+    FINGERPRINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = FINGERPRINT_PATH.with_suffix(".parquet.tmp")
+    estado.to_parquet(tmp_path, index=False)
+    tmp_path.replace(FINGERPRINT_PATH)
+
+
+def invalidar_fingerprints():
+    """
+    Descarta o estado do delta. Chamado por toda escrita fora do delta
+    (completa, por loja, particionada, pipeline): depois dela o estado não
+    descreve mais a tabela, e o próximo --delta repontua tudo.
+    """
+    FINGERPRINT_PATH.unlink(missing_ok=True)
+
+
+def selecionar_alteradas(df_feat: pd.DataFrame, feature_cols, modelo_versao, parcial=False):
+    """
+    Compara as features atuais com o estado salvo.
+
+    parcial: True quando df_feat não cobre todas as campanhas (ex.: --loja);
+      nesse caso nenhuma campanha ausente é considerada removida.
+
+    Retorna:
+      alteradas: máscara booleana sobre df_feat (precisa repontuar)
+      removidas: campaignId presentes no estado mas não mais no banco
+      estado_novo: estado a gravar após a escrita bem-sucedida
+    """
+    atual = pd.DataFrame(
+        {
+            "campaignId": df_feat["__id"].to_numpy(dtype=np.int64),
+            "fingerprint": fingerprint_features(df_feat, feature_cols),
+            "modelo_versao": modelo_versao,
+        }
+    )
+    anterior = _ler_fingerprints()
+
+    comparacao = atual.merge(
+        anterior, on="campaignId", how="left", suffixes=("", "_anterior")
+    )
+    alteradas = (
+        comparacao["fingerprint_anterior"].isna()
+        | (comparacao["fingerprint"] != comparacao["fingerprint_anterior"])
+        | (comparacao["modelo_versao"] != comparacao["modelo_versao_anterior"])
+    ).to_numpy()
+
+    ids_atuais = atual["campaignId"].to_numpy()
+    fora_do_lote = ~anterior["campaignId"].isin(ids_atuais)
+    if parcial:
+        removidas = np.array([], dtype=np.int64)
+        estado_novo = pd.concat([anterior[fora_do_lote], atual], ignore_index=True)
+    else:
+        removidas = anterior.loc[fora_do_lote, "campaignId"].to_numpy(dtype=np.int64)
+        estado_novo = atual
+
+    return alteradas, removidas, estado_novo
+
+
+def upsert_sugestoes(
+    sugestoes: pd.DataFrame, modelo_versao, removidas=(), lote: int = BULK_LOTE_PADRAO
+) -> dict:
+    """
+    Substitui em `campaign_ai_sugestoes` só as campanhas de `sugestoes`.
+
+    A tabela (MyISAM) não tem chave única em campaignId nem transação, então
+    DELETE + INSERT direto na oficial deixaria leitores sem essas campanhas
+    entre os dois comandos (e sem elas de vez, se o INSERT falhasse). O delta
+    usa a mesma staging de salvar_sugestoes_bulk: cópia da oficial no
+    servidor, DELETE ... IN (...) + INSERT multi-linha nela, em lotes, e troca
+    com RENAME TABLE. `removidas` são apagadas sem reinserção; as demais
+    linhas mantêm id e gerado_em.
+    """
+    linhas = _linhas_para_banco(sugestoes, modelo_versao)
+    ids_apagar = np.concatenate(
+        [linhas["campaignId"].to_numpy(dtype=np.int64), np.asarray(removidas, dtype=np.int64)]
+    )
+
+    inicio = time.perf_counter()
+    if len(ids_apagar):
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            _criar_staging(cur)
+            cur.execute(f"INSERT INTO {SUGESTOES_STAGE_TABLE} SELECT * FROM {SUGESTOES_TABLE}")
+            for pos in range(0, len(ids_apagar), lote):
+                bloco = ids_apagar[pos : pos + lote].tolist()
+                cur.execute(
+                    f"DELETE FROM {SUGESTOES_STAGE_TABLE} "
+                    f"WHERE campaignId IN ({', '.join(['%s'] * len(bloco))})",
+                    bloco,
+                )
+            _inserir_multilinhas(cur, SUGESTOES_STAGE_TABLE, linhas, lote)
+            conn.commit()
+
+            _trocar_staging(cur)
+        finally:
+            cur.close()
+            conn.close()
+
+    segundos = time.perf_counter() - inicio
+    stats = {
+        "linhas": int(len(linhas)),
+        "removidas": int(len(removidas)),
+        "segundos": round(segundos, 4),
+        "metodo": "upsert_delta",
+    }
+    print(
+        f"Upsert: {stats['linhas']} sugestões atualizadas, "
+        f"{stats['removidas']} removidas em `{SUGESTOES_TABLE}`."
+    )
+    return stats
+
+
+# SALVAR JSONS (metrics.json e sugestoes.json)
+#
+# Formatos de sugestões:
+#   json    -> sugestoes.json (array, um objeto por linha)
+#   ndjson  -> sugestoes.ndjson (um objeto JSON por linha)
+#   parquet -> sugestoes.parquet
+# json/ndjson podem ser comprimidos (gzip -> .gz, zstd -> .zst); no parquet a
+# compressão vira o codec das colunas. As sugestões são serializadas em blocos
+# de SAIDA_LOTE linhas, sem montar a lista inteira em memória.
+#
+# Todo arquivo é gravado em <nome>.tmp e renomeado no fim: quem lê o
+# diretório nunca vê um arquivo pela metade.
+
+SAIDA_DIR = os.getenv("IA_SAIDA_DIR")  # None = diretório atual
+SAIDA_FORMATOS = ["json", "ndjson", "parquet"]
+SAIDA_COMPRESSOES = ["gzip", "zstd"]
+SAIDA_EXTENSOES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+SAIDA_LOTE = 50_000
+
+
+def _dumps(obj, indentar: bool = False) -> bytes:
+    """JSON em UTF-8 (orjson quando instalado)."""
+    if orjson is not None:
+        opcoes = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indentar:
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=opcoes)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indentar else None).encode("utf-8")
+
+
+@contextlib.contextmanager
+def _escrita_atomica(path: Path, compressao=None):
+    """Abre `path`.tmp para escrita binária (comprimida) e renomeia para `path` no sucesso."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with contextlib.ExitStack() as pilha:
+            if compressao == "gzip":
+                f = pilha.enter_context(gzip.open(tmp_path, "wb", compresslevel=6))
+            elif compressao == "zstd":
+                if zstandard is None:
+                    raise RuntimeError("Compressão zstd requer o pacote zstandard.")
+                bruto = pilha.enter_context(tmp_path.open("wb"))
+                f = pilha.enter_context(zstandard.ZstdCompressor().stream_writer(bruto))
+            else:
+                f = pilha.enter_context(tmp_path.open("wb"))
+            yield f
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _registros_em_lotes(sugestoes: pd.DataFrame, separador: bytes, lote: int = SAIDA_LOTE):
+    """Gera as sugestões como blocos de bytes: um objeto JSON por registro, unidos por `separador`."""
+    for inicio in range(0, len(sugestoes), lote):
+        registros = sugestoes.iloc[inicio : inicio + lote].to_dict(orient="records")
+        yield separador.join(_dumps(r) for r in registros)
+
+
+@contextlib.contextmanager
+def _escritor_sugestoes(path: Path, formato: str, compressao=None):
+    """
+    Abre o arquivo de sugestões e devolve escrever(df_bloco).
+
+    escrever pode ser chamada várias vezes (o pipeline grava lote a lote);
+    o arquivo só aparece em `path` quando o bloco termina sem erro.
+    """
+    if formato == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        writer = None
+
+        def escrever(bloco: pd.DataFrame):
+            nonlocal writer
+            tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    tmp_path, tabela.schema, compression=compressao or "snappy"
+                )
+            writer.write_table(tabela)
+
+        try:
+            yield escrever
+            if writer is None:
+                escrever(pd.DataFrame(columns=SUGESTAO_COLS))
+            writer.close()
+            tmp_path.replace(path)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return
+
+    with _escrita_atomica(path, compressao) as f:
+        primeiro = True
+
+        def escrever(bloco: pd.DataFrame):
+            nonlocal primeiro
+            if formato == "ndjson":
+                for dados in _registros_em_lotes(bloco, b"\n"):
+                    f.write(dados)
+                    f.write(b"\n")
+                return
+
+            for dados in _registros_em_lotes(bloco, b",\n"):
+                f.write(b"\n" if primeiro else b",\n")
+                f.write(dados)
+                primeiro = False
+
+        if formato == "json":
+            f.write(b"[")
+        yield escrever
+        if formato == "json":
+            f.write(b"\n]\n")
+
+
+def caminho_sugestoes(base_dir: Path, formato: str = "json", compressao=None) -> Path:
+    """Nome do arquivo de sugestões para o formato/compressão escolhidos."""
+    if formato == "parquet":
+        return base_dir / "sugestoes.parquet"
+    return base_dir / f"sugestoes.{formato}{SAIDA_EXTENSOES[compressao]}"
+
+
+def _validar_saida(formato: str, compressao=None):
+    """Falha antes de gravar qualquer coisa se formato/compressão forem inviáveis."""
+    if formato not in SAIDA_FORMATOS:
+        raise ValueError(f"Formato de saída inválido: {formato}")
+    if compressao is not None and compressao not in SAIDA_COMPRESSOES:
+        raise ValueError(f"Compressão inválida: {compressao}")
+    if compressao == "zstd" and formato != "parquet" and zstandard is None:
+        raise RuntimeError("Compressão zstd requer o pacote zstandard.")
+
+
+def _diretorio_saida(saida_dir=None) -> Path:
+    """saida_dir, IA_SAIDA_DIR ou o diretório atual (criado se preciso)."""
+    base_dir = Path(saida_dir or SAIDA_DIR or ".").resolve()
+    base_dir.mkdir(parents=True, exist_ok=True)
+    return base_dir
+
+
+def _salvar_metrics(metrics: dict, base_dir: Path) -> Path:
+    metrics_path = base_dir / "metrics.json"
+    with _escrita_atomica(metrics_path) as f:
+        f.write(_dumps(metrics, indentar=True))
+    print(f"Métricas salvas em: {metrics_path}")
+    return metrics_path
+
+
+def salvar_jsons(
+    metrics: dict,
+    sugestoes: pd.DataFrame,
+    saida_dir=None,
+    formato: str = "json",
+    compressao=None,
+) -> dict:
+    """
+    Salva artefatos de auditoria e consumo downstream:
+      - metrics.json: desempenho do modelo
+      - sugestoes.<formato>: recomendações geradas
+
+    saida_dir: diretório de saída (padrão: IA_SAIDA_DIR ou o diretório atual).
+    formato/compressao: ver SAIDA_FORMATOS e SAIDA_COMPRESSOES.
+
+    Retorna: {"metrics": caminho, "sugestoes": caminho}
+    """
+    _validar_saida(formato, compressao)
+    base_dir = _diretorio_saida(saida_dir)
+
+    metrics_path = _salvar_metrics(metrics, base_dir)
+
+    sugestoes_path = caminho_sugestoes(base_dir, formato, compressao)
+    with _escritor_sugestoes(sugestoes_path, formato, compressao) as escrever:
+        escrever(sugestoes)
+
+    print(f"Sugestões salvas em: {sugestoes_path}")
+    return {"metrics": str(metrics_path), "sugestoes": str(sugestoes_path)}
+
+
+# SCORE EM PIPELINE (leitura -> features/score -> escrita sobrepostos)
+#
+# Três estágios em paralelo, ligados por filas limitadas:
+#   leitura:  cursor não-bufferizado, um lote tipado por vez (thread própria)
+#   score:    adicionar_features + predict_proba por lote (pool de threads;
+#             numpy/sklearn liberam o GIL nas partes pesadas)
+#   escrita:  INSERT multi-linha na staging + arquivo de sugestões (thread
+#             própria); no fim, a staging troca de lugar com a oficial
+# As filas de PIPELINE_FILA lotes seguram o estágio mais rápido, então a
+# memória fica limitada a poucos lotes e o tempo total tende ao do estágio
+# mais lento em vez da soma de todos.
+
+PIPELINE_FILA = 4
+_FIM = object()
+
+
+def _colocar(fila: queue.Queue, item, parar: threading.Event):
+    """put() que desiste se outro estágio falhou (evita bloquear para sempre)."""
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+    raise RuntimeError("Pipeline interrompido por falha em outro estágio.")
+
+
+def _retirar(fila: queue.Queue, parar: threading.Event):
+    """get() que desiste se outro estágio falhou."""
+    while not parar.is_set():
+        try:
+            return fila.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    raise RuntimeError("Pipeline interrompido por falha em outro estágio.")
+
+
+def _estagio(func, erros: list, parar: threading.Event):
+    """Roda func numa thread; a primeira exceção interrompe o pipeline inteiro."""
+
+    def alvo():
+        try:
+            func()
+        except BaseException as e:
+            erros.append(e)
+            parar.set()
+
+    thread = threading.Thread(target=alvo, daemon=True)
+    thread.start()
+    return thread
+
+
+@contextlib.contextmanager
+def _predicao_serial(model):
+    """Desliga o paralelismo interno do modelo (o pool de threads já paraleliza)."""
+    n_jobs = getattr(model, "n_jobs", None)
+    if n_jobs is not None:
+        model.n_jobs = 1
+    try:
+        yield
+    finally:
+        if n_jobs is not None:
+            model.n_jobs = n_jobs
+
+
+def _pontuar_lote(lote: pd.DataFrame, modelo, agregados=None) -> tuple:
+    """Features + predict_proba de um lote -> (sugestoes, segundos)."""
+    model, encoders, feature_cols, _, _ = modelo
+    inicio = time.perf_counter()
+    if agregados is not None:
+        lote = juntar_agregados(lote, agregados)
+    df_feat = preparar_features(lote, encoders, feature_cols, compactar=True, copiar=False)
+    sugestoes = gerar_sugestoes(df_feat, feature_cols, model, encoders, verbose=False)
+    return sugestoes, time.perf_counter() - inicio
+
+
+def pontuar_em_pipeline(
+    modelo,
+    chunksize: int = SNAPSHOT_CHUNKSIZE,
+    workers: int = -1,
+    lojas=None,
+    lote: int = BULK_LOTE_PADRAO,
+    historico: bool = False,
+    saida_dir=None,
+    formato: str = "json",
+    compressao=None,
+    agregados=None,
+) -> dict:
+    """
+    Score com leitura, features/score e escrita sobrepostos (ver cabeçalho da seção).
+
+    modelo: tupla de carregar_modelo.
+    workers: threads de score (-1 = todos os núcleos).
+    lojas: restringe leitura e troca da tabela a esses storeId.
+    lote/historico: como em salvar_sugestoes_bulk.
+    saida_dir/formato/compressao: como em salvar_jsons (metrics.json é
+      gravado depois, pelo chamador, com as etapas já medidas).
+    agregados: saída de carregar_agregados, juntada a cada lote (modelos
+      treinados com AGREGADO_FEATURE_COLS).
+
+    Retorna estatísticas: linhas, grupos, caminho do arquivo e o tempo
+    ocupado de cada estágio (score_s soma todas as threads).
+    """
+    _validar_saida(formato, compressao)
+    sugestoes_path = caminho_sugestoes(_diretorio_saida(saida_dir), formato, compressao)
+    model, _, _, _, versao = modelo
+    n_threads = (os.cpu_count() or 1) if workers in (None, -1) else max(1, workers)
+
+    fila_lotes = queue.Queue(maxsize=PIPELINE_FILA)
+    fila_sugestoes = queue.Queue(maxsize=PIPELINE_FILA)
+    parar = threading.Event()
+    erros = []
+    tempos = {"leitura_s": 0.0, "score_s": 0.0, "escrita_s": 0.0}
+    stats = {"n_campanhas": 0, "n_sugestoes": 0, "grupos": {}}
+
+    def ler():
+        where, params = _where_lojas(lojas)
+        conn = get_connection()
+        cur = conn.cursor(buffered=False)
+        try:
+            inicio = time.perf_counter()
+            cur.execute(CAMPANHA_QUERY + where, params)
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if not rows:
+                    break
+                df = _tipar_lote(pd.DataFrame(rows, columns=CAMPANHA_COLS))
+                tempos["leitura_s"] += time.perf_counter() - inicio
+                stats["n_campanhas"] += len(df)
+                _colocar(fila_lotes, df, parar)
+                inicio = time.perf_counter()
+        finally:
+            cur.close()
+            conn.close()
+        _colocar(fila_lotes, _FIM, parar)
+
+    def escrever_saidas():
+        invalidar_fingerprints()
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            with _escritor_sugestoes(sugestoes_path, formato, compressao) as escrever:
+                _criar_staging(cur, lojas)
+                while (sugestoes := _retirar(fila_sugestoes, parar)) is not _FIM:
+                    inicio = time.perf_counter()
+                    _inserir_multilinhas(
+                        cur, SUGESTOES_STAGE_TABLE, _linhas_para_banco(sugestoes, versao), lote
+                    )
+                    escrever(sugestoes)
+                    tempos["escrita_s"] += time.perf_counter() - inicio
+
+                    stats["n_sugestoes"] += len(sugestoes)
+                    for grupo, n in sugestoes["grupo"].value_counts().items():
+                        stats["grupos"][grupo] = stats["grupos"].get(grupo, 0) + int(n)
+
+                if stats["n_campanhas"] == 0:
+                    raise RuntimeError("Nenhuma campanha encontrada na tabela `campaign`.")
+
+                inicio = time.perf_counter()
+                conn.commit()
+                if historico:
+                    _gravar_historico(cur, pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"))
+                    conn.commit()
+                _trocar_staging(cur)
+                tempos["escrita_s"] += time.perf_counter() - inicio
+        finally:
+            cur.close()
+            conn.close()
+
+    leitor = _estagio(ler, erros, parar)
+    escritor = _estagio(escrever_saidas, erros, parar)
+
+    def repassar(futuro):
+        sugestoes, segundos = futuro.result()
+        tempos["score_s"] += segundos
+        _colocar(fila_sugestoes, sugestoes, parar)
+
+    # Estágio de score na thread atual: mantém no máximo n_threads lotes em
+    # voo e repassa os resultados na ordem de leitura.
+    try:
+        with _predicao_serial(model), ThreadPoolExecutor(n_threads) as pool:
+            em_voo = deque()
+            while (df := _retirar(fila_lotes, parar)) is not _FIM:
+                em_voo.append(pool.submit(_pontuar_lote, df, modelo, agregados))
+                while em_voo and (len(em_voo) > n_threads or em_voo[0].done()):
+                    repassar(em_voo.popleft())
+            while em_voo:
+                repassar(em_voo.popleft())
+        _colocar(fila_sugestoes, _FIM, parar)
+    except BaseException as e:
+        # Se outro estágio já falhou, o erro original está em `erros`
+        if not parar.is_set():
+            erros.insert(0, e)
+        parar.set()
+
+    leitor.join()
+    escritor.join()
+    if erros:
+        raise erros[0]
+
+    print(f"\nGeradas {stats['n_sugestoes']} sugestões.")
+    print(
+        f"Pipeline: {stats['n_sugestoes']} sugestões em `{SUGESTOES_TABLE}` e {sugestoes_path} "
+        f"(leitura {tempos['leitura_s']:.2f}s, score {tempos['score_s']:.2f}s, "
+        f"escrita {tempos['escrita_s']:.2f}s)."
+    )
+    return {
+        **stats,
+        "arquivo": str(sugestoes_path),
+        "threads_score": n_threads,
+        **{k: round(v, 4) for k, v in tempos.items()},
+    }
+
+
+# INSTRUMENTAÇÃO
+#
+# Cada etapa de executar() registra tempo de parede, tempo de CPU, pico de
+# RSS e linhas processadas. Os registros vão para metrics.json ("etapas"),
+# para o resumo do worker e para o stdout como JSON lines:
+#   {"evento": "etapa", "etapa": "treinar_modelo", "tempo_s": 1.2, ...}
+
+PROFILE_TOP = 30
+
+
+def pico_rss_mb():
+    """Pico de RSS do processo (MB) ou None onde `resource` não existe (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB; macOS em bytes
+    return round(pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024, 1)
+
+
+def _zerar_pico_rss() -> bool:
+    """
+    Zera o pico de RSS do processo (VmHWM) para medir uma etapa isolada.
+
+    Só existe no Linux (/proc/self/clear_refs); devolve False nos demais.
+    """
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _pico_rss_desde_zerar_mb():
+    """VmHWM atual (MB), lido de /proc/self/status."""
+    with open("/proc/self/status", encoding="ascii") as f:
+        for linha in f:
+            if linha.startswith("VmHWM:"):
+                return round(int(linha.split()[1]) / 1024, 1)
+    return None
+
+
+# Zerar o VmHWM também zera o ru_maxrss no Linux (ambos vêm do mesmo
+# contador), então o pico acumulado do processo é mantido aqui.
+_pico_rss_acumulado_mb = None
+
+
+def _acumular_pico_rss(pico_mb):
+    """Atualiza e devolve o maior pico de RSS visto pelas etapas (MB)."""
+    global _pico_rss_acumulado_mb
+    if pico_mb is not None:
+        _pico_rss_acumulado_mb = max(_pico_rss_acumulado_mb or 0.0, pico_mb)
+    return _pico_rss_acumulado_mb
+
+
+@contextlib.contextmanager
+def medir_etapa(nome: str, etapas: list):
+    """
+    Mede o bloco e anexa o registro em `etapas`.
+
+    O bloco pode preencher campos extras no dict recebido (ex.: "linhas").
+    cpu_s é o tempo de CPU deste processo (não inclui processos filhos do
+    modo particionado). rss_pico_etapa_mb é o pico durante a etapa (Linux,
+    via reset do VmHWM; None nos demais); rss_pico_mb é o pico acumulado do
+    processo até o fim da etapa, o maior entre ru_maxrss e os picos das
+    etapas já medidas.
+    """
+    registro = {"etapa": nome}
+    zerou = _zerar_pico_rss()
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    try:
+        yield registro
+    finally:
+        registro["tempo_s"] = round(time.perf_counter() - inicio, 4)
+        registro["cpu_s"] = round(time.process_time() - inicio_cpu, 4)
+        pico_etapa = _pico_rss_desde_zerar_mb() if zerou else None
+        _acumular_pico_rss(pico_etapa)
+        registro["rss_pico_mb"] = _acumular_pico_rss(pico_rss_mb())
+        registro["rss_pico_etapa_mb"] = pico_etapa
+        etapas.append(registro)
+        print(json.dumps({"evento": "etapa", **registro}, ensure_ascii=False), flush=True)
+
+
+@contextlib.contextmanager
+def perfilar(ativo: bool, base_dir=None):
+    """
+    Com ativo=True, roda o bloco sob cProfile e grava:
+      - profile.pstats: dump completo (abrir com pstats/snakeviz)
+      - profile.txt: top PROFILE_TOP funções por tempo acumulado
+    """
+    if not ativo:
+        yield
+        return
+
+    import cProfile
+    import io
+    import pstats
+
+    base_dir = Path(base_dir or SAIDA_DIR or ".").resolve()
+    base_dir.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+        pstats_path = base_dir / "profile.pstats"
+        profiler.dump_stats(pstats_path)
+
+        texto = io.StringIO()
+        pstats.Stats(profiler, stream=texto).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        txt_path = base_dir / "profile.txt"
+        txt_path.write_text(texto.getvalue(), encoding="utf-8")
+
+        print(f"Profile salvo em: {pstats_path} e {txt_path}")
 
 
 # MAIN
-def main():
-    """Pipeline orquestrado: carrega dados -> treina -> sugere -> persiste -> salva artefatos."""
+def parse_args(argv=None):
+    """Opções de linha de comando (todas opcionais; o padrão reproduz o fluxo original)."""
+    parser = argparse.ArgumentParser(
+        description="Treina o modelo de campanhas e gera sugestões."
+    )
+    parser.add_argument(
+        "--modo",
+        choices=["treinar", "score", "avaliar", "worker"],
+        default="treinar",
+        help="treinar: treina, salva no registro e gera sugestões; "
+        "score: usa um modelo salvo e só gera sugestões; "
+        "avaliar: k-fold estratificado em paralelo (não registra modelo nem grava sugestões); "
+        "worker: processo persistente que recebe comandos JSON-lines via stdin.",
+    )
+    parser.add_argument(
+        "--versao",
+        default=None,
+        help=f"Versão do modelo. treinar: tag salva (padrão {MODELO_VERSAO_PADRAO}); "
+        "score: versão fixada (padrão: a mais recente).",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Lê `campaign` em lotes deste tamanho (cursor não-bufferizado, tipos compactos).",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Usa o snapshot local (ml/cache) e busca só o delta por updatedAt.",
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Com --cache: ignora o snapshot e relê a tabela inteira; com agregados: recalcula todos os meses.",
+    )
+    parser.add_argument(
+        "--escrita",
+        choices=["padrao", "bulk", "infile"],
+        default="padrao",
+        help="padrao: TRUNCATE + INSERT; bulk: staging em lotes multi-linha + RENAME atômico; "
+        "infile: staging via LOAD DATA LOCAL INFILE + RENAME atômico.",
+    )
+    parser.add_argument(
+        "--historico",
+        action="store_true",
+        help="Com bulk/infile: guarda cada execução em campaign_ai_sugestoes_hist.",
+    )
+    parser.add_argument(
+        "--particionado",
+        action="store_true",
+        help="Treina e pontua um modelo por loja (lojas pequenas agrupadas) em paralelo.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=-1,
+        help="Processos do modo particionado/avaliar ou threads de score do --pipeline "
+        "(-1 = todos os núcleos).",
+    )
+    parser.add_argument(
+        "--min-linhas-loja",
+        type=int,
+        default=PARTICAO_MIN_LINHAS,
+        help="Lojas com menos campanhas que isso são agrupadas na mesma partição.",
+    )
+    parser.add_argument(
+        "--loja",
+        action="append",
+        dest="lojas",
+        default=None,
+        help="Restringe a execução a um storeId (pode repetir).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="rf",
+        help="rf: RandomForest fixo (300 árvores); rf_adaptativo: cresce com warm_start "
+        "até o F1 OOB estabilizar; hgb: HistGradientBoosting.",
+    )
+    parser.add_argument(
+        "--comparar",
+        nargs="+",
+        choices=ENGINES,
+        default=None,
+        help="Com --modo avaliar: engines avaliadas junto com --engine, na mesma passada.",
+    )
+    parser.add_argument(
+        "--folds",
+        type=int,
+        default=CV_FOLDS_PADRAO,
+        help="Com --modo avaliar: número de folds.",
+    )
+    parser.add_argument(
+        "--agrupar-loja",
+        action="store_true",
+        help="Com --modo avaliar: folds agrupados por storeId (StratifiedGroupKFold).",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Com --modo score: repontua e faz upsert só das campanhas cujas features "
+        "(ou versão de modelo) mudaram desde a última execução.",
+    )
+    parser.add_argument(
+        "--baixa-memoria",
+        action="store_true",
+        help="Carga em lotes tipada, sem cópias redundantes e features em tipos estreitos.",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="(score) Sobrepõe leitura, score (--workers threads) e escrita em lotes de --chunksize.",
+    )
+    parser.add_argument(
+        "--agregados",
+        action="store_true",
+        help="(treinar) Inclui agregados de campaign_queue/order por campanha, calculados no "
+        "MySQL por loja em paralelo e guardados por _mes em ml/cache/agregados.",
+    )
+    parser.add_argument(
+        "--saida-dir",
+        default=None,
+        help="Diretório dos artefatos (metrics.json, sugestões, profile). Padrão: IA_SAIDA_DIR ou o atual.",
+    )
+    parser.add_argument(
+        "--formato",
+        choices=SAIDA_FORMATOS,
+        default="json",
+        help="Formato do arquivo de sugestões.",
+    )
+    parser.add_argument(
+        "--compressao",
+        choices=SAIDA_COMPRESSOES,
+        default=None,
+        help="Comprime as sugestões (json/ndjson: .gz/.zst; parquet: codec).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Roda sob cProfile e grava profile.pstats/profile.txt no diretório de saída.",
+    )
+    return parser.parse_args(argv)
+
+
+def executar(
+    modo="treinar",
+    versao=None,
+    chunksize=None,
+    cache=False,
+    full_refresh=False,
+    modelo=None,
+    escrita="padrao",
+    historico=False,
+    particionado=False,
+    workers=-1,
+    min_linhas_loja=PARTICAO_MIN_LINHAS,
+    lojas=None,
+    engine="rf",
+    delta=False,
+    baixa_memoria=False,
+    saida_dir=None,
+    formato="json",
+    compressao=None,
+    pipeline=False,
+    agregados=False,
+    comparar=None,
+    folds=CV_FOLDS_PADRAO,
+    agrupar_loja=False,
+):
+    """
+    Executa o pipeline uma vez e devolve (resumo, modelo).
+
+    treinar: carrega dados -> treina -> registra modelo -> sugere -> persiste -> salva artefatos
+    score:   carrega modelo registrado -> carrega dados -> features -> sugere -> persiste -> salva artefatos
+    avaliar: carrega dados -> k-fold em paralelo -> salva avaliacao_cv.json
+
+    modelo: tupla (model, encoders, feature_cols, metrics, versao) já em
+      memória (worker); se informada e compatível com `versao`, evita reler
+      o registro. A tupla usada/treinada é devolvida para reaproveitamento;
+      um treino com `lojas` (fora do LATEST) devolve a tupla recebida.
+    escrita: "padrao" (TRUNCATE + executemany), "bulk" (staging multi-linha +
+      RENAME) ou "infile" (staging via LOAD DATA LOCAL INFILE + RENAME).
+    historico: com bulk/infile, guarda cópia da execução no histórico.
+    particionado: (treinar) um modelo por loja/balde de lojas, em `workers`
+      processos; não altera o modelo registrado.
+    lojas: restringe leitura e escrita a esses storeId (ignora o cache).
+    engine: algoritmo de treino (ver construir_modelo).
+    delta: (score) repontua e regrava só campanhas cujas features ou versão
+      de modelo mudaram; sugestoes.json traz apenas essas campanhas.
+    baixa_memoria: carga em lotes tipada + df_feat compacto (ver compactar_features).
+    saida_dir/formato/compressao: artefatos de saída (ver salvar_jsons).
+    pipeline: (score) leitura, score e escrita sobrepostos em lotes de
+      `chunksize` (ver pontuar_em_pipeline); escreve sempre via staging.
+    agregados: (treinar) junta AGREGADO_FEATURE_COLS às features (ver
+      carregar_agregados). No score, vale o que o modelo registrado usa.
+    comparar/folds/agrupar_loja: (avaliar) engines extras, k e folds por
+      storeId (ver avaliar_cruzado).
+    """
+    if modo == "score" and particionado:
+        raise ValueError("O modo particionado treina e pontua junto; use --modo treinar.")
+    if delta and modo != "score":
+        raise ValueError("O modo delta usa um modelo registrado; use --modo score.")
+    if modo == "avaliar" and (particionado or pipeline):
+        raise ValueError("O modo avaliar não combina com --particionado/--pipeline.")
+    if pipeline and (modo != "score" or delta or cache):
+        raise ValueError("O pipeline só existe no modo score, sem --delta/--cache.")
+
+    etapas = []
+
+    if baixa_memoria and not chunksize:
+        chunksize = SNAPSHOT_CHUNKSIZE
+
+    if modo == "score":
+        if modelo is None or (versao is not None and modelo[4] != versao):
+            print("Carregando modelo registrado...")
+            with medir_etapa("carregar_modelo", etapas):
+                modelo = carregar_modelo(versao)
+        model, encoders, feature_cols, metrics, versao = modelo
+        print(f"Modelo: {versao}")
+    elif particionado:
+        versao = versao or MODELO_VERSAO_PARTICIONADO
+    elif lojas:
+        # Modelo treinado só com algumas lojas não substitui o global
+        versao = versao or f"{MODELO_VERSAO_PADRAO}_{'+'.join(lojas)}"
+    else:
+        versao = versao or MODELO_VERSAO_PADRAO
+
+    if modo == "score":
+        agregados = bool(set(AGREGADO_FEATURE_COLS) & set(feature_cols))
+
+    df_agregados = None
+    if agregados:
+        print("Agregando desempenho (campaign_queue/order) no banco...")
+        with medir_etapa("carregar_agregados", etapas) as etapa:
+            df_agregados = carregar_agregados(
+                lojas=lojas, workers=workers, full_refresh=full_refresh
+            )
+            etapa["linhas"] = len(df_agregados)
+
+    if pipeline:
+        print("Pontuando em pipeline (leitura, score e escrita sobrepostos)...")
+        with medir_etapa("pontuar_em_pipeline", etapas) as etapa:
+            escrita_stats = pontuar_em_pipeline(
+                modelo,
+                chunksize=chunksize or SNAPSHOT_CHUNKSIZE,
+                workers=workers,
+                lojas=lojas,
+                historico=historico,
+                saida_dir=saida_dir,
+                formato=formato,
+                compressao=compressao,
+                agregados=df_agregados,
+            )
+            etapa["linhas"] = escrita_stats["n_campanhas"]
+
+        metrics = {**metrics, "etapas": list(etapas)}
+        metrics_path = _salvar_metrics(metrics, _diretorio_saida(saida_dir))
+
+        resumo = {
+            "modo": modo,
+            "modelo_versao": versao,
+            "n_campanhas": escrita_stats["n_campanhas"],
+            "n_sugestoes": escrita_stats["n_sugestoes"],
+            "grupos": escrita_stats["grupos"],
+            "accuracy": metrics.get("accuracy"),
+            "f1_weighted": metrics.get("f1_weighted"),
+            "escrita": escrita_stats,
+            "arquivos": {"metrics": str(metrics_path), "sugestoes": escrita_stats["arquivo"]},
+            "etapas": etapas,
+        }
+        return resumo, modelo
+
     print("Carregando campanhas do banco...")
-    df_raw = carregar_campanhas()
+    with medir_etapa("carregar_campanhas", etapas) as etapa:
+        if lojas:
+            df_raw = carregar_campanhas(chunksize=chunksize, lojas=lojas)
+        elif cache:
+            df_raw = carregar_campanhas_incremental(
+                full_refresh=full_refresh,
+                chunksize=chunksize or SNAPSHOT_CHUNKSIZE,
+            )
+        else:
+            df_raw = carregar_campanhas(chunksize=chunksize)
+        etapa["linhas"] = len(df_raw)
+
+    if df_agregados is not None:
+        df_raw = juntar_agregados(df_raw, df_agregados)
+
+    if modo == "avaliar":
+        print("Avaliando por validação cruzada...")
+        with medir_etapa("avaliar_cruzado", etapas) as etapa:
+            avaliacao = avaliar_cruzado(
+                df_raw,
+                engines=[engine, *(comparar or [])],
+                k=folds,
+                agrupar_loja=agrupar_loja,
+                workers=workers,
+            )
+            etapa["linhas"] = avaliacao["n_samples"]
+
+        base_dir = _diretorio_saida(saida_dir)
+        avaliacao_path = base_dir / "avaliacao_cv.json"
+        with _escrita_atomica(avaliacao_path) as f:
+            f.write(_dumps({**avaliacao, "etapas": etapas}, indentar=True))
+        print(f"Avaliação salva em: {avaliacao_path}")
+
+        resumo = {
+            "modo": modo,
+            "n_campanhas": int(len(df_raw)),
+            "avaliacao": {
+                e: {m: info[m] for m in CV_METRICAS} | {"do_cache": info["do_cache"]}
+                for e, info in avaliacao["engines"].items()
+            },
+            "arquivos": {"avaliacao": str(avaliacao_path)},
+            "etapas": etapas,
+        }
+        return resumo, modelo
+
+    if particionado:
+        print("Treinando e gerando sugestões por loja...")
+        with medir_etapa("treinar_particionado", etapas) as etapa:
+            sugestoes, encoders, metrics = treinar_particionado(
+                df_raw,
+                workers=workers,
+                min_linhas=min_linhas_loja,
+                engine=engine,
+                compactar=baixa_memoria,
+            )
+            etapa["linhas"] = len(sugestoes)
+    else:
+        if modo == "score":
+            print("Preparando features...")
+            with medir_etapa("preparar_features", etapas) as etapa:
+                # df_raw só é usado depois para contar linhas
+                df_feat = preparar_features(
+                    df_raw, encoders, feature_cols, compactar=baixa_memoria, copiar=False
+                )
+                etapa["linhas"] = len(df_feat)
+
+            if delta:
+                with medir_etapa("selecionar_alteradas", etapas) as etapa:
+                    alteradas, removidas, estado_fp = selecionar_alteradas(
+                        df_feat, feature_cols, versao, parcial=bool(lojas)
+                    )
+                    df_feat = df_feat[alteradas].reset_index(drop=True)
+                    etapa["linhas"] = len(df_feat)
+                print(f"Delta: {len(df_feat)} campanhas alteradas, {len(removidas)} removidas.")
+        else:
+            print("Treinando modelo...")
+            with medir_etapa("treinar_modelo", etapas) as etapa:
+                model, encoders, df_feat, feature_cols, metrics = treinar_modelo(
+                    df_raw, engine=engine, compactar=baixa_memoria
+                )
+                etapa["linhas"] = len(df_feat)
+
+            print("Registrando modelo...")
+            with medir_etapa("salvar_modelo", etapas):
+                salvar_modelo(
+                    model, encoders, feature_cols, metrics, versao=versao, latest=not lojas
+                )
+            # Modelo só de algumas lojas não vira LATEST: devolve o recebido
+            # (ou None), para o worker não reaproveitá-lo num score global
+            if not lojas:
+                modelo = (model, encoders, feature_cols, metrics, versao)
+
+        print("Gerando sugestões para todas as campanhas...")
+        with medir_etapa("gerar_sugestoes", etapas) as etapa:
+            sugestoes = gerar_sugestoes(df_feat, feature_cols, model, encoders)
+            etapa["linhas"] = len(sugestoes)
 
-    print("Treinando modelo...")
-    model, encoders, df_feat, feature_cols, metrics = treinar_modelo(df_raw)
+    print("Salvando sugestões no MySQL...")
+    with medir_etapa("salvar_sugestoes_no_banco", etapas) as etapa:
+        if delta:
+            escrita_stats = upsert_sugestoes(sugestoes, versao, removidas=removidas)
+            _gravar_fingerprints(estado_fp)
+        elif escrita == "padrao":
+            escrita_stats = None
+            salvar_sugestoes_no_banco(sugestoes, modelo_versao=versao, lojas=lojas)
+        else:
+            escrita_stats = salvar_sugestoes_bulk(
+                sugestoes,
+                modelo_versao=versao,
+                infile=(escrita == "infile"),
+                historico=historico,
+                lojas=lojas,
+            )
+        etapa["linhas"] = len(sugestoes)
+
+    # Cópia: no modo score `metrics` vem do modelo em memória/registro
+    metrics = {**metrics, "etapas": list(etapas)}
+
+    print(f"Salvando artefatos (metrics.json e sugestões em {formato})...")
+    with medir_etapa("salvar_jsons", etapas) as etapa:
+        arquivos = salvar_jsons(
+            metrics, sugestoes, saida_dir=saida_dir, formato=formato, compressao=compressao
+        )
+        etapa["linhas"] = len(sugestoes)
+
+    resumo = {
+        "modo": modo,
+        "modelo_versao": versao,
+        "n_campanhas": int(len(df_raw)),
+        "n_sugestoes": int(len(sugestoes)),
+        "grupos": {k: int(v) for k, v in sugestoes["grupo"].value_counts().items()},
+        "accuracy": metrics.get("accuracy"),
+        "f1_weighted": metrics.get("f1_weighted"),
+        "escrita": escrita_stats,
+        "arquivos": arquivos,
+        "etapas": etapas,
+    }
+    return resumo, modelo
+
+
+# WORKER (processo persistente para o backend Node)
+#
+# Protocolo JSON-lines em stdin/stdout, uma mensagem por linha:
+#   entrada:  {"id": 1, "cmd": "score"|"treinar"|"avaliar"|"ping", "versao": ..., "cache": true, ...}
+#   saída:    {"id": 1, "ok": true, "resultado": {...}, "duracao_s": 0.12}
+#             {"id": 1, "ok": false, "erro": "mensagem"}
+# Logs de progresso (print) vão para stderr para não misturar com as respostas.
+
+WORKER_PARAMS = (
+    "versao",
+    "chunksize",
+    "cache",
+    "full_refresh",
+    "escrita",
+    "historico",
+    "particionado",
+    "workers",
+    "min_linhas_loja",
+    "lojas",
+    "engine",
+    "delta",
+    "baixa_memoria",
+    "saida_dir",
+    "formato",
+    "compressao",
+    "pipeline",
+    "agregados",
+    "comparar",
+    "folds",
+    "agrupar_loja",
+)
 
-    print("Gerando sugestões para todas as campanhas...")
-    sugestoes = gerar_sugestoes(df_feat, feature_cols, model, encoders)
 
-    print("Salvando sugestões no MySQL...")
-    salvar_sugestoes_no_banco(sugestoes, modelo_versao="rf_v1")
+def _processar_comando(msg: dict, estado: dict) -> dict:
+    """Executa um comando do worker e atualiza `estado` (modelo em memória)."""
+    cmd = msg.get("cmd")
+    if cmd == "ping":
+        modelo = estado.get("modelo")
+        return {"modelo_versao": modelo[4] if modelo else None}
+
+    if cmd not in ("score", "treinar", "avaliar"):
+        raise ValueError(f"Comando desconhecido: {cmd!r}")
+
+    params = {k: msg[k] for k in WORKER_PARAMS if k in msg}
+
+    # Outro processo (CLI, outro worker) pode ter registrado um modelo novo:
+    # o modelo em memória só vale enquanto bater com o registro
+    if estado.get("modelo") is not None and estado.get("assinatura") != assinatura_modelo(
+        params.get("versao")
+    ):
+        estado["modelo"] = None
+
+    # Primeira execução sem modelo registrado: score vira treino
+    modo = cmd
+    if modo == "score" and estado.get("modelo") is None and not (MODELOS_DIR / "LATEST").exists():
+        modo = "treinar"
+
+    resumo, estado["modelo"] = executar(modo=modo, modelo=estado.get("modelo"), **params)
+    estado["assinatura"] = assinatura_modelo(estado["modelo"][4]) if estado["modelo"] else None
+    return resumo
+
+
+def rodar_worker(entrada=None, saida=None):
+    """Laço do worker: lê comandos até EOF em `entrada` e responde em `saida`."""
+    entrada = entrada or sys.stdin
+    saida = saida or sys.stdout
+    estado = {"modelo": None, "assinatura": None}
+
+    def responder(resposta):
+        saida.write(json.dumps(resposta, ensure_ascii=False) + "\n")
+        saida.flush()
+
+    responder({"id": None, "ok": True, "resultado": {"pronto": True}})
+
+    for linha in entrada:
+        linha = linha.strip()
+        if not linha:
+            continue
+
+        msg_id = None
+        inicio = time.perf_counter()
+        try:
+            msg = json.loads(linha)
+            msg_id = msg.get("id")
+            with contextlib.redirect_stdout(sys.stderr):
+                resultado = _processar_comando(msg, estado)
+            responder(
+                {
+                    "id": msg_id,
+                    "ok": True,
+                    "resultado": resultado,
+                    "duracao_s": round(time.perf_counter() - inicio, 4),
+                }
+            )
+        except Exception as e:
+            responder({"id": msg_id, "ok": False, "erro": str(e)})
+
+
+def main(argv=None):
+    """Ponto de entrada da linha de comando (execução única ou worker)."""
+    args = parse_args(argv)
+
+    if args.modo == "worker":
+        rodar_worker()
+        return
 
-    print("Salvando JSONs (metrics.json e sugestoes.json)...")
-    salvar_jsons(metrics, sugestoes)
+    with perfilar(args.profile, args.saida_dir):
+        executar(
+            modo=args.modo,
+            versao=args.versao,
+            chunksize=args.chunksize,
+            cache=args.cache,
+            full_refresh=args.full_refresh,
+            escrita=args.escrita,
+            historico=args.historico,
+            particionado=args.particionado,
+            workers=args.workers,
+            min_linhas_loja=args.min_linhas_loja,
+            lojas=args.lojas,
+            engine=args.engine,
+            delta=args.delta,
+            baixa_memoria=args.baixa_memoria,
+            saida_dir=args.saida_dir,
+            formato=args.formato,
+            compressao=args.compressao,
+            pipeline=args.pipeline,
+            agregados=args.agregados,
+            comparar=args.comparar,
+            folds=args.folds,
+            agrupar_loja=args.agrupar_loja,
+        )
 
     print("\n[OK] Processo concluído.")
 
@@ -0,0 +1,194 @@
+import os
+import re
+import sys
+import sqlite3
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import mysql.connector
+import numpy as np
+import pytest
+
+# Permite `import ia_campanhas_sugestoes` como o worker faz (rodando de ml/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import benchmark_pipeline as bench  # noqa: E402
+import ia_campanhas_sugestoes as ia  # noqa: E402
+
+
+# BANCO DE TESTE (SQLite no lugar do MySQL)
+#
+# Mesmo esquema/gerador do benchmark_pipeline, com o dialeto extra usado
+# pela staging (CREATE TABLE ... LIKE, RENAME TABLE), pelos agregados
+# (STR_TO_DATE, DATE_ADD, TIMESTAMPDIFF) e pelo job de clientes_risco.
+
+N_CAMPANHAS = 600
+N_LOJAS = 4
+
+CODIGO_IA = Path(__file__).resolve().parents[4] / "documentos" / "Entrega 1" / "IA" / "codigo.py"
+
+FILA_DDL = """
+    CREATE TABLE campaign_queue (
+      id INTEGER, campaignId INTEGER, storeId TEXT NOT NULL, customerId INTEGER,
+      scheduledAt TEXT, sendAt TEXT, status INTEGER, _mes TEXT
+    )
+"""
+
+PEDIDO_DDL = """
+    CREATE TABLE `order` (
+      id INTEGER, companyId TEXT NOT NULL, createdAt TEXT, customer INTEGER,
+      isTest TEXT, totalAmount_num INTEGER, _mes TEXT
+    )
+"""
+
+
+def _str_to_date(valor, formato):
+    try:
+        data = datetime.strptime(valor, formato.replace("%i", "%M"))
+    except (TypeError, ValueError):
+        return None
+    return data.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _date_add(valor, dias):
+    if valor is None:
+        return None
+    return (datetime.fromisoformat(valor) + timedelta(days=int(dias))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _timestampdiff_min(inicio, fim):
+    if inicio is None or fim is None:
+        return None
+    return int((datetime.fromisoformat(fim) - datetime.fromisoformat(inicio)).total_seconds() // 60)
+
+
+class _CursorTeste(bench._CursorSQLite):
+    def execute(self, sql, params=()):
+        texto = sql.strip()
+
+        like = re.fullmatch(r"CREATE TABLE (\w+) LIKE (\w+)", texto)
+        if like:
+            ddl = self.connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name = ?", (like[2],)
+            ).fetchone()[0]
+            return super().execute(ddl.replace(like[2], like[1], 1))
+
+        rename = re.fullmatch(r"RENAME TABLE\s+(\w+) TO (\w+),\s+(\w+) TO (\w+)", texto)
+        if rename:
+            super().execute(f"ALTER TABLE {rename[1]} RENAME TO {rename[2]}")
+            return super().execute(f"ALTER TABLE {rename[3]} RENAME TO {rename[4]}")
+
+        sql = re.sub(r"\)\s*DEFAULT CHARSET=\S+ COLLATE=\S+", ")", sql)
+        sql = re.sub(r",\s*KEY `\w+` \([^)]*\)", "", sql)
+        sql = sql.replace("INTERVAL %s DAY", "%s").replace("TIMESTAMPDIFF(MINUTE,", "TIMESTAMPDIFF(")
+        try:
+            return super().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            # clientes_risco trata tabela inexistente pelo erro do mysql.connector
+            raise mysql.connector.ProgrammingError(str(e)) from e
+
+
+class _ConexaoTeste(sqlite3.Connection):
+    def cursor(self, *args, buffered=None, **kwargs):
+        return super().cursor(_CursorTeste)
+
+
+def conectar(db_path):
+    # Autocommit: as tabelas do banco real são MyISAM (commit não desfaz nada)
+    conn = sqlite3.connect(db_path, factory=_ConexaoTeste, isolation_level=None)
+    conn.create_function("STR_TO_DATE", 2, _str_to_date)
+    conn.create_function("DATE_FORMAT", 2, lambda valor, formato: valor)
+    conn.create_function("DATE_ADD", 2, _date_add)
+    conn.create_function("TIMESTAMPDIFF", 2, _timestampdiff_min)
+    return conn
+
+
+def _popular_fila_e_pedidos(db_path, seed=7):
+    """Envios para parte das campanhas e pedidos dos mesmos clientes."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute(FILA_DDL)
+    conn.execute(PEDIDO_DDL)
+
+    campanhas = conn.execute("SELECT id, storeId FROM campaign WHERE id <= 200").fetchall()
+    fila, pedidos = [], []
+    for campanha, loja in campanhas:
+        for _ in range(int(rng.integers(1, 4))):
+            agendado = datetime(2025, 1, 1) + timedelta(minutes=int(rng.integers(0, 80 * 24 * 60)))
+            enviado = agendado + timedelta(minutes=int(rng.integers(0, 90)))
+            cliente = int(rng.integers(1, 60))
+            fila.append((
+                len(fila) + 1, campanha, loja, cliente,
+                agendado.strftime(ia.CAMPANHA_DATE_FORMAT), enviado.strftime(ia.CAMPANHA_DATE_FORMAT),
+                int(rng.choice([1, 2, 3, 4, 5])), agendado.strftime("%Y-%m"),
+            ))
+            if rng.random() < 0.6:
+                criado = enviado + timedelta(hours=int(rng.integers(1, 100)))
+                pedidos.append((
+                    len(pedidos) + 1, loja, criado.strftime("%Y-%m-%d %H:%M:%S"), cliente,
+                    "False", int(rng.integers(1_000, 20_000)), criado.strftime("%Y-%m"),
+                ))
+
+    conn.executemany(f"INSERT INTO campaign_queue VALUES ({', '.join(['?'] * 8)})", fila)
+    conn.executemany(f"INSERT INTO `order` VALUES ({', '.join(['?'] * 7)})", pedidos)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """
+    SQLite populado e isolado: ia.get_connection aponta para ele e todos os
+    caches/artefatos (modelos, snapshot, fingerprints, agregados, CV, saída)
+    ficam em tmp_path. Devolve o caminho do banco.
+    """
+    db_path = tmp_path / "cannoli.db"
+    bench.popular_banco(db_path, N_CAMPANHAS, n_lojas=N_LOJAS)
+    _popular_fila_e_pedidos(db_path)
+
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(ia, "get_connection", lambda **opcoes: conectar(db_path))
+    monkeypatch.setattr(ia, "MODELOS_DIR", tmp_path / "modelos")
+    monkeypatch.setattr(ia, "SNAPSHOT_DIR", cache)
+    monkeypatch.setattr(ia, "SNAPSHOT_PATH", cache / "campaign_snapshot.parquet")
+    monkeypatch.setattr(ia, "SNAPSHOT_META_PATH", cache / "campaign_snapshot.json")
+    monkeypatch.setattr(ia, "FINGERPRINT_PATH", cache / "sugestoes_fingerprints.parquet")
+    monkeypatch.setattr(ia, "AGREGADOS_DIR", cache / "agregados")
+    monkeypatch.setattr(ia, "CV_DIR", cache / "cv")
+    monkeypatch.setattr(ia, "SAIDA_DIR", str(tmp_path / "saida"))
+    monkeypatch.chdir(tmp_path)
+    return db_path
+
+
+@pytest.fixture
+def consultar(banco):
+    """consultar(sql, params) -> linhas, direto no banco de teste."""
+    def _consultar(sql, params=()):
+        conn = sqlite3.connect(banco)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    return _consultar
+
+
+@pytest.fixture(scope="session")
+def codigo_ia(tmp_path_factory):
+    """
+    Script da Entrega 1 (documentos/Entrega 1/IA/codigo.py) importado como
+    módulo `codigo_ia`. Ele roda a demonstração inteira no import e grava as
+    saídas no diretório atual, então o import acontece num diretório temporário.
+    """
+    pasta = tmp_path_factory.mktemp("entrega1")
+    anterior = os.getcwd()
+    os.chdir(pasta)
+    try:
+        spec = importlib.util.spec_from_file_location("codigo_ia", CODIGO_IA)
+        modulo = importlib.util.module_from_spec(spec)
+        # Registrado antes de executar: o pool de gráficos serializa funções por nome
+        sys.modules["codigo_ia"] = modulo
+        spec.loader.exec_module(modulo)
+    finally:
+        os.chdir(anterior)
+    return modulo
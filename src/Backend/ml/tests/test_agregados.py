@@ -0,0 +1,85 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+CLIENTE_REPETIDO = 500
+
+
+def _pedidos_por_campanha(db_path) -> pd.DataFrame:
+    """Oráculo em pandas: pedidos distintos na janela de cada campanha."""
+    conn = sqlite3.connect(db_path)
+    fila = pd.read_sql("SELECT * FROM campaign_queue", conn)
+    pedidos = pd.read_sql("SELECT * FROM `order`", conn)
+    conn.close()
+
+    fila = fila[fila["status"].isin(ia.FILA_STATUS_ENVIADA)]
+    fila["envio"] = pd.to_datetime(fila["sendAt"], format=ia.CAMPANHA_DATE_FORMAT)
+    pedidos = pedidos[pedidos["isTest"] != "True"]
+    pedidos["criado"] = pd.to_datetime(pedidos["createdAt"])
+
+    casados = fila.merge(
+        pedidos,
+        left_on=["customerId", "storeId"],
+        right_on=["customer", "companyId"],
+        suffixes=("_fila", ""),
+    )
+    janela = pd.Timedelta(days=ia.AGREGADOS_JANELA_DIAS)
+    casados = casados[
+        (casados["criado"] >= casados["envio"]) & (casados["criado"] < casados["envio"] + janela)
+    ]
+    distintos = casados.drop_duplicates(["campaignId", "id"])
+    return distintos.groupby("campaignId").agg(
+        pedidos_janela=("id", "size"), receita_janela_num=("totalAmount_num", "sum")
+    )
+
+
+def _repetir_cliente(db_path, campanha):
+    """Três envios da campanha ao mesmo cliente (virando o mês) e um pedido que casa com todos."""
+    conn = sqlite3.connect(db_path)
+    loja = conn.execute("SELECT storeId FROM campaign WHERE id = ?", (campanha,)).fetchone()[0]
+    conn.executemany(
+        "INSERT INTO campaign_queue VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (10_001, campanha, loja, CLIENTE_REPETIDO, "30/01/2025 10:00", "30/01/2025 10:00", 2, "2025-01"),
+            (10_002, campanha, loja, CLIENTE_REPETIDO, "01/02/2025 10:00", "01/02/2025 10:05", 3, "2025-02"),
+            (10_003, campanha, loja, CLIENTE_REPETIDO, "02/02/2025 09:00", "02/02/2025 09:00", 4, "2025-02"),
+        ],
+    )
+    conn.execute(
+        "INSERT INTO `order` VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (90_001, loja, "2025-02-03 12:00:00", CLIENTE_REPETIDO, "False", 5_000, "2025-02"),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _comparar(agregados, esperado):
+    obtido = agregados.loc[agregados["pedidos_janela"] > 0, ["pedidos_janela", "receita_janela_num"]]
+    assert sorted(obtido.index) == sorted(esperado.index)
+    np.testing.assert_array_equal(
+        obtido.loc[esperado.index].to_numpy(dtype=np.int64), esperado.to_numpy(dtype=np.int64)
+    )
+
+
+def test_pedido_conta_uma_vez_por_campanha(banco):
+    _repetir_cliente(banco, campanha=1)
+    esperado = _pedidos_por_campanha(banco)
+    assert esperado.loc[1, "pedidos_janela"] >= 1
+
+    agregados = ia.carregar_agregados(workers=2, full_refresh=True)
+
+    _comparar(agregados, esperado)
+
+
+def test_pedido_na_virada_do_mes_igual_com_cache(banco):
+    _repetir_cliente(banco, campanha=1)
+    esperado = _pedidos_por_campanha(banco)
+
+    ia.carregar_agregados(workers=2, full_refresh=True)
+    # Meses fechados vêm das partições gravadas; o total não pode mudar
+    agregados = ia.carregar_agregados(workers=2)
+
+    _comparar(agregados, esperado)
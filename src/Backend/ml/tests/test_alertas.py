@@ -0,0 +1,82 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+
+def _alertas_por_campanha(frame, janela, queda_perc, metodo):
+    """A versão original: rolling por campanha (groupby) e uma decisão por linha."""
+    alertas = []
+    for _, g in frame.sort_values("date").groupby("campanhaId"):
+        media = g["cliques"].rolling(janela).mean()
+        z = (g["cliques"] - media) / (g["cliques"].rolling(janela).std() + 1e-9)
+        for i, row in g.iterrows():
+            if pd.isna(media[i]):
+                continue
+            if metodo == "media" and row["cliques"] < (1 - queda_perc) * media[i]:
+                motivo = f"Cliques {row['cliques']} abaixo de {(1 - queda_perc) * media[i]:.0f} (média {janela}d)"
+            elif metodo == "zscore" and z[i] < -2.0:
+                motivo = f"Z-score cliques = {z[i]:.2f} (< -2σ)"
+            else:
+                continue
+            alertas.append((row["date"], int(row["campanhaId"]), row["nome"], motivo))
+    return sorted(alertas, key=lambda a: (a[0], a[1]))
+
+
+@pytest.fixture(scope="module")
+def simulado(codigo_ia):
+    return codigo_ia.simulate_campaigns(n_campaigns=25, days=60, seed=3, data_inicio=date(2025, 1, 1))
+
+
+def _linhas(alertas):
+    return list(alertas[["date", "campanhaId", "nome", "motivo"]].itertuples(index=False, name=None))
+
+
+@pytest.mark.parametrize("metodo, janela", [("media", 7), ("media", 5), ("zscore", 7)])
+def test_rolling_alerts_igual_ao_por_campanha(codigo_ia, simulado, metodo, janela):
+    alertas = codigo_ia.rolling_alerts(simulado, janela=janela, queda_perc=0.3, metodo=metodo)
+
+    esperado = _alertas_por_campanha(simulado, janela, 0.3, metodo)
+    assert esperado
+    assert _linhas(alertas) == esperado
+
+
+@pytest.mark.parametrize("metodo", ["media", "zscore"])
+def test_monitor_dia_a_dia_igual_ao_lote(codigo_ia, simulado, metodo):
+    lote = codigo_ia.rolling_alerts(simulado, janela=7, queda_perc=0.3, metodo=metodo)
+
+    monitor = codigo_ia.MonitorAlertas(janela=7, queda_perc=0.3, metodo=metodo)
+    datas = sorted(simulado["date"].unique())
+    # Blocos de tamanhos variados: um dia, vários dias, o resto
+    cortes = [datas[0], datas[1], datas[10], datas[11], datas[-1] + pd.Timedelta(days=1)]
+    partes = [
+        monitor.processar(simulado[(simulado["date"] >= a) & (simulado["date"] < b)])
+        for a, b in zip(cortes, cortes[1:])
+    ]
+    streaming = pd.concat(partes, ignore_index=True)
+
+    assert list(streaming.columns) == codigo_ia.ALERTA_COLS
+    chaves = ["date", "campanhaId"]
+    assert streaming[chaves].values.tolist() == lote[chaves].values.tolist()
+    if metodo == "media":
+        assert streaming["motivo"].tolist() == lote["motivo"].tolist()
+
+
+def test_monitor_aceita_campanha_nova_no_meio(codigo_ia, simulado):
+    monitor = codigo_ia.MonitorAlertas(janela=7)
+    meio = simulado["date"].min() + pd.Timedelta(days=20)
+    antes = simulado[simulado["date"] < meio]
+    depois = simulado[simulado["date"] >= meio]
+
+    # Campanhas 11+ só aparecem a partir do `meio`
+    monitor.processar(antes[antes["campanhaId"] <= 10])
+    alertas = monitor.processar(depois)
+
+    esperado = codigo_ia.rolling_alerts(depois, janela=7)
+    chaves = ["date", "campanhaId"]
+    novas = alertas["campanhaId"] > 10
+    assert alertas.loc[novas, chaves].values.tolist() == (
+        esperado.loc[esperado["campanhaId"] > 10, chaves].values.tolist()
+    )
+    assert len(monitor.slots) == 25
+    assert monitor.processar(simulado.iloc[:0]).empty
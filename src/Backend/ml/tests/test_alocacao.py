@@ -0,0 +1,96 @@
+import itertools
+from datetime import date
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def simulado(codigo_ia):
+    return codigo_ia.simulate_campaigns(n_campaigns=15, days=30, seed=11, data_inicio=date(2025, 3, 1))
+
+
+def _guloso_original(df_ref, data, k, orcamento, modo):
+    """A versão original de greedy_recommend (sort_values + laço) para uma data."""
+    snap = df_ref[df_ref["date"] == data].copy()
+    numerador = snap["receita"] if modo == "roi" else snap["conversoes"]
+    snap["score"] = numerador / (snap["custo"] + 1e-6)
+    ranked = snap.sort_values("score", ascending=False).reset_index(drop=True)
+
+    restante, aloc = orcamento, []
+    for _, row in ranked.head(k).iterrows():
+        if restante <= 0:
+            break
+        sugerido = min(restante, max(100.0, row["custo"] * 0.5))
+        aloc.append((int(row["campanhaId"]), round(float(sugerido), 2)))
+        restante -= sugerido
+    ajustar = ranked.tail(min(k, len(ranked)))["campanhaId"].astype(int).tolist()
+    return aloc, ajustar
+
+
+@pytest.mark.parametrize("modo", ["eficiencia", "roi"])
+@pytest.mark.parametrize("orcamento", [150.0, 600.0, 5_000.0])
+def test_greedy_recommend_igual_ao_original(codigo_ia, simulado, modo, orcamento):
+    for data in simulado["date"].unique()[::7]:
+        recs = codigo_ia.greedy_recommend(simulado, data, k=4, orcamento=orcamento, modo=modo)
+        aloc, ajustar = _guloso_original(simulado, data, 4, orcamento, modo)
+
+        assert [(r["campanhaId"], r["orcamentoSugerido"]) for r in recs["priorizar"]] == aloc
+        assert [r["campanhaId"] for r in recs["ajustar_ou_pausar"]] == ajustar
+
+
+def test_lote_de_datas_igual_a_uma_data_por_vez(codigo_ia, simulado):
+    priorizar, _ = codigo_ia.alocar_orcamentos(simulado, orcamentos=(600.0,), k=3)
+
+    for data, grupo in priorizar.groupby("data_referencia"):
+        recs = codigo_ia.greedy_recommend(simulado, data, k=3, orcamento=600.0)
+        assert grupo["campanhaId"].tolist() == [r["campanhaId"] for r in recs["priorizar"]]
+    assert priorizar["data_referencia"].nunique() == simulado["date"].nunique()
+
+
+def _melhor_subconjunto(desejado, valor, orcamento, k, passo):
+    """Força bruta da mochila: até k campanhas com soma dos pesos discretizados <= capacidade."""
+    cap = int(orcamento // passo)
+    peso = np.ceil(desejado / passo)
+    melhor = 0.0
+    for n in range(1, k + 1):
+        for combo in itertools.combinations(range(len(desejado)), n):
+            combo = list(combo)
+            if peso[combo].sum() <= cap:
+                melhor = max(melhor, valor[combo].sum())
+    return melhor
+
+
+@pytest.mark.parametrize("orcamento", [250.0, 700.0])
+def test_mochila_otima_e_dentro_do_orcamento(codigo_ia, simulado, orcamento):
+    k, n_candidatos = 3, 7
+    datas = simulado["date"].unique()[:6]
+    priorizar, _ = codigo_ia.alocar_orcamentos(
+        simulado, datas=datas, orcamentos=(orcamento,), k=k, metodos=("mochila",),
+        n_candidatos=n_candidatos,
+    )
+
+    for data in datas:
+        escolhidas = priorizar[priorizar["data_referencia"] == data]
+        assert len(escolhidas) <= k
+        assert escolhidas["orcamentoSugerido"].sum() <= orcamento
+
+        snap = simulado[simulado["date"] == data]
+        score = snap["conversoes"] / (snap["custo"] + codigo_ia.EPS)
+        top = score.sort_values(ascending=False).index[:n_candidatos]
+        custo = snap.loc[top, "custo"].to_numpy()
+        desejado = np.maximum(codigo_ia.ALOC_MINIMO, custo * codigo_ia.ALOC_FRACAO)
+        valor = score[top].to_numpy() * desejado
+        esperado = _melhor_subconjunto(desejado, valor, orcamento, k, codigo_ia.MOCHILA_PASSO)
+        assert esperado > 0
+        assert escolhidas["valor"].sum() == pytest.approx(esperado)
+
+
+def test_campanha_sem_linha_na_data_fica_de_fora(codigo_ia, simulado):
+    data = simulado["date"].max()
+    parcial = simulado[~((simulado["date"] == data) & (simulado["campanhaId"] > 2))]
+
+    priorizar, ajustar = codigo_ia.alocar_orcamentos(parcial, datas=[data], k=5)
+
+    assert set(priorizar["campanhaId"]) <= {1, 2}
+    assert set(ajustar["campanhaId"]) <= {1, 2}
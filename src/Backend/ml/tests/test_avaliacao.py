@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+import numpy as np
+
+import ia_campanhas_sugestoes as ia
+
+
+def _avaliacao_salva(banco):
+    with open(banco.parent / "saida" / "avaliacao_cv.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_avaliar_compara_engines_e_reaproveita_cache(banco):
+    resumo, _ = ia.executar(modo="avaliar", comparar=["hgb"], folds=3, workers=2)
+
+    avaliacao = _avaliacao_salva(banco)
+    assert avaliacao["k"] == 3 and avaliacao["estrategia"] == "estratificado"
+    assert avaliacao["n_samples"] == resumo["n_campanhas"]
+    assert set(avaliacao["engines"]) == {"rf", "hgb"}
+    for engine, info in avaliacao["engines"].items():
+        assert info["do_cache"] == 0
+        assert info["hiperparametros"] == ia.hiperparametros(engine)
+        assert sum(f["n_test"] for f in info["folds"]) == avaliacao["n_samples"]
+        for metrica in ia.CV_METRICAS:
+            valores = [f[metrica] for f in info["folds"]]
+            assert all(0 <= v <= 1 for v in valores)
+            assert info[metrica]["media"] == np.mean(valores)
+            assert np.isclose(info[metrica]["variancia"], np.var(valores, ddof=1))
+
+    # Mesmos dados e hiperparâmetros: nenhum fold é treinado de novo
+    de_novo, _ = ia.executar(modo="avaliar", comparar=["hgb"], folds=3, workers=2)
+    assert {e: info["do_cache"] for e, info in de_novo["avaliacao"].items()} == {"rf": 3, "hgb": 3}
+    for engine in ("rf", "hgb"):
+        for metrica in ia.CV_METRICAS:
+            assert de_novo["avaliacao"][engine][metrica] == resumo["avaliacao"][engine][metrica]
+
+
+def test_folds_estratificados_cobrem_todas_as_linhas(banco):
+    df = ia.carregar_campanhas()
+    avaliacao = ia.avaliar_cruzado(df, k=3, workers=1)
+
+    _, _, y, _ = ia.preparar_treino(df, compactar=True)
+    pasta = ia.CV_DIR / avaliacao["chave_dados"]
+    with np.load(pasta / "folds_3_estratificado_42.npz") as arq:
+        testes = [arq[f"fold_{i}"] for i in range(3)]
+
+    np.testing.assert_array_equal(np.sort(np.concatenate(testes)), np.arange(len(y)))
+    proporcao = np.unique(y, return_counts=True)[1] / len(y)
+    for teste in testes:
+        classes, contagem = np.unique(y[teste], return_counts=True)
+        assert len(classes) == len(proporcao)
+        np.testing.assert_allclose(contagem / len(teste), proporcao, atol=0.05)
+
+
+def test_agrupar_loja_nao_divide_loja_entre_folds(banco):
+    df = ia.carregar_campanhas()
+    avaliacao = ia.avaliar_cruzado(df, k=3, agrupar_loja=True, workers=1)
+    assert avaliacao["estrategia"] == "grupo_loja"
+
+    df_feat, _, _, _ = ia.preparar_treino(df, compactar=True)
+    lojas = df_feat["__storeId_raw"].astype(str).to_numpy()
+    pasta = ia.CV_DIR / avaliacao["chave_dados"]
+    with np.load(pasta / "folds_3_grupo_loja_42.npz") as arq:
+        lojas_por_fold = [set(lojas[arq[f"fold_{i}"]]) for i in range(3)]
+
+    assert all(lojas_por_fold)
+    assert set().union(*lojas_por_fold) == set(lojas)
+    assert sum(len(s) for s in lojas_por_fold) == len(set(lojas))
+
+
+def test_dados_alterados_invalidam_o_cache(banco):
+    primeira = ia.avaliar_cruzado(ia.carregar_campanhas(), k=3, workers=1)
+
+    conn = sqlite3.connect(banco)
+    conn.execute("UPDATE campaign SET badge = 'novo', type = type + 7 WHERE id <= 20")
+    conn.commit()
+    conn.close()
+
+    segunda = ia.avaliar_cruzado(ia.carregar_campanhas(), k=3, workers=1)
+    assert segunda["chave_dados"] != primeira["chave_dados"]
+    assert segunda["engines"]["rf"]["do_cache"] == 0
+    assert (ia.CV_DIR / primeira["chave_dados"]).exists()
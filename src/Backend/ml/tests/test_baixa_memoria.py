@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+
+def _tabela(consultar):
+    return consultar(
+        "SELECT campaignId, status_previsto, grupo, ROUND(confianca, 9) "
+        "FROM campaign_ai_sugestoes ORDER BY campaignId"
+    )
+
+
+def test_compactar_features_estreita_tipos_e_preserva_valores(banco):
+    df_raw = ia.carregar_campanhas()
+    model, encoders, df_feat, feature_cols, _ = ia.treinar_modelo(df_raw)
+
+    compacto = ia.compactar_features(df_feat, feature_cols)
+
+    assert list(compacto.columns) == [*feature_cols, "__id", "__name", "__storeId_raw"]
+    for col in feature_cols:
+        assert compacto[col].dtype.itemsize <= 4, col
+    assert isinstance(compacto["__storeId_raw"].dtype, pd.CategoricalDtype)
+    assert compacto.memory_usage(deep=True).sum() < df_feat.memory_usage(deep=True).sum() / 2
+
+    np.testing.assert_array_equal(
+        ia.matriz_features(compacto, feature_cols), ia.matriz_features(df_feat, feature_cols)
+    )
+    pd.testing.assert_frame_equal(
+        ia.gerar_sugestoes(compacto, feature_cols, model, encoders),
+        ia.gerar_sugestoes(df_feat, feature_cols, model, encoders),
+    )
+
+
+def test_baixa_memoria_gera_as_mesmas_sugestoes(banco, consultar):
+    ia.executar(modo="treinar", escrita="bulk")
+    treino = _tabela(consultar)
+    ia.executar(modo="score", escrita="bulk")
+    score = _tabela(consultar)
+
+    ia.executar(modo="treinar", escrita="bulk", baixa_memoria=True, chunksize=128)
+    assert _tabela(consultar) == treino
+
+    resumo, _ = ia.executar(modo="score", escrita="bulk", baixa_memoria=True, chunksize=128)
+    assert _tabela(consultar) == score
+    assert resumo["n_sugestoes"] == resumo["n_campanhas"]
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import benchmark_pipeline as bench
+import ia_campanhas_sugestoes as ia
+
+ETAPAS = [
+    "carregar_campanhas",
+    "adicionar_features",
+    "treinar_modelo",
+    "gerar_sugestoes",
+    "salvar_sugestoes_no_banco",
+    "salvar_jsons",
+]
+
+
+def test_gerador_deterministico_e_no_esquema():
+    lote = bench.gerar_lote_campanhas(1, 500, 3, np.random.default_rng(9))
+
+    pd.testing.assert_frame_equal(lote, bench.gerar_lote_campanhas(1, 500, 3, np.random.default_rng(9)))
+    assert list(lote.columns) == bench.CAMPAIGN_COLS
+    assert set(lote["storeId"]) == {"EST001", "EST002", "EST003"}
+    assert set(lote["status_desc"]) <= set(bench.STATUS_DESC)
+    assert (lote["createdAt"] == "").any()
+
+
+def test_popular_banco_em_lotes(tmp_path, monkeypatch):
+    monkeypatch.setattr(bench, "GERADOR_LOTE", 100)
+    db_path = tmp_path / "bench.db"
+
+    bench.popular_banco(db_path, 250, n_lojas=2)
+
+    conn = sqlite3.connect(db_path)
+    ids = [i for (i,) in conn.execute("SELECT id FROM campaign ORDER BY id")]
+    conn.close()
+    assert ids == list(range(1, 251))
+
+
+def test_rodar_tamanho_mede_todas_as_etapas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    get_connection = ia.get_connection
+
+    execucao = bench.rodar_tamanho(400, chunksize=150, memoria=True)
+
+    assert [m["etapa"] for m in execucao["etapas"]] == ETAPAS
+    for m in execucao["etapas"]:
+        assert m["tempo_s"] > 0
+        assert m["pico_mem_mb"] > 0
+        assert m["linhas"] == 400
+    assert 0 <= execucao["accuracy"] <= 1
+    assert execucao["tempo_total_s"] == round(sum(m["tempo_s"] for m in execucao["etapas"]), 4)
+    # O banco temporário e o diretório de trabalho são desfeitos no fim
+    assert ia.get_connection is get_connection
+    assert os.getcwd() == str(tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_main_grava_os_resultados(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    saida = tmp_path / "bench.json"
+
+    bench.main(["--linhas", "300", "--sem-memoria", "--saida", str(saida)])
+
+    resultados = json.loads(saida.read_text(encoding="utf-8"))
+    assert resultados["ambiente"]["sklearn"]
+    (execucao,) = resultados["execucoes"]
+    assert execucao["linhas"] == 300
+    assert all(m["pico_mem_mb"] is None for m in execucao["etapas"])
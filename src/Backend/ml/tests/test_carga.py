@@ -0,0 +1,62 @@
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+
+def _lote(ids, types, badges):
+    n = len(ids)
+    rows = {
+        "id": ids,
+        "storeId": ["101"] * n,
+        "name": ["campanha"] * n,
+        "status_desc": ["Ativa"] * n,
+        "badge": badges,
+        "type": types,
+        "_mes": ["2024-01"] * n,
+        "createdAt": ["01/01/2024 10:00"] * n,
+        "updatedAt": ["02/01/2024 10:00"] * n,
+        "isDefault": [0] * n,
+    }
+    return ia._tipar_lote(pd.DataFrame(rows, columns=ia.CAMPANHA_COLS))
+
+
+def test_concatenar_lotes_com_nulos_mistos():
+    lotes = [
+        _lote([1, 2], [1, None], ["novo", None]),
+        _lote([3, 4], [2, 3], ["promo", "novo"]),
+        _lote([5, 6], [None, None], [None, None]),
+    ]
+
+    df = ia._concatenar_lotes(lotes)
+
+    assert len(df) == 6
+    for col in ia.CAMPANHA_CAT_COLS:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype)
+    assert list(df["type"].cat.categories) == [1, 2, 3]
+    assert df["type"].isna().sum() == 3
+    assert sorted(df["badge"].cat.categories) == ["novo", "promo"]
+
+
+def test_concatenar_lote_todo_nulo_com_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(ia, "SNAPSHOT_DIR", tmp_path)
+    monkeypatch.setattr(ia, "SNAPSHOT_PATH", tmp_path / "snap.parquet")
+    monkeypatch.setattr(ia, "SNAPSHOT_META_PATH", tmp_path / "snap.json")
+
+    ia._gravar_snapshot(_lote([1, 2], [1, 2], ["novo", "promo"]))
+    df_snap, _ = ia._ler_snapshot()
+    delta = _lote([2], [None], [None])
+
+    df = ia._concatenar_lotes([df_snap, delta])
+
+    assert df["type"].isna().tolist() == [False, False, True]
+    assert list(df["type"].cat.categories) == [1, 2]
+
+
+def test_descartar_inalteradas_mantem_so_linhas_alteradas():
+    snap = ia._concatenar_lotes([_lote([1, 2, 3], [1, 2, None], ["novo", None, "promo"])])
+    delta = _lote([2, 3, 4], [None, None, 1], [None, "promo", "novo"])
+
+    df = ia._descartar_inalteradas(snap, delta)
+
+    # 3 voltou igual (fronteira da watermark); 2 mudou o type; 4 é nova
+    assert df["id"].tolist() == [2, 4]
@@ -0,0 +1,55 @@
+import sqlite3
+
+import clientes_risco as cr
+
+REFERENCIA = "2025-06-01 00:00:00"
+
+
+def _tabela(consultar):
+    return consultar(
+        "SELECT companyId, customerId, pedidos, valor_total_num, primeira_compra, "
+        "ultima_compra, intervalo_medio_dias, categoria FROM cliente_risco "
+        "ORDER BY companyId, customerId"
+    )
+
+
+def test_incremental_depois_de_carga_por_loja_inclui_as_demais(banco, consultar):
+    stats = cr.atualizar_cliente_risco(lojas=["EST001"], referencia=REFERENCIA)
+    assert stats["modo"] == "completa"
+    assert consultar("SELECT DISTINCT companyId FROM cliente_risco") == [("EST001",)]
+
+    stats = cr.atualizar_cliente_risco(referencia=REFERENCIA)
+    assert stats["modo"] == "incremental"
+    assert "EST001" not in stats["lojas_completas"]
+    assert stats["lojas_completas"]
+    incremental = _tabela(consultar)
+
+    cr.atualizar_cliente_risco(full_refresh=True, referencia=REFERENCIA)
+    assert incremental == _tabela(consultar)
+
+
+def test_incremental_reagrega_clientes_com_pedido_novo(banco, consultar):
+    cr.atualizar_cliente_risco(referencia=REFERENCIA)
+
+    conn = sqlite3.connect(banco)
+    loja, cliente = conn.execute("SELECT companyId, customer FROM `order` LIMIT 1").fetchone()
+    conn.execute(
+        "INSERT INTO `order` VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (99_999, loja, "2025-05-20 10:00:00", cliente, "False", 7_000, "2025-05"),
+    )
+    conn.commit()
+    conn.close()
+
+    stats = cr.atualizar_cliente_risco(referencia=REFERENCIA)
+    assert stats["modo"] == "incremental"
+    assert stats["lojas_completas"] == []
+    # O cliente novo + os que estão na fronteira (createdAt == watermark) de cada loja
+    assert 1 <= stats["clientes"] <= 1 + len(stats["watermarks"])
+    assert consultar(
+        "SELECT ultima_compra FROM cliente_risco WHERE companyId = ? AND customerId = ?",
+        (loja, cliente),
+    ) == [("2025-05-20 10:00:00",)]
+    incremental = _tabela(consultar)
+
+    cr.atualizar_cliente_risco(full_refresh=True, referencia=REFERENCIA)
+    assert incremental == _tabela(consultar)
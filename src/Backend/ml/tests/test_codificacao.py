@@ -0,0 +1,20 @@
+import numpy as np
+
+import ia_campanhas_sugestoes as ia
+
+
+def test_vocabulario_de_type_igual_entre_read_sql_e_lotes(banco):
+    # NULL em `type`: read_sql devolve float (1.0), a carga em lotes Int64 (1)
+    conn = ia.get_connection()
+    conn.execute("UPDATE campaign SET type = NULL WHERE id % 7 = 0")
+    conn.commit()
+    conn.close()
+
+    _, encoders, _, feature_cols, _ = ia.treinar_modelo(ia.carregar_campanhas())
+    assert "1" in encoders["type"] and "(sem tipo)" in encoders["type"]
+
+    direto = ia.preparar_features(ia.carregar_campanhas(), encoders, feature_cols)
+    em_lotes = ia.preparar_features(ia.carregar_campanhas(chunksize=100), encoders, feature_cols)
+
+    assert not (em_lotes["type"] == ia.CODIGO_DESCONHECIDO).any()
+    np.testing.assert_array_equal(em_lotes["type"], direto["type"])
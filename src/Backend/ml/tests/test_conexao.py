@@ -0,0 +1,93 @@
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+class _ConexaoFalsa:
+    def __init__(self):
+        self.pings = []
+
+    def ping(self, **kwargs):
+        self.pings.append(kwargs)
+
+
+class _PoolFalso:
+    criados = []
+
+    def __init__(self, **config):
+        self.config = config
+        _PoolFalso.criados.append(self)
+
+    def get_connection(self):
+        return _ConexaoFalsa()
+
+
+@pytest.fixture
+def pool_falso(monkeypatch):
+    _PoolFalso.criados = []
+    monkeypatch.setattr(ia, "_pool", None)
+    monkeypatch.setattr(ia.pooling, "MySQLConnectionPool", _PoolFalso)
+    return _PoolFalso
+
+
+def test_pool_criado_uma_vez_e_conexao_com_ping(pool_falso):
+    primeira = ia.get_connection()
+    segunda = ia.get_connection()
+
+    assert len(pool_falso.criados) == 1
+    config = pool_falso.criados[0].config
+    assert (config["pool_name"], config["pool_size"]) == (ia.DB_POOL_NAME, ia.DB_POOL_SIZE)
+    assert config["database"] == ia.DB_CONFIG["database"]
+    assert primeira is not segunda
+    assert primeira.pings == [{"reconnect": True, "attempts": 3, "delay": 1}]
+
+
+def test_opcoes_extras_abrem_conexao_dedicada(pool_falso, monkeypatch):
+    abertas = []
+    monkeypatch.setattr(ia.mysql.connector, "connect", lambda **kw: abertas.append(kw) or "dedicada")
+
+    assert ia.get_connection(allow_local_infile=True) == "dedicada"
+    assert abertas[0]["allow_local_infile"] is True
+    assert pool_falso.criados == []
+
+
+def _rastrear_conexoes(monkeypatch):
+    """(conexões ainda não devolvidas com close, total de empréstimos)."""
+    abertas, emprestadas = set(), []
+    emprestar = ia.get_connection
+
+    def rastreada(**opcoes):
+        conn = emprestar(**opcoes)
+        abertas.add(id(conn))
+        emprestadas.append(id(conn))
+        fechar = conn.close
+
+        def close():
+            abertas.discard(id(conn))
+            fechar()
+
+        conn.close = close
+        return conn
+
+    monkeypatch.setattr(ia, "get_connection", rastreada)
+    return abertas, emprestadas
+
+
+def test_etapas_devolvem_a_conexao_mesmo_com_falha(banco, monkeypatch):
+    abertas, emprestadas = _rastrear_conexoes(monkeypatch)
+    ia.executar(modo="treinar", escrita="bulk", agregados=True, workers=2)
+    # leitura + fila de meses + uma por loja nos agregados + escrita
+    assert len(emprestadas) >= 3 + 4
+    assert not abertas
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha no INSERT")
+
+    monkeypatch.setattr(ia, "_inserir_multilinhas", falhar)
+    with pytest.raises(RuntimeError, match="falha no INSERT"):
+        ia.executar(modo="score", escrita="bulk")
+    assert not abertas
+
+    with pytest.raises(RuntimeError, match="falha no INSERT"):
+        ia.executar(modo="score", pipeline=True, chunksize=64, workers=2)
+    assert not abertas
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+def _dados(seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((120, 4), dtype=np.float32)
+    y = (X[:, 0] > 0.5).astype(np.int64)
+    y[7] = 2  # classe com um único exemplo
+    return X, y
+
+
+@pytest.mark.parametrize("engine", ia.ENGINES)
+def test_construir_modelo_com_classe_de_um_exemplo(engine):
+    X, y = _dados()
+
+    model, info = ia.construir_modelo(engine, X, y, n_jobs=1)
+
+    assert info["engine"] == engine
+    assert set(model.classes_) == {0, 1, 2}
+    if engine == "hgb":
+        assert info["early_stopping"] is False
+
+
+def test_hgb_mantem_early_stopping_com_classes_suficientes():
+    X, y = _dados()
+    y[7] = 1
+
+    _, info = ia.construir_modelo("hgb", X, y)
+
+    assert info["early_stopping"] is True
@@ -0,0 +1,104 @@
+import pandas as pd
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+def _sugestoes(ids, loja="EST001", status="Ativa"):
+    return pd.DataFrame(
+        {
+            "campaignId": ids,
+            "storeId": loja,
+            "status_previsto": status,
+            "confianca": 0.5,
+            "grupo": ia.GRUPO_PRIORIZAR,
+        }
+    )
+
+
+def test_upsert_troca_so_as_campanhas_do_delta(banco, consultar):
+    ia.salvar_sugestoes_bulk(_sugestoes([1, 2, 3, 4]), modelo_versao="v1")
+    antes = dict(consultar("SELECT campaignId, gerado_em FROM campaign_ai_sugestoes"))
+
+    ia.upsert_sugestoes(_sugestoes([2, 5], status="Concluida"), "v2", removidas=[4])
+
+    linhas = consultar(
+        "SELECT campaignId, status_previsto, modelo_versao, gerado_em "
+        "FROM campaign_ai_sugestoes ORDER BY campaignId"
+    )
+    assert [(c, s, v) for c, s, v, _ in linhas] == [
+        (1, "Ativa", "v1"),
+        (2, "Concluida", "v2"),
+        (3, "Ativa", "v1"),
+        (5, "Concluida", "v2"),
+    ]
+    # Linhas fora do delta são copiadas como estão
+    assert {c: g for c, _, _, g in linhas if c in (1, 3)} == {1: antes[1], 3: antes[3]}
+    assert consultar("SELECT name FROM sqlite_master WHERE name LIKE '%_stage'") == []
+
+
+def test_upsert_com_falha_nao_altera_a_oficial(banco, consultar, monkeypatch):
+    ia.salvar_sugestoes_bulk(_sugestoes([1, 2, 3]), modelo_versao="v1")
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha no INSERT")
+
+    monkeypatch.setattr(ia, "_inserir_multilinhas", falhar)
+    with pytest.raises(RuntimeError):
+        ia.upsert_sugestoes(_sugestoes([2]), "v2", removidas=[3])
+
+    assert consultar(
+        "SELECT campaignId, modelo_versao FROM campaign_ai_sugestoes ORDER BY campaignId"
+    ) == [(1, "v1"), (2, "v1"), (3, "v1")]
+
+
+def _tabela(consultar):
+    return consultar(
+        "SELECT campaignId, storeId, modelo_versao FROM campaign_ai_sugestoes ORDER BY campaignId"
+    )
+
+
+def test_bulk_substitui_a_tabela_inteira(banco, consultar):
+    ia.salvar_sugestoes_bulk(_sugestoes([1, 2, 3, 4, 5]), modelo_versao="v1")
+
+    stats = ia.salvar_sugestoes_bulk(_sugestoes([6, 7, 8]), modelo_versao="v2", lote=2)
+
+    assert stats["linhas"] == 3
+    assert _tabela(consultar) == [(6, "EST001", "v2"), (7, "EST001", "v2"), (8, "EST001", "v2")]
+    assert consultar(
+        "SELECT name FROM sqlite_master WHERE name LIKE 'campaign_ai_sugestoes_%'"
+    ) == []
+
+
+def test_bulk_com_lojas_preserva_as_demais(banco, consultar):
+    ia.salvar_sugestoes_bulk(
+        pd.concat([_sugestoes([1, 2]), _sugestoes([3, 4], loja="EST002")]), modelo_versao="v1"
+    )
+
+    ia.salvar_sugestoes_bulk(_sugestoes([5]), modelo_versao="v2", lojas=["EST001"])
+
+    assert _tabela(consultar) == [(3, "EST002", "v1"), (4, "EST002", "v1"), (5, "EST001", "v2")]
+
+
+def test_bulk_com_historico_acumula_execucoes(banco, consultar):
+    ia.salvar_sugestoes_bulk(_sugestoes([1, 2, 3]), modelo_versao="v1", historico=True)
+    ia.salvar_sugestoes_bulk(_sugestoes([4, 5]), modelo_versao="v2", historico=True)
+
+    assert consultar(
+        f"SELECT modelo_versao, COUNT(*) FROM {ia.SUGESTOES_HIST_TABLE} "
+        "GROUP BY modelo_versao ORDER BY modelo_versao"
+    ) == [("v1", 3), ("v2", 2)]
+    assert [c for c, _, _ in _tabela(consultar)] == [4, 5]
+
+
+def test_bulk_com_falha_nao_altera_a_oficial(banco, consultar, monkeypatch):
+    ia.salvar_sugestoes_bulk(_sugestoes([1, 2, 3]), modelo_versao="v1")
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha no INSERT")
+
+    monkeypatch.setattr(ia, "_inserir_multilinhas", falhar)
+    with pytest.raises(RuntimeError):
+        ia.salvar_sugestoes_bulk(_sugestoes([4]), modelo_versao="v2")
+
+    assert _tabela(consultar) == [(1, "EST001", "v1"), (2, "EST001", "v1"), (3, "EST001", "v1")]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+
+def _df_feat(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "storeId": rng.integers(0, 12, n),
+            "badge": rng.integers(0, 5, n),
+            "dias": rng.integers(0, 900, n).astype(np.int64),
+            "taxa": rng.random(n),
+            "__id": np.arange(1, n + 1),
+            "__name": [f"campanha {i}" for i in range(n)],
+            "__storeId_raw": [f"EST{i % 12:03d}" for i in range(n)],
+        }
+    )
+
+
+FEATURES = ["storeId", "badge", "dias", "taxa"]
+
+
+def test_fingerprint_estavel_com_compactacao():
+    df_feat = _df_feat()
+    compacto = ia.compactar_features(df_feat, FEATURES)
+    assert compacto["storeId"].dtype != df_feat["storeId"].dtype
+
+    np.testing.assert_array_equal(
+        ia.fingerprint_features(df_feat, FEATURES),
+        ia.fingerprint_features(compacto, FEATURES),
+    )
+
+
+def test_fingerprint_muda_com_a_feature():
+    df_feat = _df_feat()
+    alterado = df_feat.copy()
+    alterado.loc[3, "dias"] += 1
+
+    iguais = ia.fingerprint_features(df_feat, FEATURES) == ia.fingerprint_features(alterado, FEATURES)
+    assert not iguais[3]
+    assert iguais.sum() == len(df_feat) - 1
+
+
+def test_delta_depois_de_escrita_fora_do_delta_repontua_tudo(banco, consultar):
+    ia.executar(modo="treinar", escrita="bulk")
+    ia.executar(modo="score", delta=True)
+    resumo, _ = ia.executar(modo="score", delta=True)
+    assert resumo["n_sugestoes"] == 0
+
+    # Escrita completa por fora do delta: a tabela passa a ter rf_loja_v1
+    ia.executar(modo="treinar", particionado=True, workers=1, escrita="bulk")
+    assert consultar("SELECT DISTINCT modelo_versao FROM campaign_ai_sugestoes") == [
+        (ia.MODELO_VERSAO_PARTICIONADO,)
+    ]
+
+    resumo, _ = ia.executar(modo="score", delta=True)
+
+    assert resumo["n_sugestoes"] == resumo["n_campanhas"]
+    assert consultar("SELECT DISTINCT modelo_versao FROM campaign_ai_sugestoes") == [
+        (ia.MODELO_VERSAO_PADRAO,)
+    ]
@@ -0,0 +1,40 @@
+import os
+
+
+def _pngs(pasta):
+    return sorted(nome for nome in os.listdir(pasta) if nome.endswith(".png"))
+
+
+def test_graficos_reaproveita_e_remove_campanhas_que_sairam(codigo_ia, tmp_path):
+    df, alertas = codigo_ia.df, codigo_ia.alerts_df
+    pasta = tmp_path / "graficos"
+    ids = sorted(df["campanhaId"].unique())
+
+    stats = codigo_ia.renderizar_graficos(df, alertas, pasta=str(pasta), workers=2)
+    assert (stats["desenhados"], stats["removidos"]) == (len(ids), 0)
+    assert _pngs(pasta) == sorted(f"campanha_{cid}.png" for cid in ids)
+
+    ficam = ids[:-2]
+    stats = codigo_ia.renderizar_graficos(
+        df[df["campanhaId"].isin(ficam)], alertas[alertas["campanhaId"].isin(ficam)],
+        pasta=str(pasta), workers=2,
+    )
+
+    assert stats == {
+        "pasta": str(pasta), "campanhas": len(ficam), "desenhados": 0,
+        "reaproveitados": len(ficam), "removidos": 2,
+    }
+    assert _pngs(pasta) == sorted(f"campanha_{cid}.png" for cid in ficam)
+
+
+def test_graficos_redesenha_so_a_campanha_alterada(codigo_ia, tmp_path):
+    df, alertas = codigo_ia.df.copy(), codigo_ia.alerts_df
+    pasta = str(tmp_path / "graficos")
+    codigo_ia.renderizar_graficos(df, alertas, pasta=pasta, workers=1)
+
+    cid = df["campanhaId"].iloc[0]
+    df.loc[df.index[df["campanhaId"] == cid][10], "cliques"] += 1
+    stats = codigo_ia.renderizar_graficos(df, alertas, pasta=pasta, workers=1)
+
+    assert stats["desenhados"] == 1
+    assert stats["reaproveitados"] == df["campanhaId"].nunique() - 1
@@ -0,0 +1,85 @@
+import json
+import pstats
+
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+CAMPOS = {"etapa", "tempo_s", "cpu_s", "rss_pico_mb", "rss_pico_etapa_mb"}
+
+
+def _eventos(saida):
+    eventos = []
+    for linha in saida.splitlines():
+        try:
+            evento = json.loads(linha)
+        except ValueError:
+            continue
+        if isinstance(evento, dict) and evento.get("evento") == "etapa":
+            eventos.append(evento)
+    return eventos
+
+
+def test_medir_etapa_registra_e_emite_evento(capsys):
+    etapas = []
+    with ia.medir_etapa("somar", etapas) as etapa:
+        sum(range(200_000))
+        etapa["linhas"] = 10
+
+    (registro,) = etapas
+    assert set(registro) == CAMPOS | {"linhas"}
+    assert registro["etapa"] == "somar" and registro["linhas"] == 10
+    assert registro["tempo_s"] >= 0 and registro["cpu_s"] >= 0
+    assert _eventos(capsys.readouterr().out) == [{"evento": "etapa", **registro}]
+
+
+def test_medir_etapa_registra_mesmo_com_falha():
+    etapas = []
+    with pytest.raises(ValueError):
+        with ia.medir_etapa("falha", etapas):
+            raise ValueError("x")
+
+    assert [e["etapa"] for e in etapas] == ["falha"]
+
+
+def test_pico_acumulado_nao_diminui():
+    etapas = []
+    with ia.medir_etapa("grande", etapas):
+        bloco = bytearray(64 * 1024 * 1024)
+        del bloco
+    with ia.medir_etapa("pequena", etapas):
+        pass
+
+    grande, pequena = etapas
+    assert pequena["rss_pico_mb"] >= grande["rss_pico_mb"]
+    if grande["rss_pico_etapa_mb"] is not None:
+        assert grande["rss_pico_etapa_mb"] >= 64
+        assert pequena["rss_pico_etapa_mb"] < grande["rss_pico_etapa_mb"]
+
+
+def test_executar_registra_etapas_no_resumo_e_no_metrics(banco, tmp_path, capsys):
+    resumo, _ = ia.executar(modo="treinar", escrita="bulk", saida_dir=tmp_path / "saida")
+
+    nomes = [
+        "carregar_campanhas",
+        "treinar_modelo",
+        "salvar_modelo",
+        "gerar_sugestoes",
+        "salvar_sugestoes_no_banco",
+        "salvar_jsons",
+    ]
+    assert [e["etapa"] for e in resumo["etapas"]] == nomes
+    assert [e["etapa"] for e in _eventos(capsys.readouterr().out)] == nomes
+    # salvar_jsons é medida depois de gravar o metrics.json
+    metrics = json.loads((tmp_path / "saida" / "metrics.json").read_text(encoding="utf-8"))
+    assert [e["etapa"] for e in metrics["etapas"]] == nomes[:-1]
+
+
+def test_profile_grava_pstats_e_resumo(banco, tmp_path):
+    saida = tmp_path / "saida"
+    ia.main(["--modo", "treinar", "--escrita", "bulk", "--profile", "--saida-dir", str(saida)])
+
+    stats = pstats.Stats(str(saida / "profile.pstats"))
+    funcoes = {nome for _, _, nome in stats.stats}
+    assert {"treinar_modelo", "gerar_sugestoes"} <= funcoes
+    assert "treinar_modelo" in (saida / "profile.txt").read_text(encoding="utf-8")
@@ -0,0 +1,26 @@
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+@pytest.mark.parametrize("engine", ["rf", "hgb"])
+def test_particionado_com_loja_de_classe_unica(banco, consultar, engine):
+    # EST001: todas "Ativa" menos uma "Concluida" (classe com um exemplo)
+    conn = ia.get_connection()
+    conn.execute("UPDATE campaign SET status_desc = 'Ativa' WHERE storeId = 'EST001'")
+    conn.execute(
+        "UPDATE campaign SET status_desc = 'Concluida' WHERE id = "
+        "(SELECT MIN(id) FROM campaign WHERE storeId = 'EST001')"
+    )
+    conn.commit()
+    conn.close()
+
+    resumo, _ = ia.executar(
+        modo="treinar", particionado=True, engine=engine, workers=1,
+        min_linhas_loja=50, escrita="bulk",
+    )
+
+    assert resumo["n_sugestoes"] == resumo["n_campanhas"]
+    assert consultar(
+        "SELECT COUNT(*) FROM campaign_ai_sugestoes WHERE storeId = 'EST001'"
+    ) == consultar("SELECT COUNT(*) FROM campaign WHERE storeId = 'EST001'")
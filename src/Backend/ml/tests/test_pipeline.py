@@ -0,0 +1,29 @@
+import ia_campanhas_sugestoes as ia
+
+
+def _tabela(consultar):
+    return consultar(
+        "SELECT campaignId, storeId, status_previsto, grupo, ROUND(confianca, 9) "
+        "FROM campaign_ai_sugestoes ORDER BY campaignId"
+    )
+
+
+def test_pipeline_grava_o_mesmo_que_o_score_em_memoria(banco, consultar):
+    ia.executar(modo="treinar", escrita="bulk")
+    ia.executar(modo="score", escrita="bulk")
+    esperado = _tabela(consultar)
+
+    resumo, _ = ia.executar(modo="score", pipeline=True, chunksize=64, workers=2)
+
+    assert resumo["n_sugestoes"] == len(esperado)
+    assert _tabela(consultar) == esperado
+
+
+def test_pipeline_imprime_o_total_uma_vez(banco, capsys):
+    ia.executar(modo="treinar", escrita="bulk")
+    capsys.readouterr()
+
+    resumo, _ = ia.executar(modo="score", pipeline=True, chunksize=64, workers=2)
+
+    linhas = [l for l in capsys.readouterr().out.splitlines() if l.startswith("Geradas")]
+    assert linhas == [f"Geradas {resumo['n_sugestoes']} sugestões."]
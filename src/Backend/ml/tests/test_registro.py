@@ -0,0 +1,62 @@
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+def _tabela(consultar):
+    return consultar(
+        "SELECT campaignId, status_previsto, grupo, ROUND(confianca, 9), modelo_versao "
+        "FROM campaign_ai_sugestoes ORDER BY campaignId"
+    )
+
+
+def test_score_sem_modelo_registrado_falha(banco):
+    with pytest.raises(RuntimeError, match="Nenhum modelo salvo"):
+        ia.executar(modo="score")
+
+
+def test_score_usa_o_modelo_registrado(banco, consultar):
+    resumo_treino, _ = ia.executar(modo="treinar", escrita="bulk")
+    treino = _tabela(consultar)
+    assert (ia.MODELOS_DIR / "LATEST").read_text(encoding="utf-8") == ia.MODELO_VERSAO_PADRAO
+
+    resumo, modelo = ia.executar(modo="score", escrita="bulk")
+
+    assert resumo["modelo_versao"] == ia.MODELO_VERSAO_PADRAO
+    assert resumo["accuracy"] == resumo_treino["accuracy"]
+    assert modelo[4] == ia.MODELO_VERSAO_PADRAO
+    assert _tabela(consultar) == treino
+
+
+def test_score_com_modelo_em_memoria_nao_rele_o_registro(banco, monkeypatch):
+    _, modelo = ia.executar(modo="treinar", escrita="bulk")
+
+    def _nao_carregar(*args, **kwargs):
+        raise AssertionError("carregar_modelo chamado com o modelo em memória")
+
+    monkeypatch.setattr(ia, "carregar_modelo", _nao_carregar)
+    resumo, devolvido = ia.executar(modo="score", escrita="bulk", modelo=modelo)
+
+    assert devolvido is modelo
+    assert resumo["n_sugestoes"] == resumo["n_campanhas"]
+
+
+def test_treino_por_loja_nao_move_latest(banco):
+    ia.executar(modo="treinar", escrita="bulk")
+    assinatura = ia.assinatura_modelo()
+
+    _, modelo = ia.executar(modo="treinar", escrita="bulk", lojas=["EST001"])
+
+    assert modelo is None
+    assert ia.assinatura_modelo() == assinatura
+    versao = f"{ia.MODELO_VERSAO_PADRAO}_EST001"
+    model, encoders, feature_cols, metrics, carregada = ia.carregar_modelo(versao)
+    assert carregada == versao
+    assert metrics["n_samples_total"] < ia.carregar_modelo()[3]["n_samples_total"]
+
+
+def test_versao_inexistente(banco):
+    ia.executar(modo="treinar", escrita="bulk")
+    assert ia.assinatura_modelo("nao_existe") is None
+    with pytest.raises(RuntimeError, match="não encontrada"):
+        ia.carregar_modelo("nao_existe")
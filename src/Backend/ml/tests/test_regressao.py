@@ -0,0 +1,106 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+INICIO = date(2025, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def historico(codigo_ia):
+    return codigo_ia.simulate_campaigns(15, 70, seed=3, data_inicio=INICIO)
+
+
+def _com_lags(codigo_ia, frame):
+    """Lags como no modelo em memória original (groupby + shift)."""
+    g = frame.sort_values(["campanhaId", "date"]).reset_index(drop=True)
+    for c in codigo_ia.LAG_COLS:
+        g[f"{c}_lag1"] = g.groupby("campanhaId")[c].shift(1)
+    return g.dropna(subset=codigo_ia.LAG_FEATURES + ["conversoes"]).reset_index(drop=True)
+
+
+def test_lags_em_lotes_iguais_ao_groupby(codigo_ia, historico):
+    esperado = _com_lags(codigo_ia, historico)
+
+    ultimo, partes = None, []
+    for lote in codigo_ia.lotes_por_periodo(historico, dias=7):
+        g, ultimo = codigo_ia.adicionar_lags(lote, ultimo)
+        partes.append(g.dropna(subset=codigo_ia.LAG_FEATURES))
+    obtido = pd.concat(partes).sort_values(["campanhaId", "date"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(obtido[esperado.columns], esperado, check_dtype=False)
+    assert sorted(ultimo.index) == sorted(historico["campanhaId"].unique())
+
+
+def test_coeficientes_iguais_a_regressao_em_memoria(codigo_ia, historico):
+    g = _com_lags(codigo_ia, historico)
+    treino = g[~codigo_ia._em_teste(g)]
+    ref = LinearRegression().fit(treino[codigo_ia.LAG_FEATURES], treino["conversoes"])
+
+    reg = codigo_ia.RegressorLagIncremental().treinar(codigo_ia.lotes_por_periodo(historico))
+
+    assert reg.n_treino == len(treino)
+    np.testing.assert_allclose(reg.coef_, ref.coef_, rtol=1e-6, atol=1e-9)
+    assert reg.intercept_ == pytest.approx(ref.intercept_, rel=1e-6, abs=1e-9)
+
+    teste = g[codigo_ia._em_teste(g)]
+    y = teste["conversoes"].to_numpy(dtype=float)
+    pred = ref.predict(teste[codigo_ia.LAG_FEATURES])
+    metricas, y_test, y_pred = reg.avaliar(codigo_ia.lotes_por_periodo(historico), amostra=10)
+    assert metricas["MAE"] == pytest.approx(np.abs(y - pred).mean(), rel=1e-6)
+    assert metricas["RMSE"] == pytest.approx(np.sqrt(((y - pred) ** 2).mean()), rel=1e-6)
+    assert metricas["R2"] == pytest.approx(1 - ((y - pred) ** 2).sum() / ((y - y.mean()) ** 2).sum(), rel=1e-6)
+    assert len(y_test) == len(y_pred) == 10
+
+
+def test_resultado_independe_do_tamanho_do_lote(codigo_ia, historico, tmp_path):
+    base = codigo_ia.RegressorLagIncremental().treinar(codigo_ia.lotes_por_periodo(historico))
+    metricas_base = base.avaliar(codigo_ia.lotes_por_periodo(historico))[0]
+
+    caminho = str(tmp_path / "historico.csv")
+    historico.to_csv(caminho, index=False)
+    fontes = [
+        lambda: codigo_ia.lotes_por_periodo(historico, dias=1),
+        lambda: codigo_ia.lotes_por_periodo(historico, dias=len(historico)),
+        lambda: codigo_ia.lotes_de_arquivo(caminho, linhas=97),
+    ]
+    for fonte in fontes:
+        reg = codigo_ia.RegressorLagIncremental().treinar(fonte())
+        assert reg.n_treino == base.n_treino
+        np.testing.assert_allclose(reg.coef_, base.coef_, rtol=1e-6, atol=1e-9)
+        metricas = reg.avaliar(fonte())[0]
+        for nome, valor in metricas_base.items():
+            assert metricas[nome] == pytest.approx(valor, rel=1e-6)
+
+
+def test_divisao_treino_teste_estavel_entre_tipos(codigo_ia, historico):
+    g = historico[["campanhaId", "date"]]
+    esperado = codigo_ia._em_teste(g)
+
+    for unidade in ["s", "ms", "us", "ns"]:
+        convertido = g.assign(
+            campanhaId=g["campanhaId"].astype(np.int32),
+            date=g["date"].astype(f"datetime64[{unidade}]"),
+        )
+        np.testing.assert_array_equal(codigo_ia._em_teste(convertido), esperado)
+    # CSV devolve a data como texto quando não é parseada
+    np.testing.assert_array_equal(
+        codigo_ia._em_teste(g.assign(date=g["date"].dt.strftime("%Y-%m-%d"))), esperado
+    )
+    assert 0.15 < esperado.mean() < 0.35
+
+
+def test_atualizar_com_dia_novo_acumula_o_treino(codigo_ia, historico):
+    ultimo_dia = historico["date"].max()
+    reg = codigo_ia.RegressorLagIncremental().treinar(
+        codigo_ia.lotes_por_periodo(historico[historico["date"] < ultimo_dia])
+    )
+    antes = reg.n_treino
+    reg.atualizar(historico[historico["date"] == ultimo_dia])
+
+    completo = codigo_ia.RegressorLagIncremental().treinar(codigo_ia.lotes_por_periodo(historico))
+    assert reg.n_treino > antes
+    assert reg.n_treino == completo.n_treino
+    np.testing.assert_allclose(reg.coef_, completo.coef_, rtol=1e-6, atol=1e-9)
@@ -0,0 +1,109 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ia_campanhas_sugestoes as ia
+
+
+def _sugestoes(n=120, inicio=1):
+    rng = np.random.default_rng(inicio)
+    return pd.DataFrame(
+        {
+            "campaignId": np.arange(inicio, inicio + n, dtype=np.int64),
+            "storeId": [f"EST{i % 4:03d}" for i in range(n)],
+            "name": [f"Campanha ação {i}" for i in range(n)],
+            "status_previsto": "Ativa",
+            "confianca": rng.random(n),
+            "grupo": ia.GRUPO_MONITORAR,
+        },
+        columns=ia.SUGESTAO_COLS,
+    )
+
+
+def _ler(path, formato, compressao):
+    if formato == "parquet":
+        return pd.read_parquet(path)
+    abrir = gzip.open if compressao == "gzip" else open
+    with abrir(path, "rt", encoding="utf-8") as f:
+        texto = f.read()
+    if formato == "json":
+        registros = json.loads(texto)
+    else:
+        registros = [json.loads(linha) for linha in texto.splitlines()]
+    return pd.DataFrame(registros, columns=ia.SUGESTAO_COLS)
+
+
+@pytest.mark.parametrize(
+    "formato, compressao",
+    [
+        ("json", None),
+        ("json", "gzip"),
+        ("ndjson", None),
+        ("ndjson", "gzip"),
+        ("parquet", None),
+        ("parquet", "gzip"),
+    ],
+)
+def test_salvar_jsons_ida_e_volta(tmp_path, formato, compressao):
+    sugestoes = _sugestoes()
+
+    arquivos = ia.salvar_jsons(
+        {"accuracy": 0.5}, sugestoes, saida_dir=tmp_path, formato=formato, compressao=compressao
+    )
+
+    assert arquivos["sugestoes"] == str(ia.caminho_sugestoes(tmp_path, formato, compressao))
+    pd.testing.assert_frame_equal(_ler(arquivos["sugestoes"], formato, compressao), sugestoes)
+    assert json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8")) == {"accuracy": 0.5}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("formato", ["json", "ndjson", "parquet"])
+def test_escritor_em_varios_blocos(tmp_path, formato):
+    blocos = [_sugestoes(50, 1), _sugestoes(30, 51), _sugestoes(5, 81)]
+    path = ia.caminho_sugestoes(tmp_path, formato)
+
+    with ia._escritor_sugestoes(path, formato) as escrever:
+        for bloco in blocos:
+            escrever(bloco)
+
+    esperado = pd.concat(blocos, ignore_index=True)
+    pd.testing.assert_frame_equal(_ler(path, formato, None), esperado)
+
+
+def test_json_vazio_e_array_valido(tmp_path):
+    arquivos = ia.salvar_jsons({}, _sugestoes(0), saida_dir=tmp_path)
+    assert json.loads((tmp_path / "sugestoes.json").read_text(encoding="utf-8")) == []
+    assert arquivos["sugestoes"].endswith("sugestoes.json")
+
+
+@pytest.mark.parametrize("formato", ["json", "parquet"])
+def test_falha_no_meio_preserva_o_arquivo_anterior(tmp_path, formato):
+    ia.salvar_jsons({}, _sugestoes(10), saida_dir=tmp_path, formato=formato)
+    path = ia.caminho_sugestoes(tmp_path, formato)
+    anterior = path.read_bytes()
+
+    with pytest.raises(RuntimeError):
+        with ia._escritor_sugestoes(path, formato) as escrever:
+            escrever(_sugestoes(20, 100))
+            raise RuntimeError("falha no meio da escrita")
+
+    assert path.read_bytes() == anterior
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_formato_invalido_falha_antes_de_gravar(tmp_path):
+    with pytest.raises(ValueError):
+        ia.salvar_jsons({}, _sugestoes(), saida_dir=tmp_path, formato="csv")
+    with pytest.raises(ValueError):
+        ia.salvar_jsons({}, _sugestoes(), saida_dir=tmp_path, compressao="bz2")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_zstd_sem_o_pacote_falha_antes_de_gravar(tmp_path, monkeypatch):
+    monkeypatch.setattr(ia, "zstandard", None)
+    with pytest.raises(RuntimeError, match="zstandard"):
+        ia.salvar_jsons({}, _sugestoes(), saida_dir=tmp_path, compressao="zstd")
+    assert list(tmp_path.iterdir()) == []
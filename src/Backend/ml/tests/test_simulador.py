@@ -0,0 +1,64 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+INICIO = date(2025, 1, 1)
+
+
+def test_mesma_seed_e_lote_reproduzem_os_dados(codigo_ia):
+    a = pd.concat(codigo_ia.gerar_campanhas(30, 40, seed=7, campanhas_por_lote=8, data_inicio=INICIO))
+    b = pd.concat(codigo_ia.gerar_campanhas(30, 40, seed=7, campanhas_por_lote=8, data_inicio=INICIO))
+
+    pd.testing.assert_frame_equal(a, b)
+    assert len(a) == 30 * 40
+    por_campanha = a.groupby("campanhaId")["date"].agg(["size", "nunique", "min"])
+    assert por_campanha.index.tolist() == list(range(1, 31))
+    assert (por_campanha["size"] == 40).all() and (por_campanha["nunique"] == 40).all()
+    assert (por_campanha["min"] == pd.Timestamp(INICIO)).all()
+    assert (a["impressoes"] >= 1000).all() and (a["cliques"] <= a["impressoes"]).all()
+
+
+def test_quedas_injetadas_no_intervalo(codigo_ia, monkeypatch):
+    dias = 45
+    com_queda = codigo_ia.simulate_campaigns(12, dias, seed=5, data_inicio=INICIO)
+    monkeypatch.setattr(codigo_ia, "DIAS_QUEDA", 0)
+    sem_queda = codigo_ia.simulate_campaigns(12, dias, seed=5, data_inicio=INICIO)
+
+    # O sorteio das quedas vem depois das séries: só os dias com queda diferem
+    alterado = com_queda["cliques"].to_numpy() != sem_queda["cliques"].to_numpy()
+    dia = (com_queda["date"] - pd.Timestamp(INICIO)).dt.days.to_numpy()
+    assert (np.bincount(com_queda["campanhaId"][alterado], minlength=13)[1:] == 2).all()
+    assert ((dia[alterado] >= dias // 3) & (dia[alterado] < dias - 2)).all()
+    np.testing.assert_array_equal(
+        com_queda["cliques"][alterado], np.maximum(1, sem_queda["cliques"][alterado] // 3)
+    )
+    pd.testing.assert_series_equal(com_queda["impressoes"], sem_queda["impressoes"])
+
+
+def test_poucos_dias_sem_espaco_para_queda(codigo_ia):
+    df = codigo_ia.simulate_campaigns(3, 3, seed=1, data_inicio=INICIO)
+    assert len(df) == 9
+
+
+@pytest.mark.parametrize("extensao", [".csv", ".parquet"])
+def test_salvar_simulacao_em_lotes(codigo_ia, tmp_path, extensao):
+    caminho = str(tmp_path / f"sim{extensao}")
+
+    total = codigo_ia.salvar_simulacao(
+        caminho, 25, 20, seed=2, campanhas_por_lote=10, data_inicio=INICIO
+    )
+
+    esperado = pd.concat(
+        codigo_ia.gerar_campanhas(25, 20, seed=2, campanhas_por_lote=10, data_inicio=INICIO),
+        ignore_index=True,
+    )
+    lido = pd.read_csv(caminho, parse_dates=["date"]) if extensao == ".csv" else pd.read_parquet(caminho)
+    assert total == len(esperado) == len(lido)
+    pd.testing.assert_frame_equal(lido, esperado, check_dtype=False)
+
+
+def test_salvar_simulacao_extensao_invalida(codigo_ia, tmp_path):
+    with pytest.raises(ValueError):
+        codigo_ia.salvar_simulacao(str(tmp_path / "sim.json"), 2, 5)
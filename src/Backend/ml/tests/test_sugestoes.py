@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+import ia_campanhas_sugestoes as ia
+
+VOCABULARIO = pd.Index(["Agendada", "Ativa", "Cancelada", "Concluída", "Rascunho"], dtype=object)
+
+
+class _ModeloFixo:
+    """predict_proba devolve probabilidades pré-sorteadas (classes_ = códigos do vocabulário)."""
+
+    def __init__(self, probs, classes):
+        self.probs = probs
+        self.classes_ = np.asarray(classes)
+
+    def predict_proba(self, X):
+        assert len(X) == len(self.probs)
+        return self.probs
+
+    def predict(self, X):
+        return self.classes_[self.probs.argmax(axis=1)]
+
+
+def _df_feat(n):
+    return pd.DataFrame(
+        {
+            "x": np.arange(n, dtype=float),
+            "__id": np.arange(100, 100 + n),
+            "__name": [f"campanha {i}" for i in range(n)],
+            "__storeId_raw": [f"EST{i % 3:03d}" for i in range(n)],
+        }
+    )
+
+
+def _sugestoes_linha_a_linha(df_feat, model, classes):
+    """A versão original (iterrows): uma decisão por linha com `in` no nome da classe."""
+    probs = model.predict_proba(df_feat[["x"]])
+    y_pred = model.predict(df_feat[["x"]])
+    linhas = []
+    for i, row in df_feat.iterrows():
+        status = classes[y_pred[i]]
+        conf = float(probs[i, list(model.classes_).index(y_pred[i])])
+        nome = status.lower()
+        if (("conclu" in nome) or ("ativ" in nome)) and conf >= 0.6:
+            grupo = "priorizar"
+        elif (("rascunho" in nome) or ("agend" in nome)) and conf <= 0.4:
+            grupo = "ajustar_ou_pausar"
+        else:
+            grupo = "monitorar"
+        linhas.append((int(row["__id"]), row["__storeId_raw"], row["__name"], status, conf, grupo))
+    return linhas
+
+
+def _comparar(sugestoes, esperado):
+    obtido = list(sugestoes[ia.SUGESTAO_COLS].itertuples(index=False, name=None))
+    assert [l[:4] + l[5:] for l in obtido] == [l[:4] + l[5:] for l in esperado]
+    np.testing.assert_allclose([l[4] for l in obtido], [l[4] for l in esperado])
+
+
+def test_vetorizado_igual_ao_linha_a_linha():
+    rng = np.random.default_rng(3)
+    n = 500
+    # alpha < 1: confianças altas e baixas, para cobrir os três grupos
+    probs = rng.dirichlet(np.full(len(VOCABULARIO), 0.4), size=n)
+    model = _ModeloFixo(probs, np.arange(len(VOCABULARIO)))
+    df_feat = _df_feat(n)
+
+    sugestoes = ia.gerar_sugestoes(df_feat, ["x"], model, {"status_desc": VOCABULARIO})
+
+    _comparar(sugestoes, _sugestoes_linha_a_linha(df_feat, model, VOCABULARIO))
+    assert set(sugestoes["grupo"]) == {ia.GRUPO_PRIORIZAR, ia.GRUPO_AJUSTAR, ia.GRUPO_MONITORAR}
+
+
+def test_classes_do_modelo_sao_subconjunto_do_vocabulario():
+    # Classe ausente no treino: colunas de predict_proba != posições do vocabulário
+    rng = np.random.default_rng(5)
+    classes = np.array([0, 1, 3, 4])
+    probs = rng.dirichlet(np.ones(len(classes)), size=200)
+    model = _ModeloFixo(probs, classes)
+    df_feat = _df_feat(200)
+
+    sugestoes = ia.gerar_sugestoes(df_feat, ["x"], model, {"status_desc": VOCABULARIO})
+
+    _comparar(sugestoes, _sugestoes_linha_a_linha(df_feat, model, VOCABULARIO))
+    assert "Cancelada" not in set(sugestoes["status_previsto"])
+
+
+def test_sem_campanhas_devolve_frame_vazio():
+    model = _ModeloFixo(np.empty((0, 5)), np.arange(5))
+    sugestoes = ia.gerar_sugestoes(_df_feat(0), ["x"], model, {"status_desc": VOCABULARIO})
+    assert sugestoes.empty
+    assert list(sugestoes.columns) == ia.SUGESTAO_COLS
@@ -0,0 +1,48 @@
+import io
+import json
+
+import ia_campanhas_sugestoes as ia
+
+
+def _rodar(comandos):
+    entrada = io.StringIO("".join(json.dumps(c) + "\n" for c in comandos))
+    saida = io.StringIO()
+    ia.rodar_worker(entrada, saida)
+    return [json.loads(linha) for linha in saida.getvalue().splitlines()]
+
+
+def test_worker_responde_cada_comando_pelo_id(banco, monkeypatch):
+    carregados = []
+    carregar = ia.carregar_modelo
+    monkeypatch.setattr(ia, "carregar_modelo", lambda *a, **k: carregados.append(a) or carregar(*a, **k))
+
+    respostas = _rodar([
+        {"id": 1, "cmd": "ping"},
+        {"id": 2, "cmd": "score", "escrita": "bulk"},
+        {"id": 3, "cmd": "score", "escrita": "bulk"},
+        {"id": 4, "cmd": "ping"},
+        {"id": 5, "cmd": "desconhecido"},
+    ])
+
+    assert respostas[0] == {"id": None, "ok": True, "resultado": {"pronto": True}}
+    por_id = {r["id"]: r for r in respostas[1:]}
+    assert por_id[1]["resultado"] == {"modelo_versao": None}
+    # Sem modelo registrado, o primeiro score treina; o segundo usa o modelo em memória
+    assert por_id[2]["ok"] and por_id[2]["resultado"]["modo"] == "treinar"
+    assert por_id[3]["ok"] and por_id[3]["resultado"]["modo"] == "score"
+    assert carregados == []
+    assert por_id[4]["resultado"] == {"modelo_versao": ia.MODELO_VERSAO_PADRAO}
+    assert por_id[5] == {"id": 5, "ok": False, "erro": "Comando desconhecido: 'desconhecido'"}
+
+
+def test_worker_recarrega_modelo_retreinado_por_fora(banco):
+    estado = {"modelo": None, "assinatura": None}
+    ia._processar_comando({"id": 1, "cmd": "treinar", "escrita": "bulk"}, estado)
+    em_memoria = estado["modelo"]
+
+    # Outro processo (CLI) registra uma versão nova: LATEST muda
+    ia.executar(modo="treinar", escrita="bulk", engine="hgb", versao="hgb_v1")
+
+    resumo = ia._processar_comando({"id": 2, "cmd": "score", "escrita": "bulk"}, estado)
+    assert resumo["modelo_versao"] == "hgb_v1"
+    assert estado["modelo"] is not em_memoria